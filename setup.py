@@ -70,7 +70,6 @@ setup(
         'social-auth-core[openidconnect]>=1.4.0',
         'social-auth-app-django>=1.2.0',
         'django>=1.10',
-        "cached-property>=1.3.0",
         'six',
     ],
     tests_require=[
@@ -82,10 +81,12 @@ setup(
         'django-debug-toolbar>=1.8',
         'pyjwt>=1.5.3',
         'pytest>=3.0.0',
+        'pytest-benchmark>=3.1.0',
         'pytest-django>=3.1.0',
         "selenium>=3.4.3",
         # "elizabeth==0.3.30",
         'retryz>=0.1.9',
+        'rsa>=3.4',
     ],
     extras_require={
         # eg:
@@ -5,3 +5,19 @@ from django.apps import AppConfig
 class DjangoAuth0UserConfig(AppConfig):
     name = 'django_auth0_user'
 
+    def ready(self):
+        from django.contrib.auth.models import update_last_login
+        from django.contrib.auth.signals import user_logged_in
+        from django_auth0_user.settings import auth0_user_settings
+        from django_auth0_user.signals import throttled_update_last_login
+
+        if auth0_user_settings.LAST_LOGIN_GRANULARITY is not None:
+            # django.contrib.auth connects update_last_login with this dispatch_uid, swap it for the throttled one.
+            user_logged_in.disconnect(update_last_login, dispatch_uid='update_last_login')
+            user_logged_in.connect(throttled_update_last_login, dispatch_uid='update_last_login')
+
+        if auth0_user_settings.WARMUP_ON_READY:
+            from django_auth0_user.warmup import is_serving_process
+            from django_auth0_user.warmup import warm_up
+            if is_serving_process():
+                warm_up()
@@ -1,10 +1,7 @@
 from social_core.backends.open_id_connect import OpenIdConnectAuth
 import logging
 from six.moves.urllib_parse import urlencode, unquote
-from django_auth0_user.settings import AUTH0_OIDC_ENDPOINT
-
-from jose import jwk, jwt
-from jose.utils import base64url_decode
+from django_auth0_user.settings import auth0_user_settings
 
 # from django.conf import settings
 # from social_core.exceptions import AuthCanceled, AuthTokenError, AuthFailed
@@ -93,8 +90,6 @@ class Auth0OpenId(OpenIdConnectAuth):
     """Auth0 OpenID authentication backend"""
     name = 'auth0'
 
-    OIDC_ENDPOINT = AUTH0_OIDC_ENDPOINT
-    ID_TOKEN_ISS = AUTH0_OIDC_ENDPOINT + "/"
     # Under some circumstances we wont have the 'user_id' in the response during get_user_details.
     # One option is to re-implement this function here in our backend
     # for completeness and ease of documenting how this all works...
@@ -102,6 +97,14 @@ class Auth0OpenId(OpenIdConnectAuth):
     # were going with the other for now to keep things simple.
     USERNAME_KEY = 'sub'
 
+    @property
+    def OIDC_ENDPOINT(self):
+        return auth0_user_settings.AUTH0_OIDC_ENDPOINT
+
+    @property
+    def ID_TOKEN_ISS(self):
+        return auth0_user_settings.AUTH0_OIDC_ENDPOINT + "/"
+
     def extra_data(self, user, uid, response, details=None, *args, **kwargs):
         """Return access_token, token_type, and extra defined names to store in
             extra_data field"""
@@ -113,6 +116,14 @@ class Auth0OpenId(OpenIdConnectAuth):
         data['id_token_payload'] = self.id_token
         return data
 
+    def user_data(self, access_token, *args, **kwargs):
+        """Return the user data, from the validated id_token claims when possible, otherwise from userinfo"""
+        # The id_token is only set once request_access_token has validated it during the browser login,
+        # so the DRF authentication classes, which call do_auth with just an access token, still use userinfo.
+        if auth0_user_settings.USER_DETAILS_FROM_ID_TOKEN and self.id_token:
+            return dict(self.id_token)
+        return super(Auth0OpenId, self).user_data(access_token, *args, **kwargs)
+
     def auth_url(self):
         """Return redirect url"""
         state = self.get_or_create_state()
@@ -0,0 +1,127 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.db import connection
+
+from django_auth0_user.settings import auth0_user_settings
+from django_auth0_user.sync import apply_auth0_user_changes
+from django_auth0_user.sync import user_changes_from_log_events
+
+
+logger = logging.getLogger(__name__)
+
+
+def log_events_from_body(body):
+    """
+    Parse a custom webhook log stream request body, which is a JSON array or JSON lines of {'log_id', 'data'} entries.
+
+    :param bytes body: The raw request body.
+    :return: The list of log events.
+    """
+    text = body.decode('utf-8').strip()
+    if not text:
+        return []
+    if text.startswith('['):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(_line) for _line in text.splitlines() if _line.strip()]
+    return [_entry.get('data', _entry) for _entry in entries]
+
+
+class LogStreamBuffer(object):
+    """
+    An in-process buffer of log stream request bodies, applied to the local users by a background thread.
+
+    Bodies are only parsed by the worker, so the request handler does no more than put the body on a queue.
+    Every `flush_interval` seconds, AUTH0_LOG_STREAM_FLUSH_INTERVAL when not given, the worker applies all the
+    buffered events as one batch, with one transaction via `django_auth0_user.sync.apply_auth0_user_changes`.
+    A batch that fails is put back on the queue and retried with the next one, up to `max_attempts` times.
+    Events still buffered when the process exits, or dropped after the last attempt, are lost, Auth0's log
+    retention and the `consume_auth0_logs` command can be used to catch up.
+    """
+
+    max_attempts = 5
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.failures = 0
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def put(self, body):
+        self.queue.put(body)
+        if self._worker is None or not self._worker.is_alive():
+            self._start_worker()
+
+    def _start_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='auth0-log-stream', daemon=True)
+                self._worker.start()
+
+    def _drain(self):
+        bodies = []
+        while True:
+            try:
+                bodies.append(self.queue.get_nowait())
+            except queue.Empty:
+                return bodies
+
+    def flush(self, bodies=()):
+        """
+        Apply the given bodies and everything buffered so far as a single batch.
+
+        :return: The number of log events applied.
+        """
+        log_events = []
+        for body in list(bodies) + self._drain():
+            try:
+                log_events.extend(log_events_from_body(body))
+            except ValueError:
+                logger.warning('Dropped an Auth0 log stream batch that is not valid JSON.')
+        if not log_events:
+            return 0
+        changed_ids, deleted_ids = user_changes_from_log_events(log_events)
+        if changed_ids or deleted_ids:
+            apply_auth0_user_changes(changed_ids, deleted_ids)
+        return len(log_events)
+
+    def flush_or_requeue(self, bodies=()):
+        """
+        Flush like `flush`, but put the batch back on the queue when applying it fails, until `max_attempts` in a row.
+
+        :return: The number of log events applied, 0 when the batch failed.
+        """
+        bodies = list(bodies) + self._drain()
+        try:
+            applied = self.flush(bodies)
+        except Exception:
+            self.failures += 1
+            if self.failures >= self.max_attempts:
+                logger.exception('Dropped a batch of Auth0 log stream events after %s attempts.', self.failures)
+                self.failures = 0
+            else:
+                logger.exception('Failed to apply a batch of Auth0 log stream events, it will be retried.')
+                for body in bodies:
+                    self.queue.put(body)
+            return 0
+        self.failures = 0
+        return applied
+
+    def _run(self):
+        while True:
+            # Block until a body arrives, then give the rest of the batch the flush interval to arrive.
+            first_body = self.queue.get()
+            flush_interval = self.flush_interval
+            time.sleep(auth0_user_settings.LOG_STREAM_FLUSH_INTERVAL if flush_interval is None else flush_interval)
+            try:
+                self.flush_or_requeue([first_body])
+            finally:
+                connection.close()
+
+
+LOG_STREAM_BUFFER = LogStreamBuffer()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from django_auth0_user.settings import auth0_user_settings
+from django_auth0_user.warmup import WARMUP_TASKS
+from django_auth0_user.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = 'Fetch the Auth0 Management API token, OIDC discovery document and JWKS into the shared caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=float, default=auth0_user_settings.WARMUP_TIMEOUT,
+                            help='Seconds to wait for the fetches to finish.')
+
+    def handle(self, *args, **options):
+        results = warm_up(timeout=options['timeout'])
+        failed = False
+        for name, _ in WARMUP_TASKS:
+            if name not in results:
+                failed = True
+                self.stderr.write('{}: still running after {}s'.format(name, options['timeout']))
+                continue
+            seconds, error = results[name]
+            if error is not None:
+                failed = True
+                self.stderr.write('{}: failed after {:.3f}s: {}'.format(name, seconds, error))
+            else:
+                self.stdout.write('{}: {:.3f}s'.format(name, seconds))
+        if failed:
+            raise CommandError('The Auth0 warm up did not complete.')
+        self.stdout.write(self.style.SUCCESS('Auth0 caches are warm.'))
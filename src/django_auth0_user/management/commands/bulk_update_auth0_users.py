@@ -0,0 +1,86 @@
+import json
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from social_django.models import UserSocialAuth
+
+from django_auth0_user.util.auth0_api import bulk_update_auth0_users
+
+
+def _parse_assignment(value):
+    key, separator, raw = value.partition('=')
+    if not separator:
+        raise CommandError('Expected KEY=VALUE, got {!r}.'.format(value))
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+
+class Command(BaseCommand):
+    help = 'PATCH the app_metadata or user_metadata of many Auth0 users, from a JSON lines file or the local users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='A JSON lines file of {"user_id": ..., "patch": {...}} objects, - for stdin.')
+        parser.add_argument('--filter', action='append', default=[], metavar='LOOKUP=VALUE',
+                            help='Select the local users to update with a queryset filter, e.g. is_staff=true.')
+        parser.add_argument('--set-app-metadata', action='append', default=[], metavar='KEY=VALUE',
+                            help='An app_metadata key to set on the selected local users, VALUE is JSON or a string.')
+        parser.add_argument('--set-user-metadata', action='append', default=[], metavar='KEY=VALUE',
+                            help='A user_metadata key to set on the selected local users, VALUE is JSON or a string.')
+        parser.add_argument('--workers', type=int, default=4, help='Number of requests in flight at once.')
+        parser.add_argument('--max-retries', type=int, default=3, help='Number of retries for a rate limited request.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the updates that would be made.')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            updates = self.updates_from_file(options['file'])
+        else:
+            updates = self.updates_from_queryset(options)
+
+        if options['dry_run']:
+            self.stdout.write('Would update {} Auth0 users.'.format(sum(1 for _ in updates)))
+            return
+
+        result = bulk_update_auth0_users(
+            updates,
+            workers=options['workers'],
+            max_retries=options['max_retries'],
+            progress=self.report_progress,
+        )
+        for user_id, error in result['errors']:
+            self.stderr.write('Failed to update {}: {}'.format(user_id, error))
+        self.stdout.write(self.style.SUCCESS(
+            'Updated {} Auth0 users, {} failed, in {:.1f}s.'.format(result['updated'], result['failed'], result['elapsed'])
+        ))
+
+    def report_progress(self, result):
+        done = result['updated'] + result['failed']
+        self.stdout.write('{} users done, {:.1f} per second.'.format(done, done / max(result['elapsed'], 0.001)))
+
+    def updates_from_file(self, path):
+        stream = sys.stdin if path == '-' else open(path)
+        try:
+            for line in stream:
+                if line.strip():
+                    entry = json.loads(line)
+                    yield entry['user_id'], entry['patch']
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def updates_from_queryset(self, options):
+        patch = {}
+        if options['set_app_metadata']:
+            patch['app_metadata'] = dict(_parse_assignment(_value) for _value in options['set_app_metadata'])
+        if options['set_user_metadata']:
+            patch['user_metadata'] = dict(_parse_assignment(_value) for _value in options['set_user_metadata'])
+        if not patch:
+            raise CommandError('Give a --file, or at least one --set-app-metadata or --set-user-metadata.')
+
+        lookups = dict(_parse_assignment(_value) for _value in options['filter'])
+        users = get_user_model()._default_manager.filter(**lookups)
+        uids = UserSocialAuth.objects.filter(provider='auth0', user__in=users).values_list('uid', flat=True)
+        return ((_uid, patch) for _uid in uids.iterator())
@@ -0,0 +1,61 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from django_auth0_user.sync import DEFAULT_LOG_CHECKPOINT
+from django_auth0_user.sync import consume_auth0_logs
+
+
+# Longest wait between polls after repeated failures, in daemon mode.
+MAX_RETRY_DELAY = 600
+
+
+def retry_delay(err, interval, failures):
+    """
+    Seconds to wait before polling again after a failed poll.
+
+    A rate limited response's Retry-After is honoured when the error carries the response, auth0-python's Auth0Error
+    does not, otherwise the wait starts at `interval` and doubles with each failure in a row.
+    """
+    response = getattr(err, 'response', None)
+    if response is not None and response.headers.get('Retry-After'):
+        try:
+            return max(float(response.headers['Retry-After']), 0)
+        except ValueError:
+            pass
+    return min(interval * 2 ** (failures - 1), MAX_RETRY_DELAY)
+
+
+class Command(BaseCommand):
+    help = 'Apply the user changes recorded in the Auth0 logs since the last run to the local users and mirrors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkpoint', default=DEFAULT_LOG_CHECKPOINT,
+                            help='Name of the stored checkpoint to read forward from.')
+        parser.add_argument('--take', type=int, default=100, help='Number of log events to read per request.')
+        parser.add_argument('--daemon', action='store_true', help='Keep polling the logs instead of exiting.')
+        parser.add_argument('--interval', type=float, default=30,
+                            help='Seconds to wait between polls once caught up, in daemon mode.')
+
+    def handle(self, *args, **options):
+        from auth0.v3.exceptions import Auth0Error
+
+        failures = 0
+        while True:
+            try:
+                read, updated = consume_auth0_logs(take=options['take'], checkpoint_name=options['checkpoint'])
+            except (Auth0Error, requests.RequestException) as err:
+                if not options['daemon']:
+                    raise
+                # The checkpoint only moves past applied events, so the next poll carries on where this one failed.
+                failures += 1
+                delay = retry_delay(err, options['interval'], failures)
+                self.stderr.write('Failed to read the Auth0 logs, retrying in {:.0f}s: {}'.format(delay, err))
+                time.sleep(delay)
+                continue
+            failures = 0
+            self.stdout.write('Read {} log events, updated {} users.'.format(read, updated))
+            if not options['daemon']:
+                break
+            time.sleep(options['interval'])
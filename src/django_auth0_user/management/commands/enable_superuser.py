@@ -1 +1,114 @@
-# TODO: Add a management command to help manage superusers since the regular superuser wont work with this library.
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import prefetch_related_objects
+
+from django_auth0_user.backend import Auth0OpenId
+from django_auth0_user.permission_checks import PERMISSION_FLAG_FIELDS
+from django_auth0_user.permission_checks import evaluate_permission_flags
+from django_auth0_user.settings import auth0_user_settings
+from django_auth0_user.settings import USER_DATA_STORAGE_ONE_TO_ONE
+
+
+def _evaluate_chunk(users):
+    """
+    Return (pk, flags) for the users in the chunk whose flags differ from the configured checks, and (pk, error)
+    for the users whose checks raised, so one bad user does not stop the run.
+    """
+    changed = []
+    failed = []
+    for user in users:
+        try:
+            if evaluate_permission_flags(user):
+                changed.append((user.pk, {_field: getattr(user, _field) for _field in PERMISSION_FLAG_FIELDS}))
+        except Exception as err:
+            failed.append((user.pk, '{}: {}'.format(type(err).__name__, err)))
+    return changed, failed
+
+
+class Command(BaseCommand):
+    help = 'Re-apply the configured is_superuser, is_staff and is_active check functions to every existing Auth0 user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users to read and write at once.')
+        parser.add_argument('--processes', type=int, default=0,
+                            help='Evaluate the checks in this many worker processes, for CPU heavy custom checks.'
+                                 ' The default of 0 evaluates them in this process.')
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes without saving them.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+
+        # Only users with Auth0 data, the checks cannot be evaluated for local accounts, e.g. from createsuperuser.
+        users = User._default_manager.order_by('pk')
+        if auth0_user_settings.USER_DATA_STORAGE == USER_DATA_STORAGE_ONE_TO_ONE:
+            users = users.filter(auth0_profile__isnull=False).select_related('auth0_profile')
+        else:
+            users = users.filter(social_auth__provider=Auth0OpenId.name).distinct()
+
+        self.started = time.monotonic()
+        self.checked = 0
+        self.updated = 0
+        self.failed = 0
+        chunks = self._chunks(users.iterator(chunk_size=batch_size), batch_size)
+
+        if options['processes'] > 0:
+            with ProcessPoolExecutor(max_workers=options['processes'], initializer=django.setup) as executor:
+                # Only a few chunks are in flight at once, so the whole table is never held in memory.
+                pending = deque()
+                for chunk in chunks:
+                    pending.append((len(chunk), executor.submit(_evaluate_chunk, chunk)))
+                    if len(pending) > options['processes'] * 2:
+                        self._apply(User, *self._result(pending.popleft()))
+                while pending:
+                    self._apply(User, *self._result(pending.popleft()))
+        else:
+            for chunk in chunks:
+                self._apply(User, len(chunk), _evaluate_chunk(chunk))
+
+        summary = '{} {} of {} users in {:.1f}s.'.format(
+            'Would update' if self.dry_run else 'Updated', self.updated, self.checked, self._elapsed()
+        )
+        if self.failed:
+            self.stdout.write(self.style.WARNING('{} The checks failed for {} users.'.format(summary, self.failed)))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def _chunks(self, users, batch_size):
+        while True:
+            chunk = list(islice(users, batch_size))
+            if not chunk:
+                return
+            if auth0_user_settings.USER_DATA_STORAGE != USER_DATA_STORAGE_ONE_TO_ONE:
+                # iterator() ignores prefetch_related, so the Auth0 data is prefetched one chunk at a time instead.
+                prefetch_related_objects(chunk, 'social_auth')
+            yield chunk
+
+    def _result(self, pending):
+        size, future = pending
+        return size, future.result()
+
+    def _apply(self, User, size, result):
+        changed, failed = result
+        for pk, error in failed:
+            self.stderr.write('Could not check user {}: {}'.format(pk, error))
+        if changed and not self.dry_run:
+            User._default_manager.bulk_update(
+                [User(pk=_pk, **_flags) for _pk, _flags in changed], PERMISSION_FLAG_FIELDS
+            )
+        self.checked += size
+        self.updated += len(changed)
+        self.failed += len(failed)
+        self.stdout.write('Checked {} users, {} changed ({:.0f} users/s)...'.format(
+            self.checked, self.updated, self.checked / max(self._elapsed(), 1e-6)
+        ))
+
+    def _elapsed(self):
+        return time.monotonic() - self.started
@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from django_auth0_user.util.auth0_api import AUTH0_USERS_IMPORT_MAX_CONCURRENT_JOBS
+from django_auth0_user.util.auth0_api import auth0_import_record
+from django_auth0_user.util.auth0_api import chunk_import_records
+from django_auth0_user.util.auth0_api import import_users_to_auth0
+
+
+class Command(BaseCommand):
+    help = 'Import the existing Django users into an Auth0 database connection using users-imports jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('connection_id', help='The id of the Auth0 database connection to import into.')
+        parser.add_argument('--upsert', action='store_true', help='Update users that already exist in Auth0.')
+        parser.add_argument('--max-concurrent-jobs', type=int, default=AUTH0_USERS_IMPORT_MAX_CONCURRENT_JOBS,
+                            help='Number of import jobs to keep pending at once.')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds between job status checks.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users to read at once.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how the users would be split up.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        # Users without an email address cannot be imported into a database connection.
+        users = User._default_manager.exclude(email='').order_by('pk').iterator(chunk_size=options['batch_size'])
+        records = (auth0_import_record(_user) for _user in users)
+
+        if options['dry_run']:
+            sizes = [len(_chunk) for _chunk in chunk_import_records(records)]
+            self.stdout.write('Would submit {} import jobs of {} bytes in total.'.format(len(sizes), sum(sizes)))
+            return
+
+        result = import_users_to_auth0(
+            records,
+            options['connection_id'],
+            upsert=options['upsert'],
+            max_concurrent_jobs=options['max_concurrent_jobs'],
+            poll_interval=options['poll_interval'],
+        )
+        for error in result['errors']:
+            self.stderr.write('Failed to import {}: {}'.format(
+                (error.get('user') or {}).get('email'), error.get('errors')
+            ))
+        summary = 'Ran {} import jobs: {} inserted, {} updated, {} failed.'.format(
+            len(result['jobs']), result['inserted'], result['updated'], result['failed']
+        )
+        if result['error'] is not None:
+            self.stderr.write('Stopped submitting import jobs, the remaining users were not imported: {}'.format(
+                result['error']
+            ))
+            self.stdout.write(self.style.WARNING(summary + ' Run again with --upsert to import the rest.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
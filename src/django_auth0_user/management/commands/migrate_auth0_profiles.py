@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from social_django.models import UserSocialAuth
+
+from django_auth0_user.models import Auth0Profile
+
+
+class Command(BaseCommand):
+    help = 'Copy the Auth0 data on existing UserSocialAuth rows into Auth0Profile rows,' \
+           ' ready for switching AUTH0_USER_DATA_STORAGE to "one_to_one"'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', default='auth0', help='The social auth provider name to copy from.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows to read and write at once.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        social_auths = UserSocialAuth.objects.filter(provider=options['provider']).order_by('pk')
+
+        copied = 0
+        batch = []
+        for user_id, uid, extra_data in social_auths.values_list('user_id', 'uid', 'extra_data').iterator(
+                chunk_size=batch_size):
+            batch.append(Auth0Profile(user_id=user_id, uid=uid, extra_data=extra_data))
+            if len(batch) >= batch_size:
+                copied += self._copy(batch)
+                batch = []
+        if batch:
+            copied += self._copy(batch)
+
+        self.stdout.write(self.style.SUCCESS('Copied {} social auth rows into Auth0 profiles.'.format(copied)))
+
+    def _copy(self, batch):
+        # Users that already have a profile are left alone, so the command can be re-run safely. bulk_create doesn't
+        # say which rows `ignore_conflicts` skipped, so the new rows are counted by the user ids missing beforehand.
+        user_ids = [profile.user_id for profile in batch]
+        existing = set(Auth0Profile.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        new_user_ids = [user_id for user_id in user_ids if user_id not in existing]
+        Auth0Profile.objects.bulk_create(
+            [profile for profile in batch if profile.user_id not in existing], ignore_conflicts=True
+        )
+        copied = Auth0Profile.objects.filter(pk__in=new_user_ids).count() if new_user_ids else 0
+        self.stdout.write('Copied {} of {} rows...'.format(copied, len(batch)))
+        return copied
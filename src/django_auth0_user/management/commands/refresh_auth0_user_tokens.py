@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from django_auth0_user.settings import auth0_user_settings
+from django_auth0_user.user_tokens import refresh_expiring_user_tokens
+
+
+class Command(BaseCommand):
+    help = 'Refresh the stored Auth0 access tokens of users before they expire'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--margin', type=int, default=auth0_user_settings.USER_TOKEN_REFRESH_MARGIN,
+                            help='Refresh tokens that expire within this many seconds.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of tokens to refresh and save at once.')
+        parser.add_argument('--workers', type=int, default=4, help='Number of refresh requests in flight at once.')
+        parser.add_argument('--daemon', action='store_true', help='Keep refreshing tokens instead of exiting.')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Seconds to wait between runs, in daemon mode. Keep this well under the margin.')
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed, failed = refresh_expiring_user_tokens(
+                margin=options['margin'], batch_size=options['batch_size'], workers=options['workers']
+            )
+            self.stdout.write('Refreshed {} user tokens, {} failed.'.format(refreshed, failed))
+            if not options['daemon']:
+                break
+            time.sleep(options['interval'])
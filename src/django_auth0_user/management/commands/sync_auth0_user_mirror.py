@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from django_auth0_user.sync import sync_auth0_user_mirrors
+
+
+class Command(BaseCommand):
+    help = 'Refresh the local Auth0UserMirror table from the Auth0 Management API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of users to write at once.')
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete the mirrors of users that no longer exist in Auth0.')
+
+    def handle(self, *args, **options):
+        stored, pruned = sync_auth0_user_mirrors(batch_size=options['batch_size'], prune=options['prune'])
+        self.stdout.write(self.style.SUCCESS('Mirrored {} Auth0 users, pruned {}.'.format(stored, pruned)))
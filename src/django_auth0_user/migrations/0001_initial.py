@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:32
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import social_django.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Auth0Profile',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='auth0_profile', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('uid', models.CharField(max_length=255, unique=True)),
+                ('extra_data', social_django.fields.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import social_django.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_auth0_user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Auth0UserMirror',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=255, unique=True)),
+                ('email', models.CharField(blank=True, db_index=True, max_length=254)),
+                ('email_verified', models.BooleanField(default=False)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('connection', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('blocked', models.BooleanField(db_index=True, default=False)),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_login', models.DateTimeField(blank=True, null=True)),
+                ('profile', social_django.fields.JSONField(default=dict)),
+                ('synced_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_auth0_user', '0002_auth0usermirror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Auth0LogCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('log_id', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
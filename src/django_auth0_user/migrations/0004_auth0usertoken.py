@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:52
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('django_auth0_user', '0003_auth0logcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Auth0UserToken',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='auth0_token', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('access_token', models.TextField()),
+                ('refresh_token', models.TextField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('failures', models.PositiveSmallIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
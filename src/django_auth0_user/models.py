@@ -7,19 +7,158 @@ from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-from jwt import decode as jwt_decode
-from jwt import DecodeError
+from social_django.fields import JSONField
 
+from django_auth0_user.rbac import django_permissions_for
 from django_auth0_user.validators import Auth0UserIdValidator
-from django_auth0_user.settings import USER_ID_IS_DJANGO_USERNAME
-from django_auth0_user.settings import NAMESPACED_USER_METADATA_KEY
-from django_auth0_user.settings import NAMESPACED_APP_METADATA_KEY
+from django_auth0_user.settings import auth0_user_settings
+from django_auth0_user.settings import USER_DATA_STORAGE_ONE_TO_ONE
 
 
-# TODO: The default social_django model uses a foreign key from the social account model
-#   to a django user model instance in order to allow multiple social logins for a single
-#   django user, however since this is a function that Auth0 abstracts away for us,
-#   we can bind the models more tightly and use a OneToOneField. Look into this option further.
+def _unverified_token_payload(token):
+    """
+    Decode a token stored from a login without verifying it, the backend validated it when it was received.
+
+    PyJWT is only imported here, so it stays off the import path of the models.
+
+    :return: The token payload, or None when there is no token or it is not a JWT.
+    """
+    if token is None:
+        return None
+    from jwt import decode as jwt_decode
+    from jwt import DecodeError
+    try:
+        # TODO: Decide how I want to handle verifying the tokens.
+        return jwt_decode(token, verify=False)
+    except DecodeError:
+        return None
+
+
+# The default social_django model uses a foreign key from the social account model
+# to a django user model instance in order to allow multiple social logins for a single
+# django user, however since this is a function that Auth0 abstracts away for us,
+# we can bind the models more tightly. Setting AUTH0_USER_DATA_STORAGE = 'one_to_one'
+# reads the Auth0 data from the Auth0Profile model below instead.
+
+
+class Auth0Profile(models.Model):
+    """
+    The Auth0 data for a user, bound one-to-one so it can be loaded with `select_related('auth0_profile')`.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='auth0_profile',
+    )
+    uid = models.CharField(max_length=255, unique=True)
+    extra_data = JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.uid
+
+
+class Auth0UserMirrorQuerySet(models.QuerySet):
+
+    def by_email(self, email):
+        return self.filter(email=email.lower())
+
+    def by_connection(self, connection):
+        return self.filter(connection=connection)
+
+    def blocked(self):
+        return self.filter(blocked=True)
+
+    def synced_since(self, since):
+        return self.filter(synced_at__gte=since)
+
+    def stale(self, before):
+        return self.filter(synced_at__lt=before)
+
+    def with_metadata(self, key, value, metadata='app_metadata'):
+        """
+        Return the mirrored users whose app_metadata (or user_metadata) has `key` set to `value`.
+
+        A JSON key lookup in SQL when the profile column supports them, i.e. a JSONB column on PostgreSQL with
+        SOCIAL_AUTH_POSTGRES_JSONFIELD set. Otherwise the profile is JSON text and this falls back to `scan_metadata`.
+        """
+        if self.model._meta.get_field('profile').get_transform(metadata) is not None:
+            return self.filter(**{'profile__{}__{}'.format(metadata, key): value})
+        return self.scan_metadata(key, value, metadata=metadata)
+
+    def scan_metadata(self, key, value, metadata='app_metadata'):
+        """
+        The slow path of `with_metadata`, for profiles stored as JSON text: every profile in the queryset is read and
+        matched in Python. The result is still a queryset, filtered on the matching pks, but narrow the queryset
+        first on large tables.
+        """
+        pks = [
+            _pk for _pk, _profile in self.values_list('pk', 'profile').iterator()
+            if ((_profile or {}).get(metadata) or {}).get(key) == value
+        ]
+        return self.filter(pk__in=pks)
+
+
+class Auth0UserMirror(models.Model):
+    """
+    A local copy of an Auth0 user, so support and admin lookups are indexed SQL instead of Management API searches.
+
+    The searchable attributes are kept in indexed columns, the full user as returned by Auth0 is kept in `profile`.
+    `synced_at` records when the row was last refreshed from Auth0, see `django_auth0_user.sync`.
+    """
+    user_id = models.CharField(max_length=255, unique=True)
+    email = models.CharField(max_length=254, blank=True, db_index=True)
+    email_verified = models.BooleanField(default=False)
+    name = models.CharField(max_length=255, blank=True)
+    connection = models.CharField(max_length=255, blank=True, db_index=True)
+    blocked = models.BooleanField(default=False, db_index=True)
+    created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_login = models.DateTimeField(null=True, blank=True)
+    profile = JSONField()
+    synced_at = models.DateTimeField(db_index=True)
+
+    objects = Auth0UserMirrorQuerySet.as_manager()
+
+    def __str__(self):
+        return self.user_id
+
+
+class Auth0LogCheckpoint(models.Model):
+    """
+    The id of the last Auth0 log event a log consumer has applied, so it can carry on from there.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    log_id = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{}: {}'.format(self.name, self.log_id)
+
+
+class Auth0UserToken(models.Model):
+    """
+    A user's Auth0 access token and the refresh token to replace it with, tracked by expiry for the refresh worker.
+
+    Stored at login when Auth0 issued a refresh token, i.e. the 'offline_access' scope was requested,
+    see `django_auth0_user.user_tokens`.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='auth0_token',
+    )
+    access_token = models.TextField()
+    refresh_token = models.TextField()
+    expires_at = models.DateTimeField(db_index=True)
+    # Consecutive failed refreshes, tokens that keep failing, e.g. revoked ones, are left alone by the worker.
+    failures = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{}: {}'.format(self.user_id, self.expires_at)
 
 
 class AbstractAuth0User(AbstractUser):
@@ -28,7 +167,8 @@ class AbstractAuth0User(AbstractUser):
     """
 
     # In order to accept the "|" character in a Django Username we need to change the validator.
-    if USER_ID_IS_DJANGO_USERNAME:
+    # The setting is read when this class is defined, so override_settings and reloading the settings don't change it.
+    if auth0_user_settings.USER_ID_IS_DJANGO_USERNAME:
         username_validator = Auth0UserIdValidator()
         username_help_text = _('Required. 150 characters or fewer. Letters, digits and @/./+/-/_/| only.')
     else:
@@ -46,14 +186,30 @@ class AbstractAuth0User(AbstractUser):
         },
     )
 
+    # Set by use_auth0_data(), for an instance that should not read its Auth0 data from the database.
+    _auth0_data = None
+
     # ----------------
     # Helper Functions
     # ----------------
 
+    def use_auth0_data(self, extra_data):
+        """
+        Answer `auth0_data` from extra_data already at hand on this instance, e.g. from the social association the
+        login pipeline just saved, instead of reading it from the database again.
+        """
+        self._auth0_data = extra_data
+
     @property
     def auth0_data(self):
-        if self.social_auth.count() == 1:
-            return self.social_auth.get().extra_data
+        if self._auth0_data is not None:
+            return self._auth0_data
+        if auth0_user_settings.USER_DATA_STORAGE == USER_DATA_STORAGE_ONE_TO_ONE:
+            return self.auth0_profile.extra_data
+        # Evaluating .all() once, rather than count() then get(), is a single query and uses any prefetch_related cache.
+        social_auths = list(self.social_auth.all())
+        if len(social_auths) == 1:
+            return social_auths[0].extra_data
         else:
             raise NotImplementedError(
                 "More than one social auth model instance is associated with this django user model instance"
@@ -61,36 +217,15 @@ class AbstractAuth0User(AbstractUser):
 
     @property
     def id_token_payload(self):
-        if self.auth0_data['id_token'] is not None:
-            try:
-                # TODO: Decide how I want to handle verifying the tokens.
-                return jwt_decode(self.auth0_data['id_token'], verify=False)
-            except DecodeError:
-                return None
-        else:
-            return None
+        return _unverified_token_payload(self.auth0_data['id_token'])
 
     @property
     def access_token_payload(self):
-        if self.auth0_data['access_token'] is not None:
-            try:
-                # TODO: Decide how I want to handle verifying the tokens.
-                return jwt_decode(self.auth0_data['access_token'], verify=False)
-            except DecodeError:
-                return None
-        else:
-            return None
+        return _unverified_token_payload(self.auth0_data['access_token'])
 
     @property
     def refresh_token_payload(self):
-        if self.auth0_data['refresh_token'] is not None:
-            try:
-                # TODO: Decide how I want to handle verifying the tokens.
-                return jwt_decode(self.auth0_data['refresh_token'], verify=False)
-            except DecodeError:
-                return None
-        else:
-            return None
+        return _unverified_token_payload(self.auth0_data['refresh_token'])
 
     # -------------------------------------
     # Convenience / Quick Access Properties
@@ -99,17 +234,28 @@ class AbstractAuth0User(AbstractUser):
     # so our abstract class adds these properties to help make it easier
     # to leverage Auth0 functionality such as the user and app metadata.
 
+    @property
+    def auth0_claims(self):
+        """
+        The verified claims stored for this user.
+
+        These come from the id_token for users that logged in through python-social-auth,
+        or from the access token for users provisioned just in time by the DRF authentication.
+        """
+        return self.auth0_data.get('id_token_payload') or self.auth0_data.get('access_token_payload') or {}
+
     @property
     def user_metadata(self):
         # TODO: Only do this is we are dealing with an OIDC compliant endpoint.
         # TODO: Ensure any auto-created rule is based on the same metadata dict key so this doesnt break.
 
-        if NAMESPACED_USER_METADATA_KEY is not None:
-            if NAMESPACED_USER_METADATA_KEY in self.auth0_data['id_token_payload']:
-                return self.auth0_data['id_token_payload'][NAMESPACED_USER_METADATA_KEY]
+        namespaced_key = auth0_user_settings.NAMESPACED_USER_METADATA_KEY
+        if namespaced_key is not None:
+            if namespaced_key in self.auth0_claims:
+                return self.auth0_claims[namespaced_key]
 
-        if 'user_metadata' in self.auth0_data['id_token_payload']:
-            return self.auth0_data['id_token_payload']['user_metadata']
+        if 'user_metadata' in self.auth0_claims:
+            return self.auth0_claims['user_metadata']
 
         return None
 
@@ -118,15 +264,42 @@ class AbstractAuth0User(AbstractUser):
         # TODO: Only do this is we are dealing with an OIDC compliant endpoint.
         # TODO: Ensure any auto-created rule is based on the same metadata dict key so this doesnt break.
 
-        if NAMESPACED_APP_METADATA_KEY is not None:
-            if NAMESPACED_APP_METADATA_KEY in self.auth0_data['id_token_payload']:
-                return self.auth0_data['id_token_payload'][NAMESPACED_APP_METADATA_KEY]
+        namespaced_key = auth0_user_settings.NAMESPACED_APP_METADATA_KEY
+        if namespaced_key is not None:
+            if namespaced_key in self.auth0_claims:
+                return self.auth0_claims[namespaced_key]
 
-        if 'app_metadata' in self.auth0_data['id_token_payload']:
-            return self.auth0_data['id_token_payload']['app_metadata']
+        if 'app_metadata' in self.auth0_claims:
+            return self.auth0_claims['app_metadata']
 
         return None
 
+    # -------------------------------------
+    # Auth0 RBAC Permissions
+    # -------------------------------------
+    # The DRF authentication classes set `auth0_permissions` from the verified token's 'permissions' claim.
+    # While it is set, permission checks are answered from AUTH0_RBAC_MAP in memory instead of
+    # querying the user and group permission tables.
+
+    auth0_permissions = None
+
+    def has_perm(self, perm, obj=None):
+        if self.auth0_permissions is None or obj is not None:
+            return super(AbstractAuth0User, self).has_perm(perm, obj)
+        if not self.is_active:
+            return False
+        return self.is_superuser or perm in django_permissions_for(self.auth0_permissions)
+
+    def has_module_perms(self, app_label):
+        if self.auth0_permissions is None:
+            return super(AbstractAuth0User, self).has_module_perms(app_label)
+        if not self.is_active:
+            return False
+        prefix = app_label + '.'
+        return self.is_superuser or any(
+            _perm.startswith(prefix) for _perm in django_permissions_for(self.auth0_permissions)
+        )
+
     class Meta:
         abstract = True
 
@@ -1,5 +1,6 @@
-import importlib
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
 
 
 def auth0_user_is_superuser(auth0_user):
@@ -9,8 +10,8 @@ def auth0_user_is_superuser(auth0_user):
     :param django_db_auth0_user.models.Auth0User auth0_user: The Auth0User to check for supervisor status.
     :return:
     """
-    if auth0_user.auth0_app_metadata:
-        return auth0_user.auth0_app_metadata.get('is_superuser', False)
+    if auth0_user.app_metadata:
+        return auth0_user.app_metadata.get('is_superuser', False)
     else:
         return False
 
@@ -22,10 +23,10 @@ def auth0_user_is_staff(auth0_user):
     :param django_db_auth0_user.models.Auth0User auth0_user: The Auth0User to check for staff status.
     :return:
     """
-    if auth0_user.auth0_app_metadata:
+    if auth0_user.app_metadata:
         if auth0_user.is_superuser:
             return True
-        return auth0_user.auth0_app_metadata.get('is_staff', False)
+        return auth0_user.app_metadata.get('is_staff', False)
     else:
         return False
 
@@ -40,44 +41,151 @@ def auth0_user_is_active(auth0_user):
     :return:
     """
     default_active_value = getattr(settings, 'AUTH0_USER_DEFAULT_IS_ACTIVE_VALUE', True)
-    if auth0_user.auth0_app_metadata:
-        return auth0_user.auth0_app_metadata.get('is_active', default_active_value)
+    if auth0_user.app_metadata:
+        return auth0_user.app_metadata.get('is_active', default_active_value)
     else:
         return default_active_value
 
 
-# Just a reminder how this import magic works.
-# function_string = 'mypackage.mymodule.myfunc'
-# mod_name, func_name = function_string.rsplit('.',1)
-# mod = importlib.import_module(mod_name)
-# func = getattr(mod, func_name)
-# result = func()
+def _resolve_check(check):
+    """
+    Turn a dotted path, a callable or a list of either into a single check function.
+    """
+    if isinstance(check, str):
+        return import_string(check)
+    if isinstance(check, (list, tuple)):
+        return all_of(*check)
+    return check
+
+
+def _lazy_checks(checks):
+    """
+    Return a function that resolves the checks on its first call.
+
+    The resolved checks are published with a single assignment, so a thread making a concurrent first call
+    never sees them partly resolved, it resolves them again itself instead.
+    """
+    resolved = None
+
+    def get():
+        nonlocal resolved
+        if resolved is None:
+            resolved = tuple(_resolve_check(_check) for _check in checks)
+        return resolved
+    return get
+
+
+def all_of(*checks):
+    """
+    Combine several checks into one that only passes when every check passes, evaluated in order.
+
+    Each check is a callable or a dotted path to one, imported on the first call.
+    A list or tuple of checks in one of the check function settings is combined with `all_of`.
+    """
+    resolved = _lazy_checks(checks)
+
+    def check(auth0_user):
+        return all(_check(auth0_user) for _check in resolved())
+    return check
+
+
+def any_of(*checks):
+    """
+    Combine several checks into one that passes as soon as one check passes, evaluated in order.
+
+    Each check is a callable or a dotted path to one, imported on the first call.
+    """
+    resolved = _lazy_checks(checks)
+
+    def check(auth0_user):
+        return any(_check(auth0_user) for _check in resolved())
+    return check
+
+
+class PermissionCheckRegistry(object):
+    """
+    The check function for each user flag, resolved from its setting with `import_string` on first use.
+
+    Importing the configured modules when this module is loaded would tie the import order to the project's code,
+    and make every process pay for importing them, even those that never check a user. Once resolved, `get` is a
+    single dict lookup returning the check function itself, so calling it costs the same as calling the function.
+    The resolved checks are dropped when one of their settings changes, e.g. with `override_settings`.
+    """
+
+    def __init__(self):
+        self._settings = {}
+        self._checks = {}
+
+    def register(self, flag, setting_name, default):
+        """
+        Register the setting naming the check for a flag, and the dotted path used when it is not set.
+        """
+        self._settings[flag] = (setting_name, default)
+        self._checks.pop(flag, None)
 
+    def get(self, flag):
+        try:
+            return self._checks[flag]
+        except KeyError:
+            setting_name, default = self._settings[flag]
+            check = self._checks[flag] = _resolve_check(getattr(settings, setting_name, default))
+            return check
 
-AUTH0_USER_IS_SUPERUSER_CHECK_FUNCTION = getattr(settings, 'AUTH0_USER_IS_SUPERUSER_CHECK_FUNCTION',
-                                                 'django_auth0_user.permission_checks.auth0_user_is_superuser')
-superuser_module_name, supervisor_func_name = AUTH0_USER_IS_SUPERUSER_CHECK_FUNCTION.rsplit('.', 1)
-superuser_module = importlib.import_module(superuser_module_name)
-IS_SUPERUSER = getattr(superuser_module, supervisor_func_name)
+    @property
+    def setting_names(self):
+        return {_setting_name for _setting_name, _default in self._settings.values()}
 
+    def invalidate(self):
+        self._checks.clear()
 
-AUTH0_USER_IS_STAFF_CHECK_FUNCTION = getattr(settings, 'AUTH0_USER_IS_STAFF_CHECK_FUNCTION',
-                                             'django_auth0_user.permission_checks.auth0_user_is_staff')
-staff_module_name, staff_func_name = AUTH0_USER_IS_STAFF_CHECK_FUNCTION.rsplit('.', 1)
-staff_module = importlib.import_module(staff_module_name)
-IS_STAFF = getattr(staff_module, staff_func_name)
 
+PERMISSION_CHECKS = PermissionCheckRegistry()
+PERMISSION_CHECKS.register('is_superuser', 'AUTH0_USER_IS_SUPERUSER_CHECK_FUNCTION',
+                           'django_auth0_user.permission_checks.auth0_user_is_superuser')
+PERMISSION_CHECKS.register('is_staff', 'AUTH0_USER_IS_STAFF_CHECK_FUNCTION',
+                           'django_auth0_user.permission_checks.auth0_user_is_staff')
+PERMISSION_CHECKS.register('is_active', 'AUTH0_USER_IS_ACTIVE_CHECK_FUNCTION',
+                           'django_auth0_user.permission_checks.auth0_user_is_active')
 
-AUTH0_USER_IS_ACTIVE_CHECK_FUNCTION = getattr(settings, 'AUTH0_USER_IS_ACTIVE_CHECK_FUNCTION',
-                                              'django_auth0_user.permission_checks.auth0_user_is_active')
-active_module_name, active_func_name = AUTH0_USER_IS_ACTIVE_CHECK_FUNCTION.rsplit('.', 1)
-active_module = importlib.import_module(active_module_name)
-IS_ACTIVE = getattr(active_module, active_func_name)
 
+def reset_permission_checks_on_setting_changed(*args, **kwargs):
+    if kwargs['setting'] in PERMISSION_CHECKS.setting_names:
+        PERMISSION_CHECKS.invalidate()
 
 
+setting_changed.connect(reset_permission_checks_on_setting_changed)
 
 
+# Kept for code calling the configured checks directly, PERMISSION_CHECKS.get avoids the extra call.
+def IS_SUPERUSER(auth0_user):
+    return PERMISSION_CHECKS.get('is_superuser')(auth0_user)
 
 
+def IS_STAFF(auth0_user):
+    return PERMISSION_CHECKS.get('is_staff')(auth0_user)
 
+
+def IS_ACTIVE(auth0_user):
+    return PERMISSION_CHECKS.get('is_active')(auth0_user)
+
+
+# The user fields kept in sync with the check functions, superuser first since the default staff check depends on it.
+PERMISSION_FLAG_FIELDS = ('is_superuser', 'is_staff', 'is_active')
+
+
+def evaluate_permission_flags(auth0_user):
+    """
+    Evaluate the configured check functions and set the results on the user, without saving it.
+
+    Each flag is set before the next check runs, so a check can rely on the flags evaluated before it.
+
+    :param django_db_auth0_user.models.Auth0User auth0_user: The Auth0User to evaluate the flags for.
+    :return: The list of flag fields whose value changed.
+    """
+    changed_fields = []
+    for _field in PERMISSION_FLAG_FIELDS:
+        value = bool(PERMISSION_CHECKS.get(_field)(auth0_user))
+        if getattr(auth0_user, _field) != value:
+            setattr(auth0_user, _field, value)
+            changed_fields.append(_field)
+    return changed_fields
@@ -0,0 +1,187 @@
+from django.db import IntegrityError
+from social_core.exceptions import AuthAlreadyAssociated
+from social_core.pipeline.user import user_details as social_user_details
+
+from django_auth0_user.models import Auth0Profile
+from django_auth0_user.permission_checks import evaluate_permission_flags
+from django_auth0_user.provisioning import claims_digest
+from django_auth0_user.provisioning import imported_django_user
+from django_auth0_user.provisioning import login_token_data
+from django_auth0_user.provisioning import store_auth0_profile
+from django_auth0_user.provisioning import upsert_auth0_user
+from django_auth0_user.rbac import compile_rbac_map
+from django_auth0_user.rbac import sync_user_groups
+from django_auth0_user.settings import auth0_user_settings
+from django_auth0_user.settings import USER_DATA_STORAGE_ONE_TO_ONE
+from django_auth0_user.user_tokens import store_user_token
+
+
+# The stock python-social-auth pipeline with the write heavy steps swapped for digest aware versions.
+# Use it with: `from django_auth0_user.pipeline import AUTH0_PIPELINE as SOCIAL_AUTH_PIPELINE` in your settings.
+AUTH0_PIPELINE = (
+    'social_core.pipeline.social_auth.social_details',
+    'social_core.pipeline.social_auth.social_uid',
+    'social_core.pipeline.social_auth.auth_allowed',
+    'social_core.pipeline.social_auth.social_user',
+    'django_auth0_user.pipeline.associate_imported_user',
+    'social_core.pipeline.user.get_username',
+    'social_core.pipeline.user.create_user',
+    'social_core.pipeline.social_auth.associate_user',
+    'django_auth0_user.pipeline.load_extra_data',
+    'django_auth0_user.pipeline.sync_auth0_profile',
+    'django_auth0_user.pipeline.user_details',
+    'django_auth0_user.pipeline.sync_permission_flags',
+    'django_auth0_user.pipeline.sync_rbac_groups',
+    'django_auth0_user.pipeline.store_user_tokens',
+)
+
+
+# A minimal pipeline for Auth0, the social lookup, user creation, association and extra_data
+# steps are collapsed into a single transactional upsert keyed on the Auth0 `sub`.
+AUTH0_LEAN_PIPELINE = (
+    'social_core.pipeline.social_auth.social_details',
+    'social_core.pipeline.social_auth.social_uid',
+    'social_core.pipeline.social_auth.auth_allowed',
+    'django_auth0_user.pipeline.provision_auth0_user',
+    'django_auth0_user.pipeline.sync_permission_flags',
+    'django_auth0_user.pipeline.sync_rbac_groups',
+    'django_auth0_user.pipeline.store_user_tokens',
+)
+
+
+def associate_imported_user(backend, uid, response=None, user=None, *args, **kwargs):
+    """
+    On a first login, pick the Django user `import_users_to_auth0` created the Auth0 user from.
+
+    The `associate_user` step then associates it, instead of `create_user` creating a duplicate user.
+    See `django_auth0_user.provisioning.imported_django_user`.
+    """
+    if user is not None or not response:
+        return
+    imported_user = imported_django_user(uid, response, backend.name)
+    if imported_user is not None:
+        return {'user': imported_user}
+
+
+def load_extra_data(backend, details, response, uid, user, *args, **kwargs):
+    """
+    Replacement for `social_core.pipeline.social_auth.load_extra_data` that only writes when the claims changed.
+
+    Adds `claims_changed` to the pipeline so later steps can skip their own writes. With unchanged claims
+    only the tokens of this login are written, with a single UPDATE of the extra_data.
+    """
+    social = kwargs.get('social') or backend.strategy.storage.user.get_social_auth(backend.name, uid)
+    if not social:
+        return
+
+    extra_data = backend.extra_data(user, uid, response, details, *args, **kwargs)
+    extra_data['claims_digest'] = claims_digest(extra_data)
+    if social.extra_data and social.extra_data.get('claims_digest') == extra_data['claims_digest']:
+        token_data = login_token_data(extra_data)
+        if any(social.extra_data.get(_key) != _value for _key, _value in token_data.items()):
+            social.extra_data.update(token_data)
+            social.save(update_fields=['extra_data'])
+        return {'claims_changed': False}
+
+    social.set_extra_data(extra_data)
+    return {'claims_changed': True}
+
+
+def sync_auth0_profile(user=None, uid=None, social=None, claims_changed=True, *args, **kwargs):
+    """
+    Copy the social association's extra_data to the user's Auth0Profile when AUTH0_USER_DATA_STORAGE is 'one_to_one'.
+
+    With unchanged claims only the tokens of this login are copied, and only when they differ from the profile's.
+    """
+    if auth0_user_settings.USER_DATA_STORAGE != USER_DATA_STORAGE_ONE_TO_ONE or not user or not social:
+        return
+    try:
+        profile_extra_data = user.auth0_profile.extra_data
+    except Auth0Profile.DoesNotExist:
+        profile_extra_data = None
+    if claims_changed or profile_extra_data is None:
+        store_auth0_profile(user, uid, social.extra_data)
+        return
+    token_data = login_token_data(social.extra_data)
+    if any(profile_extra_data.get(_key) != _value for _key, _value in token_data.items()):
+        store_auth0_profile(user, uid, dict(profile_extra_data, **token_data))
+
+
+def user_details(strategy, details, user=None, claims_changed=True, *args, **kwargs):
+    """
+    Replacement for `social_core.pipeline.user.user_details` that is skipped entirely when the claims are unchanged.
+    """
+    if not claims_changed:
+        return
+    return social_user_details(strategy, details, *args, user=user, **kwargs)
+
+
+def provision_auth0_user(backend, details, response, uid, user=None, *args, **kwargs):
+    """
+    Replaces the `social_user` through `user_details` steps with a single upsert.
+
+    See `django_auth0_user.provisioning.upsert_auth0_user` for the statements this issues.
+    """
+    extra_data = backend.extra_data(user, uid, response, details, *args, **kwargs)
+    try:
+        social_user, social, created, changed = upsert_auth0_user(
+            uid, details, extra_data, provider=backend.name, user=user, claims=response
+        )
+    except IntegrityError:
+        # Another user already has this uid as their username, but is not associated with it.
+        raise AuthAlreadyAssociated(backend, 'This account is already in use.')
+    if user and social_user != user:
+        raise AuthAlreadyAssociated(backend, 'This account is already in use.')
+    return {
+        'user': social_user,
+        'social': social,
+        'is_new': created,
+        'new_association': created,
+        'claims_changed': changed,
+    }
+
+
+def sync_permission_flags(user=None, social=None, claims_changed=True, *args, **kwargs):
+    """
+    Store the results of the configured is_superuser, is_staff and is_active checks on the user row.
+
+    The checks read the Auth0 claims, so this is skipped when the claims are unchanged,
+    and the user is only saved when a flag actually changed.
+    """
+    if not user or not claims_changed:
+        return
+    if auth0_user_settings.USER_DATA_STORAGE != USER_DATA_STORAGE_ONE_TO_ONE and social and social.user_id == user.pk:
+        # Hand the extra_data the pipeline already holds to user.auth0_data,
+        # otherwise every metadata lookup made by the checks queries it again.
+        user.use_auth0_data(social.extra_data)
+    changed_fields = evaluate_permission_flags(user)
+    if changed_fields:
+        user.save(update_fields=changed_fields)
+
+
+def sync_rbac_groups(user=None, response=None, *args, **kwargs):
+    """
+    Sync the user's AUTH0_RBAC_MAP groups from the 'permissions' claim of the access token issued for this login.
+
+    The sync is skipped while the permissions digest is unchanged, see `django_auth0_user.rbac.sync_user_groups`.
+    """
+    if not user or not response or not compile_rbac_map().managed_groups:
+        return
+    from jwt import decode as jwt_decode
+    from jwt import DecodeError
+    try:
+        # The token was just received from Auth0's token endpoint, alongside the id_token validated by the backend.
+        payload = jwt_decode(response.get('access_token') or '', verify=False)
+    except DecodeError:
+        # Opaque access tokens, issued when no API audience was requested, carry no permissions.
+        return
+    sync_user_groups(user, payload.get('permissions', ()))
+
+
+def store_user_tokens(user=None, response=None, *args, **kwargs):
+    """
+    Track the user's access token for `django_auth0_user.user_tokens`, when Auth0 issued a refresh token with it.
+    """
+    if not user or not response:
+        return
+    store_user_token(user, response)
@@ -0,0 +1,354 @@
+import hashlib
+import json
+import logging
+import threading
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from social_core.utils import setting_name
+from social_django.models import UserSocialAuth
+
+from django_auth0_user.models import Auth0Profile
+from django_auth0_user.settings import auth0_user_settings
+from django_auth0_user.settings import USER_DATA_STORAGE_ONE_TO_ONE
+
+
+logger = logging.getLogger(__name__)
+
+
+# Token payloads kept in the extra_data, their per-token claims are left out of the claims digest.
+TOKEN_PAYLOAD_KEYS = ('id_token_payload', 'access_token_payload')
+
+# Length of the random suffix added to a username that is already taken, as social_core's default UUID_LENGTH.
+USERNAME_SUFFIX_LENGTH = 16
+
+# User fields filled from the provider details.
+USER_DETAIL_FIELDS = ('email', 'first_name', 'last_name')
+
+# Never updated from the provider details of a returning user, as in social_core's `user_details` step.
+DEFAULT_PROTECTED_USER_FIELDS = ('username', 'id', 'pk', 'email', 'password', 'is_active', 'is_staff', 'is_superuser')
+
+
+def claims_digest(extra_data):
+    """
+    Return a digest of the parts of the extra_data that only change when the user's Auth0 profile changes.
+
+    Tokens, timestamps and nonces differ on every login, so they are stripped
+    before hashing, otherwise every login would look like a profile change.
+
+    :param dict extra_data: The extra_data as built by the backend.
+    :return: A hex digest string.
+    """
+    volatile_keys = auth0_user_settings.VOLATILE_EXTRA_DATA_KEYS
+    volatile_claims = auth0_user_settings.VOLATILE_CLAIMS
+    stable_data = {_key: _value for _key, _value in extra_data.items() if _key not in volatile_keys}
+    for _payload_key in TOKEN_PAYLOAD_KEYS:
+        if isinstance(stable_data.get(_payload_key), dict):
+            stable_data[_payload_key] = {
+                _key: _value for _key, _value in stable_data[_payload_key].items() if _key not in volatile_claims
+            }
+    serialised = json.dumps(stable_data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(serialised.encode('utf-8')).hexdigest()
+
+
+def login_token_data(extra_data):
+    """
+    Return the parts of the extra_data that are left out of the claims digest, the tokens of this login and their payloads.
+
+    They still have to be stored on a login with an unchanged digest, otherwise the first login's tokens are kept.
+    """
+    keys = tuple(auth0_user_settings.VOLATILE_EXTRA_DATA_KEYS) + TOKEN_PAYLOAD_KEYS
+    return {_key: extra_data[_key] for _key in keys if _key in extra_data}
+
+
+def store_auth0_profile(user, uid, extra_data):
+    """
+    Write the Auth0 data for a user to its Auth0Profile, creating the profile if it does not exist yet.
+
+    :return: The Auth0Profile.
+    """
+    profile = Auth0Profile(user=user, uid=uid, extra_data=extra_data)
+    if not Auth0Profile.objects.filter(pk=user.pk).update(uid=uid, extra_data=extra_data, updated_at=timezone.now()):
+        profile.save(force_insert=True)
+    user.auth0_profile = profile
+    return profile
+
+
+def imported_django_user(uid, claims, provider='auth0'):
+    """
+    Return the Django user `import_users_to_auth0` created this Auth0 user from, None when there is none.
+
+    The import records the user's pk in app_metadata.django_user_id, which only the Management API can change,
+    so unlike the profile fields it can be trusted to link the accounts. Users already associated with an
+    Auth0 account are never returned.
+
+    :param str uid: The Auth0 user id.
+    :param dict claims: The verified token claims, with the app_metadata added by the metadata rule.
+    :param str provider: The social auth provider name.
+    """
+    from django_auth0_user.token_user import Auth0TokenUser
+    django_user_id = (Auth0TokenUser(dict(claims, sub=uid)).app_metadata or {}).get('django_user_id')
+    if django_user_id is None:
+        return None
+    User = get_user_model()
+    return User._default_manager.filter(pk=django_user_id).exclude(social_auth__provider=provider).first()
+
+
+def _auth0_username(uid, details):
+    if auth0_user_settings.USER_ID_IS_DJANGO_USERNAME:
+        return uid
+    return details.get('username') or uid
+
+
+def _unique_username(username):
+    """
+    Add a random suffix to a username that is already taken, like social_core's `get_username` step does.
+    """
+    User = get_user_model()
+    max_length = User._meta.get_field(User.USERNAME_FIELD).max_length
+    final_username = username
+    while User._default_manager.filter(**{User.USERNAME_FIELD: final_username}).exists():
+        final_username = username[:max_length - USERNAME_SUFFIX_LENGTH] + uuid4().hex[:USERNAME_SUFFIX_LENGTH]
+    return final_username
+
+
+def _social_setting(name, provider, default=None):
+    # Looked up like social_core's strategy does, the provider specific setting first.
+    for _name in (setting_name(provider, name), setting_name(name)):
+        if hasattr(settings, _name):
+            return getattr(settings, _name)
+    return default
+
+
+def updatable_user_fields(provider='auth0'):
+    """
+    The USER_DETAIL_FIELDS social_core's `user_details` step would update for a returning user.
+
+    Like social_core 3.3, fields are only left alone when they are protected: the defaults unless
+    SOCIAL_AUTH_NO_DEFAULT_PROTECTED_USER_FIELDS is True, plus SOCIAL_AUTH_PROTECTED_USER_FIELDS.
+    """
+    protected = () if _social_setting('NO_DEFAULT_PROTECTED_USER_FIELDS', provider) is True \
+        else DEFAULT_PROTECTED_USER_FIELDS
+    protected += tuple(_social_setting('PROTECTED_USER_FIELDS', provider, []))
+    return tuple(_field for _field in USER_DETAIL_FIELDS if _field not in protected)
+
+
+def _one_to_one_storage():
+    return auth0_user_settings.USER_DATA_STORAGE == USER_DATA_STORAGE_ONE_TO_ONE
+
+
+def _stored_extra_data(social):
+    if not _one_to_one_storage():
+        return social.extra_data
+    try:
+        return social.user.auth0_profile.extra_data
+    except Auth0Profile.DoesNotExist:
+        return {}
+
+
+def _store_extra_data(social, extra_data):
+    if not _one_to_one_storage():
+        social.extra_data = extra_data
+        UserSocialAuth.objects.filter(pk=social.pk).update(extra_data=extra_data)
+        return
+    store_auth0_profile(social.user, social.uid, extra_data)
+
+
+def _create_social(user, uid, provider, extra_data):
+    if not _one_to_one_storage():
+        return UserSocialAuth.objects.create(user=user, provider=provider, uid=uid, extra_data=extra_data)
+    # In one-to-one mode the association only exists for python-social-auth's own bookkeeping.
+    social = UserSocialAuth.objects.create(user=user, provider=provider, uid=uid, extra_data={})
+    user.auth0_profile = Auth0Profile.objects.create(user=user, uid=uid, extra_data=extra_data)
+    return social
+
+
+def _upsert_auth0_user(uid, details, extra_data, provider, user, username=None, create_only=False, claims=None):
+    User = get_user_model()
+
+    social_queryset = UserSocialAuth.objects.select_related('user')
+    if _one_to_one_storage():
+        social_queryset = social_queryset.select_related('user__auth0_profile')
+    try:
+        social = social_queryset.get(provider=provider, uid=uid)
+    except UserSocialAuth.DoesNotExist:
+        social = None
+
+    if social is None and user is None and claims:
+        user = imported_django_user(uid, claims, provider)
+
+    if social is None and user is not None:
+        social = _create_social(user, uid, provider, extra_data)
+        return user, social, False, True
+
+    if social is None:
+        user = User(**{
+            User.USERNAME_FIELD: username or _auth0_username(uid, details),
+            **{_field: details[_field] for _field in USER_DETAIL_FIELDS if details.get(_field)},
+        })
+        user.set_unusable_password()
+        user.save(force_insert=True)
+        social = _create_social(user, uid, provider, extra_data)
+        return user, social, True, True
+
+    user = social.user
+    if create_only:
+        return user, social, False, False
+    stored_extra_data = _stored_extra_data(social)
+    if stored_extra_data and stored_extra_data.get('claims_digest') == extra_data['claims_digest']:
+        # Only the tokens of this login are new, see `login_token_data`.
+        token_data = login_token_data(extra_data)
+        if any(stored_extra_data.get(_key) != _value for _key, _value in token_data.items()):
+            _store_extra_data(social, dict(stored_extra_data, **token_data))
+        return user, social, False, False
+
+    _store_extra_data(social, extra_data)
+
+    changed_fields = []
+    for _field in updatable_user_fields(provider):
+        if details.get(_field) is not None and getattr(user, _field, None) != details[_field]:
+            setattr(user, _field, details[_field])
+            changed_fields.append(_field)
+    if changed_fields:
+        user.save(update_fields=changed_fields)
+
+    return user, social, False, True
+
+
+def upsert_auth0_user(uid, details, extra_data, provider='auth0', user=None, create_only=False, claims=None):
+    """
+    Create or update a user and its social association in a single transaction.
+
+    Auth0's `sub` is a stable unique id, so usernames are not checked for collisions up front. When the username
+    turns out to be taken by another user, the insert is retried with a suffixed username, unless the username is
+    the uid (AUTH0_USER_ID_IS_DJANGO_USERNAME), then the IntegrityError is raised rather than taking over that user.
+    A returning user costs one joined SELECT, plus one UPDATE per table whose data actually changed, the tokens of
+    each login included. A new user costs one SELECT and two INSERTs,
+    plus an Auth0Profile INSERT when AUTH0_USER_DATA_STORAGE is 'one_to_one', in which
+    case the extra_data is stored on the profile instead of the social association.
+
+    :param str uid: The Auth0 user id (the `sub` claim).
+    :param dict details: The user details as returned by the backend's get_user_details.
+    :param dict extra_data: The extra_data to store on the social association.
+    :param str provider: The social auth provider name.
+    :param user: An already authenticated user to associate with, when the uid is not associated yet.
+    :param bool create_only: Leave an existing association and its user as they are, only one SELECT is issued.
+    :param dict claims: The token claims, a new uid is associated with the user they name as imported from,
+        see `imported_django_user`.
+    :return: A tuple of (user, social, created, changed).
+    """
+    extra_data = dict(extra_data, claims_digest=claims_digest(extra_data))
+    try:
+        with transaction.atomic():
+            return _upsert_auth0_user(uid, details, extra_data, provider, user, create_only=create_only, claims=claims)
+    except IntegrityError:
+        if UserSocialAuth.objects.filter(provider=provider, uid=uid).exists():
+            # A concurrent first login for the same uid won the race, so the rows exist now.
+            with transaction.atomic():
+                return _upsert_auth0_user(uid, details, extra_data, provider, user, create_only=create_only,
+                                          claims=claims)
+        if user is not None or auth0_user_settings.USER_ID_IS_DJANGO_USERNAME:
+            raise
+        username = _unique_username(_auth0_username(uid, details))
+        with transaction.atomic():
+            return _upsert_auth0_user(
+                uid, details, extra_data, provider, user, username=username, create_only=create_only, claims=claims
+            )
+
+
+def provision_auth0_user_from_claims(claims, access_token, provider='auth0'):
+    """
+    Create a user straight from a verified access token's claims, without calling Auth0's userinfo endpoint.
+
+    The claims are stored in the extra_data under 'access_token_payload', so the user and app metadata injected by
+    the EXAMPLE_METADATA_RULE_FUNCTION rule are available on the user straight away. This only happens when the
+    association is created, an existing one keeps the extra_data and tokens stored by its last login. When
+    AUTH0_JIT_PROFILE_ENRICHMENT_HANDLER is set it is called with the new user's pk and uid once the user is committed.
+
+    The caller is responsible for verifying the token's signature, issuer and audience before calling this.
+
+    :param dict claims: The verified access token payload.
+    :param str access_token: The raw access token.
+    :param str provider: The social auth provider name.
+    :return: A tuple of (user, created).
+    :raises IntegrityError: When a concurrent call created the user first, or the uid is the username of another
+        user while AUTH0_USER_ID_IS_DJANGO_USERNAME is set.
+    """
+    uid = claims['sub']
+    details = {
+        'username': uid,
+        'email': claims.get('email', ''),
+        'first_name': claims.get('given_name', ''),
+        'last_name': claims.get('family_name', ''),
+    }
+    extra_data = {
+        'auth_time': claims.get('auth_time') or claims.get('iat'),
+        'id': uid,
+        'access_token': access_token,
+        'token_type': 'Bearer',
+        'id_token': None,
+        'refresh_token': None,
+        'access_token_payload': claims,
+    }
+    user, social, created, changed = upsert_auth0_user(
+        uid, details, extra_data, provider=provider, create_only=True, claims=claims
+    )
+    if created and auth0_user_settings.JIT_PROFILE_ENRICHMENT_HANDLER is not None:
+        handler = import_string(auth0_user_settings.JIT_PROFILE_ENRICHMENT_HANDLER)
+        user_pk = user.pk
+        transaction.on_commit(lambda: handler(user_pk, uid))
+    return user, created
+
+
+def enrich_auth0_user(user_pk, uid):
+    """
+    Fill in a JIT provisioned user's empty detail fields from their full Auth0 profile.
+
+    :param user_pk: The Django user's primary key.
+    :param str uid: The Auth0 user id.
+    :return: The list of user fields that were updated.
+    """
+    # Imported here so provisioning does not need the Management API settings unless enrichment is used.
+    from django_auth0_user.util.auth0_api import get_auth0_user
+
+    auth0_user = get_auth0_user(uid, fields='profile')
+    profile_values = {
+        'email': auth0_user.get('email'),
+        'first_name': auth0_user.get('given_name'),
+        'last_name': auth0_user.get('family_name'),
+    }
+    user = get_user_model()._default_manager.get(pk=user_pk)
+    changed_fields = []
+    for _field in USER_DETAIL_FIELDS:
+        if profile_values.get(_field) and not getattr(user, _field, None):
+            setattr(user, _field, profile_values[_field])
+            changed_fields.append(_field)
+    if changed_fields:
+        user.save(update_fields=changed_fields)
+    return changed_fields
+
+
+def _enrich_auth0_user_thread(user_pk, uid):
+    try:
+        enrich_auth0_user(user_pk, uid)
+    except Exception:
+        logger.exception('Failed to enrich the Auth0 profile for user %s.', uid)
+    finally:
+        connection.close()
+
+
+def enrich_auth0_user_async(user_pk, uid):
+    """
+    Run `enrich_auth0_user` on a daemon thread, so the request that provisioned the user does not wait on Auth0.
+
+    This is a simple default for AUTH0_JIT_PROFILE_ENRICHMENT_HANDLER, the work is lost if the process exits first.
+    """
+    thread = threading.Thread(target=_enrich_auth0_user_thread, args=(user_pk, uid), daemon=True)
+    thread.start()
+    return thread
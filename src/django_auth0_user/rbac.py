@@ -0,0 +1,112 @@
+import hashlib
+from collections import namedtuple
+from functools import lru_cache
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.signals import setting_changed
+
+from django_auth0_user.settings import auth0_user_settings
+
+
+# The last synced permissions and map digest per user, so group membership is only rewritten when either changes.
+RBAC_GROUPS_CACHE_KEY = 'django_auth0_user:rbac:groups:{}'
+
+
+RBACTables = namedtuple('RBACTables', ('groups', 'permissions', 'managed_groups', 'digest'))
+
+
+@lru_cache(maxsize=None)
+def compile_rbac_map():
+    """
+    Compile AUTH0_RBAC_MAP into frozenset lookup tables, once per process.
+
+    :return: An RBACTables of Auth0 permission to group names, Auth0 permission to Django permissions,
+        the set of every group name the map manages, and a digest of the group mapping.
+    """
+    groups = {}
+    permissions = {}
+    for auth0_permission, mapping in auth0_user_settings.RBAC_MAP.items():
+        groups[auth0_permission] = frozenset(mapping.get('groups', ()))
+        permissions[auth0_permission] = frozenset(mapping.get('permissions', ()))
+    serialised = '\n'.join('{}:{}'.format(_permission, ','.join(sorted(groups[_permission]))) for _permission in sorted(groups))
+    digest = hashlib.sha1(serialised.encode('utf-8')).hexdigest()
+    return RBACTables(groups, permissions, frozenset().union(*groups.values()), digest)
+
+
+@lru_cache(maxsize=1024)
+def groups_for(auth0_permissions):
+    """
+    :param frozenset auth0_permissions: The Auth0 permissions from a token.
+    :return: A frozenset of the Django group names they map to.
+    """
+    tables = compile_rbac_map()
+    return frozenset().union(*(tables.groups.get(_permission, ()) for _permission in auth0_permissions))
+
+
+@lru_cache(maxsize=1024)
+def django_permissions_for(auth0_permissions):
+    """
+    :param frozenset auth0_permissions: The Auth0 permissions from a token.
+    :return: A frozenset of the 'app_label.codename' Django permissions they map to.
+    """
+    tables = compile_rbac_map()
+    return frozenset().union(*(tables.permissions.get(_permission, ()) for _permission in auth0_permissions))
+
+
+def reset_rbac_map():
+    """Drop the compiled tables, so the next lookup recompiles them from the current AUTH0_RBAC_MAP."""
+    compile_rbac_map.cache_clear()
+    groups_for.cache_clear()
+    django_permissions_for.cache_clear()
+
+
+def reset_rbac_map_on_setting_changed(*args, **kwargs):
+    if kwargs['setting'] in ('AUTH0_RBAC_MAP', 'SOCIAL_AUTH_AUTH0_RBAC_MAP'):
+        reset_rbac_map()
+
+
+setting_changed.connect(reset_rbac_map_on_setting_changed)
+
+
+def permissions_digest(auth0_permissions, map_digest=''):
+    serialised = '\n'.join([map_digest] + sorted(auth0_permissions))
+    return hashlib.sha1(serialised.encode('utf-8')).hexdigest()
+
+
+def sync_user_groups(user, auth0_permissions):
+    """
+    Make the user's membership of the groups in AUTH0_RBAC_MAP match their Auth0 permissions.
+
+    Groups the map does not mention are left alone, unless the last sync added the user to them before the map
+    changed. A digest of the last synced permissions and group mapping is kept in Django's cache for
+    AUTH0_RBAC_GROUPS_SYNC_INTERVAL seconds, so while neither changes this costs a single cache lookup.
+    Once it expires the next login syncs again, which also undoes group edits made outside this function.
+
+    :param user: The Django user.
+    :param auth0_permissions: The Auth0 permissions from the user's token.
+    :return: True if the membership was synced, False if it was already up to date.
+    """
+    tables = compile_rbac_map()
+    if not tables.managed_groups:
+        return False
+
+    auth0_permissions = frozenset(auth0_permissions)
+    cache_key = RBAC_GROUPS_CACHE_KEY.format(user.pk)
+    digest = permissions_digest(auth0_permissions, tables.digest)
+    last_digest, last_synced_groups = cache.get(cache_key) or (None, frozenset())
+    if last_digest == digest:
+        return False
+
+    wanted_groups = groups_for(auth0_permissions)
+    checked_groups = tables.managed_groups | last_synced_groups
+    current_groups = set(user.groups.filter(name__in=checked_groups).values_list('name', flat=True))
+    if wanted_groups - current_groups:
+        Group.objects.bulk_create([Group(name=_name) for _name in wanted_groups - current_groups],
+                                  ignore_conflicts=True)
+        user.groups.add(*Group.objects.filter(name__in=wanted_groups - current_groups))
+    if current_groups - wanted_groups:
+        user.groups.remove(*Group.objects.filter(name__in=current_groups - wanted_groups))
+
+    cache.set(cache_key, (digest, wanted_groups), auth0_user_settings.RBAC_GROUPS_SYNC_INTERVAL)
+    return True
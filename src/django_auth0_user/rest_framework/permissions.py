@@ -0,0 +1,61 @@
+from functools import lru_cache
+
+from rest_framework.permissions import BasePermission
+
+
+# The key in a per-action `required_scopes` dict that applies to actions without their own entry.
+DEFAULT_ACTION_KEY = '*'
+
+
+@lru_cache(maxsize=None)
+def compile_required_scopes(view_class):
+    """
+    Compile a view class's `required_scopes` into frozensets, once per view class.
+
+    :return: A frozenset for a list of scopes, or a dict of action names to frozensets for a per-action dict.
+    """
+    required_scopes = getattr(view_class, 'required_scopes', None) or ()
+    if isinstance(required_scopes, dict):
+        return {_action: frozenset(_scopes) for _action, _scopes in required_scopes.items()}
+    return frozenset(required_scopes)
+
+
+def get_granted_scopes(request):
+    """
+    Return the scopes and RBAC permissions granted by the request's verified Auth0 token, as a frozenset.
+
+    The claims are only read once per request, the result is cached on the request.
+    """
+    granted_scopes = getattr(request, '_auth0_granted_scopes', None)
+    if granted_scopes is None:
+        payload = getattr(request, 'auth0_token_payload', None) or {}
+        granted_scopes = frozenset(payload.get('scope', '').split()) | frozenset(payload.get('permissions', ()))
+        request._auth0_granted_scopes = granted_scopes
+    return granted_scopes
+
+
+class HasRequiredScopes(BasePermission):
+    """
+    Allows access only when the verified Auth0 token grants every scope the view declares in `required_scopes`.
+
+    Both the token's 'scope' claim and its RBAC 'permissions' claim count as granted scopes.
+    `required_scopes` is either a list for the whole view, or for viewsets a dict of action names to lists,
+    where actions without an entry use the '*' entry, and require nothing if there is no '*' entry either.
+
+        class GroupViewSet(viewsets.ModelViewSet):
+            permission_classes = [IsAuthenticated, HasRequiredScopes]
+            required_scopes = {'*': ['read:groups'], 'create': ['read:groups', 'write:groups']}
+
+    Requests authenticated without a verified token payload, e.g. by FullAuth0Authentication,
+    are granted no scopes.
+    """
+    message = 'The token does not grant the scopes required for this request.'
+
+    def has_permission(self, request, view):
+        required_scopes = compile_required_scopes(view.__class__)
+        if isinstance(required_scopes, dict):
+            action = getattr(view, 'action', None)
+            required_scopes = required_scopes.get(action, required_scopes.get(DEFAULT_ACTION_KEY, frozenset()))
+        if not required_scopes:
+            return True
+        return required_scopes <= get_granted_scopes(request)
@@ -1,87 +1,20 @@
+import sys
+from types import ModuleType
+
 from django.conf import settings
+from django.core.signals import setting_changed
 
 
-if getattr(settings, 'AUTH0_DOMAIN', None) is not None:
-    AUTH0_DOMAIN = settings.AUTH0_DOMAIN
-elif getattr(settings, 'SOCIAL_AUTH_AUTH0_DOMAIN', None) is not None:
-    AUTH0_DOMAIN = settings.SOCIAL_AUTH_AUTH0_DOMAIN
-else:
-    AUTH0_DOMAIN = None
-
-AUTH0_API_URL = 'https://' + AUTH0_DOMAIN + '/api/v2/'
-
-if getattr(settings, 'AUTH0_OIDC_ENDPOINT', None) is not None:
-    AUTH0_OIDC_ENDPOINT = settings.AUTH0_OIDC_ENDPOINT
-elif getattr(settings, 'SOCIAL_AUTH_AUTH0_OIDC_ENDPOINT', None) is not None:
-    AUTH0_OIDC_ENDPOINT = settings.SOCIAL_AUTH_AUTH0_OIDC_ENDPOINT
-else:
-    AUTH0_OIDC_ENDPOINT = None
-
-if getattr(settings, 'AUTH0_USER_ID_IS_DJANGO_USERNAME', None) is not None:
-    USER_ID_IS_DJANGO_USERNAME = settings.AUTH0_USER_ID_IS_DJANGO_USERNAME
-if getattr(settings, 'SOCIAL_AUTH_AUTH0_USER_ID_IS_DJANGO_USERNAME', None) is not None:
-    USER_ID_IS_DJANGO_USERNAME = settings.SOCIAL_AUTH_AUTH0_USER_ID_IS_DJANGO_USERNAME
-else:
-    USER_ID_IS_DJANGO_USERNAME = True
-
-
-#
-
-
-# ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
-# ┃  Auth0 Management API Settings  ┃▓▓
-# ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
-#   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
-if getattr(settings, 'AUTH0_MANAGEMENT_API_CLIENT_ID', None) is not None:
-    AUTH0_MANAGEMENT_API_CLIENT_ID = settings.AUTH0_MANAGEMENT_API_CLIENT_ID
-if getattr(settings, 'SOCIAL_AUTH_AUTH0_MANAGEMENT_API_CLIENT_ID', None) is not None:
-    AUTH0_MANAGEMENT_API_CLIENT_ID = settings.SOCIAL_AUTH_AUTH0_MANAGEMENT_API_CLIENT_ID
-else:
-    AUTH0_MANAGEMENT_API_CLIENT_ID = None
-if getattr(settings, 'AUTH0_MANAGEMENT_API_CLIENT_SECRET', None) is not None:
-    AUTH0_MANAGEMENT_API_CLIENT_SECRET = settings.AUTH0_MANAGEMENT_API_CLIENT_SECRET
-if getattr(settings, 'SOCIAL_AUTH_AUTH0_MANAGEMENT_API_CLIENT_SECRET', None) is not None:
-    AUTH0_MANAGEMENT_API_CLIENT_SECRET = settings.SOCIAL_AUTH_AUTH0_MANAGEMENT_API_CLIENT_SECRET
-else:
-    AUTH0_MANAGEMENT_API_CLIENT_SECRET = None
-
-
-#
-
-
-# We need a namespace prefix provided by the user as there is not really a safe and unique default.
-if getattr(settings, 'AUTH0_NAMESPACED_KEY_PREFIX', None) is not None:
-    NAMESPACED_KEY_PREFIX = settings.AUTH0_NAMESPACED_KEY_PREFIX
-else:
-    NAMESPACED_KEY_PREFIX = ''
-
-
-if getattr(settings, 'AUTH0_NAMESPACED_USER_METADATA_KEY', None) is not None:
-    NAMESPACED_USER_METADATA_KEY = settings.AUTH0_NAMESPACED_USER_METADATA_KEY
-elif getattr(settings, 'SOCIAL_AUTH_AUTH0_NAMESPACED_USER_METADATA_KEY', None) is not None:
-    NAMESPACED_USER_METADATA_KEY = settings.SOCIAL_AUTH_AUTH0_NAMESPACED_USER_METADATA_KEY
-else:
-    NAMESPACED_USER_METADATA_KEY = NAMESPACED_KEY_PREFIX + '/user_metadata'
-
-if getattr(settings, 'AUTH0_NAMESPACED_APP_METADATA_KEY', None) is not None:
-    NAMESPACED_APP_METADATA_KEY = settings.AUTH0_NAMESPACED_APP_METADATA_KEY
-elif getattr(settings, 'SOCIAL_AUTH_AUTH0_NAMESPACED_APP_METADATA_KEY', None) is not None:
-    NAMESPACED_APP_METADATA_KEY = settings.SOCIAL_AUTH_AUTH0_NAMESPACED_APP_METADATA_KEY
-else:
-    NAMESPACED_APP_METADATA_KEY = NAMESPACED_KEY_PREFIX + '/app_metadata'
-
-
-DEFAULT_AUTH0_RULE_CONFIGS = {
-        'DJANGO_AUTH0_USER_OIDC_NAMESPACE_PREFIX': NAMESPACED_KEY_PREFIX,
-        'DJANGO_AUTH0_USER_NAMESPACED_USER_METADATA_KEY': NAMESPACED_USER_METADATA_KEY,
-        'DJANGO_AUTH0_USER_NAMESPACED_APP_METADATA_KEY': NAMESPACED_APP_METADATA_KEY,
-    }
-if getattr(settings, 'AUTH0_RULE_CONFIGS', None) is not None:
-    AUTH0_RULE_CONFIGS = settings.AUTH0_RULE_CONFIGS
-elif getattr(settings, 'SOCIAL_AUTH_AUTH0_RULE_CONFIGS', None) is not None:
-    AUTH0_RULE_CONFIGS = settings.SOCIAL_AUTH_AUTH0_RULE_CONFIGS
-else:
-    AUTH0_RULE_CONFIGS = DEFAULT_AUTH0_RULE_CONFIGS
+# Where the Auth0 data for a user is read from. 'social_auth' uses the social_django UserSocialAuth reverse foreign key,
+# 'one_to_one' uses the Auth0Profile model, which can be loaded along with the user in a single select_related query.
+USER_DATA_STORAGE_SOCIAL_AUTH = 'social_auth'
+USER_DATA_STORAGE_ONE_TO_ONE = 'one_to_one'
+
+# Keys in the social auth extra_data that change on every login and so are left out of the claims digest.
+DEFAULT_VOLATILE_EXTRA_DATA_KEYS = ('auth_time', 'access_token', 'id_token', 'expires', 'token_type', 'claims_digest')
+
+# Claims inside the id_token or access_token payloads that change on every login and so are left out of the claims digest.
+DEFAULT_VOLATILE_CLAIMS = ('iat', 'exp', 'nbf', 'auth_time', 'nonce', 'at_hash', 'c_hash', 'sid', 'jti')
 
 
 # TODO: Decide if this should keep living here or belongs in test settings...
@@ -115,9 +48,203 @@ DEFAULT_AUTH0_RULES = {
             "order": 1,
         }
     }
-if getattr(settings, 'AUTH0_RULES', None) is not None:
-    AUTH0_RULES = settings.AUTH0_RULES
-elif getattr(settings, 'SOCIAL_AUTH_AUTH0_RULES', None) is not None:
-    AUTH0_RULES = settings.SOCIAL_AUTH_AUTH0_RULES
-else:
-    AUTH0_RULES = DEFAULT_AUTH0_RULES
+
+
+def _default_rule_configs(auth0_user_settings):
+    return {
+        'DJANGO_AUTH0_USER_OIDC_NAMESPACE_PREFIX': auth0_user_settings.NAMESPACED_KEY_PREFIX,
+        'DJANGO_AUTH0_USER_NAMESPACED_USER_METADATA_KEY': auth0_user_settings.NAMESPACED_USER_METADATA_KEY,
+        'DJANGO_AUTH0_USER_NAMESPACED_APP_METADATA_KEY': auth0_user_settings.NAMESPACED_APP_METADATA_KEY,
+    }
+
+
+# Every setting is read from the Django setting AUTH0_<NAME>, then SOCIAL_AUTH_AUTH0_<NAME>, where <NAME> is the key
+# below without its own 'AUTH0_' prefix, and otherwise takes the default here.
+# A callable default is called with the settings object, for defaults derived from other settings.
+DEFAULTS = {
+    'AUTH0_DOMAIN': None,
+    'AUTH0_API_URL': lambda _settings: 'https://' + _settings.AUTH0_DOMAIN + '/api/v2/',
+    'AUTH0_OIDC_ENDPOINT': None,
+    # Read once, when AbstractAuth0User's username field is defined, so overriding it afterwards has no effect there.
+    'USER_ID_IS_DJANGO_USERNAME': True,
+    'USER_DATA_STORAGE': USER_DATA_STORAGE_SOCIAL_AUTH,
+    # When True, the browser login builds the user details from the validated id_token claims and skips the userinfo
+    # call. The id_token must carry everything the pipeline needs, e.g. the metadata claims added by
+    # EXAMPLE_METADATA_RULE_FUNCTION.
+    'USER_DETAILS_FROM_ID_TOKEN': False,
+
+    # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+    # ┃  Auth0 Management API Settings  ┃▓▓
+    # ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
+    #   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
+    'AUTH0_MANAGEMENT_API_CLIENT_ID': None,
+    'AUTH0_MANAGEMENT_API_CLIENT_SECRET': None,
+    # Seconds that users fetched with get_auth0_user or get_auth0_users are kept in Django's cache, 0 disables caching.
+    'AUTH0_MANAGEMENT_API_USER_CACHE_TTL': 300,
+    # Management API requests per second made by the bulk helpers, keep this under your tenant's rate limit.
+    'AUTH0_MANAGEMENT_API_RATE_LIMIT': 2,
+
+    # We need a namespace prefix provided by the user as there is not really a safe and unique default.
+    'NAMESPACED_KEY_PREFIX': '',
+    'NAMESPACED_USER_METADATA_KEY': lambda _settings: _settings.NAMESPACED_KEY_PREFIX + '/user_metadata',
+    'NAMESPACED_APP_METADATA_KEY': lambda _settings: _settings.NAMESPACED_KEY_PREFIX + '/app_metadata',
+
+    # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+    # ┃  Login Pipeline Write Settings  ┃▓▓
+    # ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
+    #   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
+    'VOLATILE_EXTRA_DATA_KEYS': DEFAULT_VOLATILE_EXTRA_DATA_KEYS,
+    'VOLATILE_CLAIMS': DEFAULT_VOLATILE_CLAIMS,
+    # Minimum number of seconds between last_login writes for a user, None keeps Django's write-every-login behaviour.
+    'LAST_LOGIN_GRANULARITY': None,
+
+    # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+    # ┃  Just In Time Provisioning      ┃▓▓
+    # ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
+    #   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
+    # When True, FastAuth0Authentication creates unknown users straight from the verified access token claims
+    # instead of falling through to FullAuth0Authentication and its userinfo round trip.
+    'JIT_PROVISIONING': False,
+    # Dotted path to a callable taking (user_pk, uid), run once a JIT provisioned user is committed, to fetch the full
+    # profile from the Management API. None disables enrichment. 'django_auth0_user.provisioning.enrich_auth0_user_async'
+    # runs it on a thread, for production point this at a function that hands it to your task queue instead.
+    'JIT_PROFILE_ENRICHMENT_HANDLER': None,
+
+    # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+    # ┃  Auth0 RBAC Settings            ┃▓▓
+    # ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
+    #   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
+    # Maps Auth0 RBAC permissions, as found in the token's 'permissions' claim, to Django group names and permissions.
+    # e.g. {'read:groups': {'groups': ['Group Readers'], 'permissions': ['auth.view_group']}}
+    'RBAC_MAP': {},
+    # Seconds a user's synced group membership is trusted for, before the next login checks it against the map again.
+    'RBAC_GROUPS_SYNC_INTERVAL': 3600,
+
+    # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+    # ┃  Auth0 Log Stream Settings      ┃▓▓
+    # ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
+    #   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
+    # The "Authorization Token" configured on the Auth0 custom webhook log stream, the receiver rejects everything
+    # without it.
+    'LOG_STREAM_SECRET': None,
+    # Seconds the log stream worker waits to gather a batch before applying it.
+    'LOG_STREAM_FLUSH_INTERVAL': 1,
+
+    # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+    # ┃  Auth0 Access Token Cache       ┃▓▓
+    # ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
+    #   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
+    # Seconds before a cached client credentials token expires that it is replaced with a new one.
+    'TOKEN_REFRESH_MARGIN': 300,
+    # The alias of a Django cache to share client credentials tokens between processes, each process keeps its own
+    # when None.
+    'TOKEN_SHARED_CACHE': None,
+
+    # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+    # ┃  Auth0 User Token Refresh       ┃▓▓
+    # ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
+    #   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
+    # The Auth0 application users log in through, its refresh tokens are exchanged with these credentials.
+    'CLIENT_ID': None,
+    'CLIENT_SECRET': None,
+    # Seconds before a user's access token expires that the refresh worker replaces it.
+    'USER_TOKEN_REFRESH_MARGIN': 600,
+
+    # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+    # ┃  Auth0 Warm Up Settings         ┃▓▓
+    # ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛▓▓
+    #   ▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓
+    # When True, the app's ready() fetches the Management API token, OIDC discovery document and JWKS at startup,
+    # in processes that serve requests, management commands other than runserver skip it.
+    'WARMUP_ON_READY': False,
+    # Seconds the warm up waits for the fetches, any still running carry on in the background.
+    'WARMUP_TIMEOUT': 10,
+
+    'AUTH0_RULE_CONFIGS': _default_rule_configs,
+    'AUTH0_RULES': DEFAULT_AUTH0_RULES,
+}
+
+# The Django settings read for settings that do not follow the AUTH0_<NAME> / SOCIAL_AUTH_AUTH0_<NAME> pattern.
+SETTING_NAMES = {
+    'AUTH0_API_URL': (),
+    'CLIENT_ID': ('SOCIAL_AUTH_AUTH0_KEY',),
+    'CLIENT_SECRET': ('SOCIAL_AUTH_AUTH0_SECRET',),
+}
+
+
+def setting_names(name):
+    """
+    Return the Django settings a django_auth0_user setting is read from, in order.
+    """
+    if name in SETTING_NAMES:
+        return SETTING_NAMES[name]
+    if name.startswith('AUTH0_'):
+        name = name[len('AUTH0_'):]
+    return 'AUTH0_' + name, 'SOCIAL_AUTH_AUTH0_' + name
+
+
+class Auth0UserSettings(object):
+    """
+    The django_auth0_user settings, resolved from the Django settings on first access and then cached.
+
+    In the style of Django REST framework's `api_settings`. Nothing is read from the Django settings until a
+    setting is used, and the cache is cleared when a test changes an AUTH0_* or SOCIAL_AUTH_AUTH0_* setting.
+    """
+
+    def __init__(self, defaults=None):
+        self.defaults = DEFAULTS if defaults is None else defaults
+        self._cached_attrs = set()
+
+    def __getattr__(self, attr):
+        if attr not in self.defaults:
+            raise AttributeError("Invalid django_auth0_user setting: '{}'".format(attr))
+
+        for name in setting_names(attr):
+            value = getattr(settings, name, None)
+            if value is not None:
+                break
+        else:
+            value = self.defaults[attr]
+            if callable(value):
+                value = value(self)
+
+        self._cached_attrs.add(attr)
+        setattr(self, attr, value)
+        return value
+
+    def reload(self):
+        # Iterates over a copy, another thread may be caching a setting through __getattr__ meanwhile.
+        for attr in list(self._cached_attrs):
+            self._cached_attrs.discard(attr)
+            self.__dict__.pop(attr, None)
+
+
+auth0_user_settings = Auth0UserSettings()
+
+
+def reload_auth0_user_settings(*args, **kwargs):
+    setting = kwargs['setting']
+    if setting.startswith('AUTH0_') or setting.startswith('SOCIAL_AUTH_AUTH0_'):
+        auth0_user_settings.reload()
+
+
+setting_changed.connect(reload_auth0_user_settings)
+
+
+class SettingsModule(ModuleType):
+    """
+    Keeps `from django_auth0_user.settings import USER_DATA_STORAGE` working, the value is looked up when imported.
+
+    Prefer reading `auth0_user_settings.USER_DATA_STORAGE` where the value is used, so setting overrides apply.
+    """
+
+    def __getattr__(self, name):
+        if name in DEFAULTS:
+            return getattr(auth0_user_settings, name)
+        if name == 'DEFAULT_AUTH0_RULE_CONFIGS':
+            # The default AUTH0_RULE_CONFIGS, before it became a DEFAULTS entry derived from the namespace settings.
+            return _default_rule_configs(auth0_user_settings)
+        raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+
+
+sys.modules[__name__].__class__ = SettingsModule
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from django_auth0_user.settings import auth0_user_settings
+
+
+def throttled_update_last_login(sender, user, **kwargs):
+    """
+    A replacement for `django.contrib.auth.models.update_last_login` that only writes every LAST_LOGIN_GRANULARITY.
+
+    Django issues an UPDATE of last_login on every login, this skips it until the stored value is stale.
+    """
+    now = timezone.now()
+    if user.last_login is not None and now - user.last_login < timedelta(seconds=auth0_user_settings.LAST_LOGIN_GRANULARITY):
+        return
+    user.last_login = now
+    get_user_model()._default_manager.filter(pk=user.pk).update(last_login=now)
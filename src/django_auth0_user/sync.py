@@ -0,0 +1,266 @@
+import logging
+import re
+from urllib.parse import unquote
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from social_django.models import UserSocialAuth
+
+from django_auth0_user.models import Auth0LogCheckpoint
+from django_auth0_user.models import Auth0UserMirror
+from django_auth0_user.token_user import Auth0TokenUser
+from django_auth0_user.util.auth0_api import get_auth0
+from django_auth0_user.util.auth0_api import get_auth0_user
+from django_auth0_user.util.auth0_api import get_auth0_users
+from django_auth0_user.util.auth0_api import get_users_from_auth0
+
+
+logger = logging.getLogger(__name__)
+
+
+# The Auth0UserMirror columns refreshed from Auth0, everything except the user_id key.
+MIRROR_FIELDS = (
+    'email', 'email_verified', 'name', 'connection', 'blocked',
+    'created_at', 'updated_at', 'last_login', 'profile', 'synced_at',
+)
+
+
+# Auth0 log event types that mean a user was created, changed or deleted.
+# https://auth0.com/docs/deploy-monitor/logs/log-event-type-codes
+USER_SIGNUP_LOG_TYPES = ('ss',)
+USER_DELETE_LOG_TYPES = ('sdu', 'du')
+USER_CHANGE_LOG_TYPES = ('sce', 'scp', 'sv')
+# Successful Management API calls, only those against a user are of interest, e.g. blocking or metadata updates.
+MANAGEMENT_API_LOG_TYPE = 'sapi'
+MANAGEMENT_API_USER_PATH = re.compile(r'^/api/v2/users/(?P<user_id>[^/]+)$')
+
+DEFAULT_LOG_CHECKPOINT = 'default'
+
+
+def _parse_timestamp(value):
+    return parse_datetime(value) if value else None
+
+
+def mirror_from_auth0_user(auth0_user, synced_at=None):
+    """
+    Build an unsaved Auth0UserMirror from a Management API user.
+
+    :param dict auth0_user: The user as returned by the Management API.
+    :param datetime synced_at: The freshness timestamp to record, now when not given.
+    :return: The Auth0UserMirror.
+    """
+    identities = auth0_user.get('identities') or []
+    return Auth0UserMirror(
+        user_id=auth0_user['user_id'],
+        # Stored lower cased, so lookups by email are exact matches that can use the index.
+        email=(auth0_user.get('email') or '').lower(),
+        email_verified=bool(auth0_user.get('email_verified')),
+        name=auth0_user.get('name') or '',
+        connection=identities[0].get('connection', '') if identities else '',
+        blocked=bool(auth0_user.get('blocked')),
+        created_at=_parse_timestamp(auth0_user.get('created_at')),
+        updated_at=_parse_timestamp(auth0_user.get('updated_at')),
+        last_login=_parse_timestamp(auth0_user.get('last_login')),
+        profile=auth0_user,
+        synced_at=synced_at or timezone.now(),
+    )
+
+
+def store_auth0_user_mirrors(auth0_users, synced_at=None):
+    """
+    Insert or refresh the mirrors for a batch of Management API users.
+
+    This costs one SELECT of the existing ids, one bulk_create and one bulk_update, in a single transaction.
+
+    :param auth0_users: The users as returned by the Management API.
+    :param datetime synced_at: The freshness timestamp to record, now when not given.
+    :return: The number of users stored.
+    """
+    mirrors = {_user['user_id']: mirror_from_auth0_user(_user, synced_at) for _user in auth0_users}
+    if not mirrors:
+        return 0
+    with transaction.atomic():
+        existing = Auth0UserMirror.objects.filter(user_id__in=list(mirrors)).values_list('user_id', 'pk')
+        for _user_id, _pk in existing:
+            mirrors[_user_id].pk = _pk
+        Auth0UserMirror.objects.bulk_update([_mirror for _mirror in mirrors.values() if _mirror.pk], MIRROR_FIELDS)
+        Auth0UserMirror.objects.bulk_create([_mirror for _mirror in mirrors.values() if not _mirror.pk])
+    return len(mirrors)
+
+
+def sync_auth0_user_mirrors(auth0_users=None, batch_size=500, prune=False, auth0=None):
+    """
+    Refresh the Auth0UserMirror table from the Management API.
+
+    :param auth0_users: The users to mirror, all users from `get_users_from_auth0` with the 'sync' fields when not given.
+    :param int batch_size: Number of users written at once.
+    :param bool prune: Delete the mirrors of users that were not seen. Only use this when `auth0_users` is
+        complete, the Management API users list stops paging at 1000 users, use a users export for larger tenants.
+    :param auth0: An Auth0 management client, one is created when not given.
+    :return: A tuple of (stored, pruned) user counts.
+    """
+    started = timezone.now()
+    if auth0_users is None:
+        auth0_users = get_users_from_auth0(auth0 or get_auth0(), fields='sync')
+
+    stored = 0
+    batch = []
+    for auth0_user in auth0_users:
+        batch.append(auth0_user)
+        if len(batch) >= batch_size:
+            stored += store_auth0_user_mirrors(batch, started)
+            batch = []
+    if batch:
+        stored += store_auth0_user_mirrors(batch, started)
+
+    pruned = 0
+    if prune:
+        pruned, _ = Auth0UserMirror.objects.stale(started).delete()
+    logger.info('Mirrored %s Auth0 users, pruned %s.', stored, pruned)
+    return stored, pruned
+
+
+def user_changes_from_log_events(log_events):
+    """
+    Pick the user changes out of a batch of Auth0 log events.
+
+    :param log_events: The log events, as returned by the Management API logs endpoint or a log stream.
+    :return: A tuple of (changed user ids, deleted user ids), as sets.
+    """
+    changed_ids = set()
+    deleted_ids = set()
+    for log_event in log_events:
+        log_type = log_event.get('type')
+        if log_type in USER_DELETE_LOG_TYPES and log_event.get('user_id'):
+            deleted_ids.add(log_event['user_id'])
+        elif log_type in USER_SIGNUP_LOG_TYPES + USER_CHANGE_LOG_TYPES and log_event.get('user_id'):
+            changed_ids.add(log_event['user_id'])
+        elif log_type == MANAGEMENT_API_LOG_TYPE:
+            request = (log_event.get('details') or {}).get('request') or {}
+            match = MANAGEMENT_API_USER_PATH.match(request.get('path') or '')
+            if match and request.get('method', '').lower() == 'delete':
+                deleted_ids.add(unquote(match.group('user_id')))
+            elif match and request.get('method', '').lower() in ('patch', 'put', 'post'):
+                changed_ids.add(unquote(match.group('user_id')))
+    return changed_ids - deleted_ids, deleted_ids
+
+
+def _get_unindexed_auth0_users(user_ids, auth0):
+    from auth0.v3.exceptions import Auth0Error
+
+    auth0_users = {}
+    for user_id in user_ids:
+        try:
+            auth0_users[user_id] = get_auth0_user(user_id, auth0=auth0, fields='sync', use_cache=False)
+        except Auth0Error as err:
+            if err.status_code != 404:
+                raise
+            logger.info('Auth0 user %s was deleted before its changes were applied.', user_id)
+    return auth0_users
+
+
+def apply_auth0_user_changes(changed_ids, deleted_ids, auth0=None):
+    """
+    Bring the mirrors and local users for a batch of changed and deleted Auth0 users up to date.
+
+    The changed users are fetched with one user search per batch of ids, bypassing the user cache. Users the search
+    index doesn't have yet, e.g. ones that just signed up, are then fetched by id. Errors other than a user that no
+    longer exists are raised, so callers don't record the batch as applied.
+    Local users of blocked or deleted Auth0 users are deactivated, and the email and is_active of
+    the rest are refreshed, all with a single bulk_update.
+
+    :param changed_ids: The ids of Auth0 users that were created or changed.
+    :param deleted_ids: The ids of Auth0 users that were deleted.
+    :param auth0: An Auth0 management client, one is created when needed and not given.
+    :return: The number of local users updated.
+    """
+    User = get_user_model()
+    auth0_users = {}
+    if changed_ids:
+        if auth0 is None:
+            auth0 = get_auth0()
+        auth0_users = get_auth0_users(changed_ids, auth0=auth0, fields='sync', use_cache=False)
+        auth0_users.update(_get_unindexed_auth0_users(set(changed_ids) - set(auth0_users), auth0))
+
+    uids = set(auth0_users) | set(deleted_ids)
+    user_ids = dict(
+        UserSocialAuth.objects.filter(provider='auth0', uid__in=uids).values_list('user_id', 'uid')
+    ) if uids else {}
+
+    with transaction.atomic():
+        store_auth0_user_mirrors(auth0_users.values())
+        if deleted_ids:
+            Auth0UserMirror.objects.filter(user_id__in=list(deleted_ids)).delete()
+
+        users = list(User._default_manager.filter(pk__in=list(user_ids)))
+        changed_users = []
+        for user in users:
+            auth0_user = auth0_users.get(user_ids[user.pk])
+            if auth0_user is None:
+                is_active, email = False, user.email
+            else:
+                # The configured is_active check, applied to the fresh app_metadata.
+                is_active = not auth0_user.get('blocked') and Auth0TokenUser(
+                    {'sub': auth0_user['user_id'], 'app_metadata': auth0_user.get('app_metadata')}
+                ).is_active
+                email = auth0_user.get('email') or user.email
+            if (user.is_active, user.email) != (is_active, email):
+                user.is_active, user.email = is_active, email
+                changed_users.append(user)
+        if changed_users:
+            User._default_manager.bulk_update(changed_users, ['is_active', 'email'])
+    return len(changed_users)
+
+
+def consume_auth0_logs(auth0=None, take=100, checkpoint_name=DEFAULT_LOG_CHECKPOINT, max_pages=None):
+    """
+    Apply the user changes recorded in the Auth0 logs since the stored checkpoint.
+
+    Logs are read forward from the checkpoint's log id with the Management API's `from`/`take` parameters,
+    and the checkpoint is moved forward in the same transaction as each page's changes are applied.
+    Without a checkpoint, it starts from the most recent log event rather than replaying the log retention period.
+
+    :param auth0: An Auth0 management client, one is created when not given.
+    :param int take: Number of log events to read per request, at most 100.
+    :param str checkpoint_name: The name of the Auth0LogCheckpoint to use.
+    :param int max_pages: Stop after this many pages, keep going until caught up when not given.
+    :return: A tuple of (log events read, local users updated).
+    """
+    if auth0 is None:
+        auth0 = get_auth0()
+    checkpoint, _ = Auth0LogCheckpoint.objects.get_or_create(name=checkpoint_name)
+
+    if not checkpoint.log_id:
+        latest = _log_events(auth0.logs.search(per_page=1, sort='date:-1', include_totals=False))
+        checkpoint.log_id = _log_id(latest[0]) if latest else ''
+        checkpoint.save(update_fields=['log_id', 'updated_at'])
+        if not checkpoint.log_id:
+            return 0, 0
+
+    read = 0
+    updated = 0
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        log_events = _log_events(auth0.logs.search(from_param=checkpoint.log_id, take=take, include_totals=False))
+        if not log_events:
+            break
+        changed_ids, deleted_ids = user_changes_from_log_events(log_events)
+        with transaction.atomic():
+            updated += apply_auth0_user_changes(changed_ids, deleted_ids, auth0=auth0)
+            checkpoint.log_id = _log_id(log_events[-1])
+            checkpoint.save(update_fields=['log_id', 'updated_at'])
+        read += len(log_events)
+        pages += 1
+        if len(log_events) < take:
+            break
+    return read, updated
+
+
+def _log_events(result):
+    return result['logs'] if isinstance(result, dict) else result
+
+
+def _log_id(log_event):
+    return log_event.get('log_id') or log_event['_id']
@@ -0,0 +1,89 @@
+from django_auth0_user.permission_checks import PERMISSION_CHECKS
+from django_auth0_user.rbac import django_permissions_for
+from django_auth0_user.settings import auth0_user_settings
+
+
+def _metadata_claim(claims, namespaced_key, plain_key):
+    if namespaced_key is not None and namespaced_key in claims:
+        return claims[namespaced_key]
+    return claims.get(plain_key)
+
+
+class Auth0TokenUser(object):
+    """
+    A lightweight user built straight from verified Auth0 token claims, without any database access.
+
+    It quacks enough like a Django user for DRF's `IsAuthenticated` and for the functions in
+    `django_auth0_user.permission_checks`, which are evaluated lazily and only once per instance.
+    """
+    __slots__ = ('claims', 'sub', 'scopes', 'permissions', 'app_metadata', 'user_metadata', '_flags')
+
+    id = None
+    pk = None
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, claims):
+        self.claims = claims
+        self.sub = claims['sub']
+        self.scopes = frozenset(claims.get('scope', '').split())
+        self.permissions = frozenset(claims.get('permissions', ()))
+        self.app_metadata = _metadata_claim(claims, auth0_user_settings.NAMESPACED_APP_METADATA_KEY, 'app_metadata')
+        self.user_metadata = _metadata_claim(claims, auth0_user_settings.NAMESPACED_USER_METADATA_KEY, 'user_metadata')
+        self._flags = {}
+
+    def __str__(self):
+        return self.sub
+
+    def __repr__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, self.sub)
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and other.sub == self.sub
+
+    def __hash__(self):
+        return hash(self.sub)
+
+    @property
+    def username(self):
+        return self.sub
+
+    def get_username(self):
+        return self.sub
+
+    def _flag(self, name):
+        if name not in self._flags:
+            self._flags[name] = PERMISSION_CHECKS.get(name)(self)
+        return self._flags[name]
+
+    @property
+    def is_superuser(self):
+        return self._flag('is_superuser')
+
+    @property
+    def is_staff(self):
+        return self._flag('is_staff')
+
+    @property
+    def is_active(self):
+        return self._flag('is_active')
+
+    def has_perm(self, perm, obj=None):
+        return self.is_active and (
+            self.is_superuser or perm in self.permissions or perm in django_permissions_for(self.permissions)
+        )
+
+    def has_perms(self, perm_list, obj=None):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def has_module_perms(self, app_label):
+        prefix = app_label + '.'
+        return self.is_active and (self.is_superuser or any(
+            perm.startswith(prefix) for perm in self.permissions | django_permissions_for(self.permissions)
+        ))
+
+    def save(self):
+        raise NotImplementedError("Auth0 token users are not stored in the database.")
+
+    def delete(self):
+        raise NotImplementedError("Auth0 token users are not stored in the database.")
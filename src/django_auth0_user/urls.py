@@ -0,0 +1,10 @@
+from django.conf.urls import url
+
+from django_auth0_user import views
+
+
+app_name = 'django_auth0_user'
+
+urlpatterns = [
+    url(r'^log-stream/$', views.auth0_log_stream, name='log-stream'),
+]
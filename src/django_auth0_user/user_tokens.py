@@ -0,0 +1,182 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from django_auth0_user.models import Auth0UserToken
+from django_auth0_user.settings import auth0_user_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+# Tokens whose refresh failed this many times in a row are skipped until the user logs in again.
+USER_TOKEN_MAX_FAILURES = 3
+USER_TOKEN_DEFAULT_EXPIRY = 86400  # 24 hours = 86400 seconds
+USER_TOKEN_REFRESH_TIMEOUT = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_token_session(pool_size=10):
+    """
+    Return the shared requests session used for refresh token exchanges, so connections to Auth0 are reused.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        return _session
+
+
+def _apply_token_response(token, response, now):
+    token.access_token = response['access_token']
+    # Auth0 only returns a new refresh token when refresh token rotation is enabled.
+    token.refresh_token = response.get('refresh_token') or token.refresh_token
+    token.expires_at = now + timedelta(seconds=response.get('expires_in') or USER_TOKEN_DEFAULT_EXPIRY)
+    token.failures = 0
+    token.updated_at = now
+
+
+def store_user_token(user, response):
+    """
+    Start tracking the tokens from a token endpoint response for the user.
+
+    :param user: The Django user the tokens were issued to.
+    :param dict response: The token endpoint response.
+    :return: The Auth0UserToken, or None when the response has no refresh token.
+    """
+    if not response.get('refresh_token') or not response.get('access_token'):
+        return None
+    token = Auth0UserToken(user=user)
+    _apply_token_response(token, response, timezone.now())
+    token.save()
+    return token
+
+
+def request_token_refresh(refresh_token, session=None):
+    """
+    Exchange a refresh token for a new access token.
+
+    :return: The token endpoint response.
+    :raises requests.RequestException: When the exchange fails.
+    """
+    response = (session or get_token_session()).post(
+        'https://{}/oauth/token'.format(auth0_user_settings.AUTH0_DOMAIN),
+        data={
+            'grant_type': 'refresh_token',
+            'client_id': auth0_user_settings.CLIENT_ID,
+            'client_secret': auth0_user_settings.CLIENT_SECRET,
+            'refresh_token': refresh_token,
+        },
+        timeout=USER_TOKEN_REFRESH_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def refresh_user_tokens(tokens, session=None, workers=4):
+    """
+    Refresh a batch of tokens concurrently, then save them all with one bulk_update.
+
+    :param tokens: The Auth0UserToken instances to refresh, they are updated in place.
+    :param session: The requests session to use, `get_token_session()` when not given.
+    :param int workers: Number of refresh requests in flight at once.
+    :return: A tuple of (refreshed, failed) token counts.
+    """
+    tokens = list(tokens)
+    if not tokens:
+        return 0, 0
+    session = session or get_token_session()
+
+    def refresh(token):
+        try:
+            return request_token_refresh(token.refresh_token, session)
+        except (requests.RequestException, ValueError) as err:
+            logger.warning('Failed to refresh the Auth0 access token of user %s: %s', token.user_id, err)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        responses = list(executor.map(refresh, tokens))
+
+    now = timezone.now()
+    failed = 0
+    for token, response in zip(tokens, responses):
+        if response is None:
+            token.failures += 1
+            token.updated_at = now
+            failed += 1
+        else:
+            _apply_token_response(token, response, now)
+    Auth0UserToken.objects.bulk_update(
+        tokens, ['access_token', 'refresh_token', 'expires_at', 'failures', 'updated_at']
+    )
+    return len(tokens) - failed, failed
+
+
+def refresh_expiring_user_tokens(margin=None, batch_size=100, workers=4, session=None):
+    """
+    Refresh every token that expires within `margin` seconds, AUTH0_USER_TOKEN_REFRESH_MARGIN when not given,
+    a batch at a time.
+
+    Each batch is locked with SELECT ... FOR UPDATE SKIP LOCKED while it is refreshed, on databases that support it,
+    so several workers can run at once without exchanging the same refresh token twice. The rows are deliberately
+    held locked while the refresh requests run: with refresh token rotation, Auth0 revokes the whole token family
+    when a refresh token is exchanged twice, so no other worker or `get_fresh_access_token` may pick them up until
+    the new tokens are saved. Keep `batch_size` small, each batch holds its locks for the length of its requests.
+
+    :return: A tuple of (refreshed, failed) token counts.
+    """
+    if margin is None:
+        margin = auth0_user_settings.USER_TOKEN_REFRESH_MARGIN
+    deadline = timezone.now() + timedelta(seconds=margin)
+    refreshed = failed = 0
+    last_pk = None
+    while True:
+        with transaction.atomic():
+            tokens = Auth0UserToken.objects.select_for_update(skip_locked=True).filter(
+                expires_at__lt=deadline, failures__lt=USER_TOKEN_MAX_FAILURES,
+            ).order_by('pk')
+            if last_pk is not None:
+                tokens = tokens.filter(pk__gt=last_pk)
+            tokens = list(tokens[:batch_size])
+            if not tokens:
+                break
+            batch_refreshed, batch_failed = refresh_user_tokens(tokens, session=session, workers=workers)
+        refreshed += batch_refreshed
+        failed += batch_failed
+        last_pk = tokens[-1].pk
+    return refreshed, failed
+
+
+def get_fresh_access_token(user):
+    """
+    Return an unexpired Auth0 access token for the user, to call APIs on their behalf.
+
+    With the `refresh_auth0_user_tokens` worker running, the stored token is replaced well before it expires,
+    so this is a single indexed read. The token is only refreshed inline when it has already expired, with its row
+    locked, so a concurrent request or worker that refreshed it first is waited for rather than repeated.
+
+    :return: The access token, or None when the user has no refreshable token or it could not be refreshed.
+    """
+    try:
+        token = user.auth0_token
+    except ObjectDoesNotExist:
+        return None
+    if token.expires_at > timezone.now():
+        return token.access_token
+    with transaction.atomic():
+        token = Auth0UserToken.objects.select_for_update().filter(pk=token.pk).first()
+        if token is None:
+            return None
+        if token.expires_at <= timezone.now():
+            refresh_user_tokens([token], workers=1)
+    return token.access_token if token.expires_at > timezone.now() else None
@@ -1,18 +1,28 @@
+import base64
+import hashlib
+import io
+import json
 import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
 from copy import deepcopy
+from typing import TYPE_CHECKING
 
-from auth0.v3.authentication import GetToken
-from auth0.v3.management import Auth0
 from django.conf import settings
-from cached_property import threaded_cached_property_with_ttl
+from django.core.cache import cache
+from django.core.cache import caches
 import logging
+import requests
+from requests.auth import AuthBase
 
-from django_auth0_user.settings import AUTH0_RULE_CONFIGS
-from django_auth0_user.settings import AUTH0_RULES
-from django_auth0_user.settings import AUTH0_DOMAIN
-from django_auth0_user.settings import AUTH0_API_URL
-from django_auth0_user.settings import AUTH0_MANAGEMENT_API_CLIENT_ID
-from django_auth0_user.settings import AUTH0_MANAGEMENT_API_CLIENT_SECRET
+from django_auth0_user.settings import auth0_user_settings
+
+if TYPE_CHECKING:
+    from auth0.v3.management import Auth0
 
 
 # TODO: The logging here should be more consistent.
@@ -20,7 +30,22 @@ logger = logging.getLogger(__name__)
 
 
 AUTH0_MANAGEMENT_API_TOKEN_DEFAULT_EXPIRY = 86400  # 24 hours = 86400 seconds
-AUTH0_CACHED_TOKEN_TTL = 3600  # 1 hour = 3600 seconds
+AUTH0_SHARED_TOKEN_CACHE_KEY = 'django_auth0_user:access_token:{}'
+# Ids per user search, this keeps the Lucene query string well inside Auth0's limits and fits in one results page.
+AUTH0_USER_SEARCH_BATCH_SIZE = 50
+AUTH0_USER_CACHE_KEY = 'django_auth0_user:auth0_user:{fields}:{user_id}'
+
+# Field projections for the Management API user reads, pass a preset name or a list as `fields=`.
+# A full user, with its identities and metadata, is many times the size of any of these.
+AUTH0_USER_FIELD_PRESETS = {
+    'ids': ['user_id'],
+    'flags': ['user_id', 'blocked', 'email_verified', 'app_metadata'],
+    'profile': ['user_id', 'email', 'email_verified', 'name', 'given_name', 'family_name', 'nickname', 'picture'],
+    'sync': [
+        'user_id', 'email', 'email_verified', 'name', 'given_name', 'family_name', 'nickname', 'picture',
+        'blocked', 'app_metadata', 'user_metadata', 'identities', 'created_at', 'updated_at', 'last_login',
+    ],
+}
 # AUTH0_DOMAIN = getattr(settings, 'AUTH0_DOMAIN')
 
 # AUTH0_API_URL = 'https://' + AUTH0_DOMAIN + '/api/v2/'
@@ -32,47 +57,189 @@ AUTH0_CACHED_TOKEN_TTL = 3600  # 1 hour = 3600 seconds
 
 class TokenCache(object):
     """
-    Cache the Auth0 token with a TTL so that we get a new one regularly.
+    Cache client credentials access tokens, per (client_id, audience, scope), until shortly before they expire.
 
     Needed to prevent invalid token issues in production, since the production server needs to possibly live longer
     the token expiry, and we cannot just hammer the token API for a new token every time it makes a request.
+
+    A token is replaced `refresh_margin` seconds before the `expires_in` Auth0 returned with it. Only one thread
+    requests the replacement, the others keep using the current token until it expires, or wait for the new one.
+    With a `shared_cache` alias the tokens are also kept in that Django cache, so processes share them as well.
     """
 
-    @threaded_cached_property_with_ttl(ttl=AUTH0_CACHED_TOKEN_TTL)
+    def __init__(self, domain=None, refresh_margin=None, shared_cache=None):
+        # Each of these falls back to its setting when not given, read when it is used.
+        self._domain = domain
+        self._refresh_margin = refresh_margin
+        self._shared_cache = shared_cache
+        self._tokens = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    @property
+    def domain(self):
+        return self._domain or auth0_user_settings.AUTH0_DOMAIN
+
+    @property
+    def refresh_margin(self):
+        return self._refresh_margin if self._refresh_margin is not None else auth0_user_settings.TOKEN_REFRESH_MARGIN
+
+    @property
+    def shared_cache(self):
+        return self._shared_cache or auth0_user_settings.TOKEN_SHARED_CACHE
+
+    @property
     def auth0_management_api_token(self):
-        # TODO: Convert this to a proper logging statement.
-        logger.info('No cached Auth0 management API token was found...')
-        get_token = GetToken(AUTH0_DOMAIN)
-        token = get_token.client_credentials(
-            AUTH0_MANAGEMENT_API_CLIENT_ID,
-            AUTH0_MANAGEMENT_API_CLIENT_SECRET,
-            AUTH0_API_URL
-        )
-        management_api_token = token['access_token']
-        # TODO: Convert this to a proper logging statement.
-        logger.info('Successfully generated a new Auth0 Management API Token, this will be cached.')
-        return management_api_token
+        return self.get_token(auth0_user_settings.AUTH0_API_URL)
+
+    def get_token(self, audience, client_id=None, client_secret=None, scope=None):
+        """
+        Get a cached access token for the audience, requesting a new one when needed.
+
+        :param str audience: The identifier of the API the token is for.
+        :param str client_id: The client to authenticate as, AUTH0_MANAGEMENT_API_CLIENT_ID when not given.
+        :param str client_secret: The secret of that client, AUTH0_MANAGEMENT_API_CLIENT_SECRET when not given.
+        :param str scope: A space separated list of scopes to request, all the client's grants when not given.
+        :return: The access token.
+        """
+        if client_id is None:
+            client_id = auth0_user_settings.AUTH0_MANAGEMENT_API_CLIENT_ID
+            client_secret = auth0_user_settings.AUTH0_MANAGEMENT_API_CLIENT_SECRET
+        key = (client_id, audience, scope)
+        token, refresh_at, expires_at = self._tokens.get(key, (None, 0, 0))
+        now = time.time()
+        if now < refresh_at:
+            return token
+
+        lock = self._lock(key)
+        # While the current token is still valid, threads that lose the race keep using it instead of waiting.
+        if not lock.acquire(blocking=now >= expires_at):
+            return token
+        try:
+            token, refresh_at, expires_at = self._tokens.get(key, (None, 0, 0))
+            if time.time() < refresh_at:
+                return token
+            entry = self._shared_token(key)
+            if entry is None:
+                entry = self._request_token(client_id, client_secret, audience, scope)
+                self._share_token(key, entry)
+            self._tokens[key] = entry
+            return entry[0]
+        finally:
+            lock.release()
+
+    def invalidate(self, audience, client_id=None, scope=None):
+        """
+        Forget the cached token, e.g. after an API rejected it, so the next `get_token` requests a new one.
+        """
+        key = (client_id or auth0_user_settings.AUTH0_MANAGEMENT_API_CLIENT_ID, audience, scope)
+        self._tokens.pop(key, None)
+        if self.shared_cache is not None:
+            caches[self.shared_cache].delete(self._shared_cache_key(key))
+
+    def reset_locks(self):
+        """
+        Replace the per-key locks, in a forked child whose parent may have held one while it forked.
+        """
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _request_token(self, client_id, client_secret, audience, scope):
+        logger.info('Requesting a new Auth0 access token for %s.', audience)
+        data = {
+            'grant_type': 'client_credentials',
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'audience': audience,
+        }
+        if scope:
+            data['scope'] = scope
+        from auth0.v3.authentication import GetToken
+        response = GetToken(self.domain).post('https://{}/oauth/token'.format(self.domain), data=data)
+        expires_in = response.get('expires_in') or AUTH0_MANAGEMENT_API_TOKEN_DEFAULT_EXPIRY
+        issued_at = time.time()
+        # Short lived tokens are replaced half way through their lifetime instead.
+        refresh_in = max(expires_in - self.refresh_margin, expires_in / 2)
+        return response['access_token'], issued_at + refresh_in, issued_at + expires_in
+
+    @staticmethod
+    def _shared_cache_key(key):
+        return AUTH0_SHARED_TOKEN_CACHE_KEY.format(hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest())
+
+    def _shared_token(self, key):
+        if self.shared_cache is None:
+            return None
+        entry = caches[self.shared_cache].get(self._shared_cache_key(key))
+        if entry is None or time.time() >= entry[1]:
+            return None
+        return tuple(entry)
+
+    def _share_token(self, key, entry):
+        if self.shared_cache is not None:
+            timeout = max(int(entry[1] - time.time()), 1)
+            caches[self.shared_cache].set(self._shared_cache_key(key), entry, timeout)
+
+
+class Auth0BearerAuth(AuthBase):
+    """
+    A `requests` authentication adapter for calling APIs protected by Auth0, with a cached client credentials token.
+
+    ``requests.get(url, auth=Auth0BearerAuth('https://api.example.com/'))``
+
+    A 401 response drops the token from the cache, so the next request is made with a new one.
+    """
+
+    def __init__(self, audience, client_id=None, client_secret=None, scope=None, token_cache=None):
+        self.audience = audience
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.token_cache = token_cache
+
+    def __call__(self, request):
+        token_cache = self.token_cache or AUTH0_TOKEN_CACHE
+        token = token_cache.get_token(self.audience, self.client_id, self.client_secret, self.scope)
+        request.headers['Authorization'] = 'Bearer {}'.format(token)
+        request.register_hook('response', self._invalidate_rejected_token)
+        return request
+
+    def _invalidate_rejected_token(self, response, **kwargs):
+        if response.status_code == 401:
+            (self.token_cache or AUTH0_TOKEN_CACHE).invalidate(self.audience, self.client_id, self.scope)
+        return response
 
 
 AUTH0_TOKEN_CACHE = TokenCache()
+if hasattr(os, 'register_at_fork'):
+    # A thread of the parent, e.g. a warm up, may hold a lock it can never release in the child.
+    os.register_at_fork(after_in_child=AUTH0_TOKEN_CACHE.reset_locks)
 
 
 # TODO: Is this the best name for this function?
 def get_auth0():
-    return Auth0(AUTH0_DOMAIN, AUTH0_TOKEN_CACHE.auth0_management_api_token)
+    # The SDK is only imported once a client is needed, it is not worth loading for every process that imports this.
+    from auth0.v3.management import Auth0
+    return Auth0(auth0_user_settings.AUTH0_DOMAIN, AUTH0_TOKEN_CACHE.auth0_management_api_token)
 
 
-def get_all_auth0_users():
+def get_all_auth0_users(fields=None, include_fields=True):
     """
     Update all the user objects...
 
+    :param fields: A list of user fields, or the name of one of the AUTH0_USER_FIELD_PRESETS, all fields when not given.
+    :param bool include_fields: True to fetch only the fields, False to fetch everything except them.
     :return:
     """
     auth0 = get_auth0()
+    fields = _user_fields(fields, include_fields)
 
     auth0_users = []
 
-    first_query = auth0.users.list()
+    first_query = auth0.users.list(fields=fields, include_fields=include_fields)
     query_length = first_query['length']
     query_limit = first_query['limit']
     query_start = first_query['start']
@@ -85,7 +252,7 @@ def get_all_auth0_users():
         while query_length + query_start <= query_total:
             page_number += 1
 
-            page_query = auth0.users.list(page=page_number)
+            page_query = auth0.users.list(page=page_number, fields=fields, include_fields=include_fields)
 
             for auth0_user in page_query['users']:
                 auth0_users.append(auth0_user)
@@ -98,22 +265,113 @@ def get_all_auth0_users():
     return auth0_users
 
 
-def get_auth0_user(user_id, auth0=None):
+def _user_fields(fields, include_fields):
+    # Resolves presets, and makes sure 'user_id' is always fetched so results can be matched back to their ids.
+    if isinstance(fields, str):
+        fields = AUTH0_USER_FIELD_PRESETS[fields]
+    if not fields:
+        return None
+    if include_fields:
+        return list(fields) if 'user_id' in fields else list(fields) + ['user_id']
+    return [_field for _field in fields if _field != 'user_id'] or None
+
+
+def _auth0_user_cache_key(user_id, fields, include_fields):
+    fields_key = 'all'
+    if fields:
+        fields_key = ('in' if include_fields else 'ex') + hashlib.sha1(
+            ','.join(sorted(fields)).encode('utf-8')
+        ).hexdigest()[:12]
+    return AUTH0_USER_CACHE_KEY.format(fields=fields_key, user_id=user_id)
+
+
+def get_auth0_user(user_id, auth0=None, fields=None, include_fields=True, use_cache=True):
+    """
+    Get a single user from the Management API, using the cached copy when there is one.
+
+    :param str user_id: The Auth0 user id.
+    :param auth0: An Auth0 management client, one is created when not given.
+    :param fields: A list of user fields, or the name of one of the AUTH0_USER_FIELD_PRESETS, all fields when not given.
+        'user_id' is always fetched.
+    :param bool include_fields: True to fetch only the fields, False to fetch everything except them.
+    :param bool use_cache: False to always fetch, e.g. for users known to have changed. The cache is still refreshed.
+    :return: The user dict.
+    """
+    fields = _user_fields(fields, include_fields)
+    cache_key = _auth0_user_cache_key(user_id, fields, include_fields)
+    if auth0_user_settings.AUTH0_MANAGEMENT_API_USER_CACHE_TTL and use_cache:
+        auth0_user = cache.get(cache_key)
+        if auth0_user is not None:
+            return auth0_user
     if auth0 is None:
         auth0 = get_auth0()
-    # TODO: This does not appear to retrieve all user related data. So it may need to be improved.
-    return auth0.users.get(user_id)
+    # Fetched by id rather than through the search, since the search index lags behind newly created users.
+    auth0_user = auth0.users.get(user_id, fields=fields, include_fields=include_fields)
+    if auth0_user_settings.AUTH0_MANAGEMENT_API_USER_CACHE_TTL:
+        cache.set(cache_key, auth0_user, auth0_user_settings.AUTH0_MANAGEMENT_API_USER_CACHE_TTL)
+    return auth0_user
+
+
+def get_auth0_users(user_ids, auth0=None, fields=None, include_fields=True, use_cache=True):
+    """
+    Get many users from the Management API, with one user search per AUTH0_USER_SEARCH_BATCH_SIZE ids.
+
+    Users already in the cache are not fetched again, and the fetched users are added to it.
+    Users that do not exist, or are not in the search index yet, are left out of the result.
+
+    :param user_ids: The Auth0 user ids.
+    :param auth0: An Auth0 management client, one is created when not given.
+    :param fields: A list of user fields, or the name of one of the AUTH0_USER_FIELD_PRESETS, all fields when not given.
+        'user_id' is always fetched.
+    :param bool include_fields: True to fetch only the fields, False to fetch everything except them.
+    :param bool use_cache: False to always fetch, e.g. for users known to have changed. The cache is still refreshed.
+    :return: A dict of user id to user dict.
+    """
+    fields = _user_fields(fields, include_fields)
+    user_ids = list(dict.fromkeys(user_ids))
+    cache_keys = {_user_id: _auth0_user_cache_key(_user_id, fields, include_fields) for _user_id in user_ids}
+
+    auth0_users = {}
+    if auth0_user_settings.AUTH0_MANAGEMENT_API_USER_CACHE_TTL and use_cache:
+        cached = cache.get_many(cache_keys.values())
+        auth0_users = {_user_id: cached[_key] for _user_id, _key in cache_keys.items() if _key in cached}
+
+    missing_ids = [_user_id for _user_id in user_ids if _user_id not in auth0_users]
+    if missing_ids and auth0 is None:
+        auth0 = get_auth0()
+
+    fetched = {}
+    for start in range(0, len(missing_ids), AUTH0_USER_SEARCH_BATCH_SIZE):
+        batch = missing_ids[start:start + AUTH0_USER_SEARCH_BATCH_SIZE]
+        query = 'user_id:({})'.format(' OR '.join('"{}"'.format(_user_id) for _user_id in batch))
+        result = auth0.users.list(
+            q=query, per_page=len(batch), search_engine='v3', include_totals=False,
+            fields=fields, include_fields=include_fields
+        )
+        for auth0_user in (result['users'] if isinstance(result, dict) else result):
+            fetched[auth0_user['user_id']] = auth0_user
+
+    if fetched and auth0_user_settings.AUTH0_MANAGEMENT_API_USER_CACHE_TTL:
+        cache.set_many(
+            {cache_keys[_user_id]: _user for _user_id, _user in fetched.items() if _user_id in cache_keys},
+            auth0_user_settings.AUTH0_MANAGEMENT_API_USER_CACHE_TTL
+        )
+    auth0_users.update(fetched)
+    return auth0_users
 
 
-def get_users_from_auth0(auth0_conn: Auth0):
+def get_users_from_auth0(auth0_conn: 'Auth0', fields=None, include_fields=True):
     """
     Get all users from Auth0
 
     :param auth0_conn: Authenticated Auth0 API client
     :param regex: Regex to filter users (re.match(user.email))
+    :param fields: A list of user fields, or the name of one of the AUTH0_USER_FIELD_PRESETS, all fields when not given.
+    :param bool include_fields: True to fetch only the fields, False to fetch everything except them.
     """
+    fields = _user_fields(fields, include_fields)
 
-    users_list = auth0_conn.users.list()
+    users_list = auth0_conn.users.list(fields=fields, include_fields=include_fields)
 
     total_users = users_list['total']
     page_size = users_list['length']
@@ -127,7 +385,7 @@ def get_users_from_auth0(auth0_conn: Auth0):
     # iterate through subsequent pages
     if page_size > 0 and total_users > 0:
         for page in range(1, int(math.ceil(total_users / page_size))):
-            for u in auth0_conn.users.list(page=page)['users']:
+            for u in auth0_conn.users.list(page=page, fields=fields, include_fields=include_fields)['users']:
                 yield u
 
 
@@ -153,7 +411,7 @@ def set_auth0_rule_config_values():
     :return:
     """
     auth0 = get_auth0()
-    for config_key, config_item in AUTH0_RULE_CONFIGS.items():
+    for config_key, config_item in auth0_user_settings.AUTH0_RULE_CONFIGS.items():
         result = auth0.rules_configs.set(config_key, config_item)
         logger.info(f"Auth0 Set Rule Config Key Result: result={result}")
 
@@ -165,7 +423,7 @@ def remove_auth0_rule_config_values():
     :return: None
     """
     auth0 = get_auth0()
-    for config_key, config_item in AUTH0_RULE_CONFIGS.items():
+    for config_key, config_item in auth0_user_settings.AUTH0_RULE_CONFIGS.items():
         auth0.rules_configs.unset(config_key)
 
 
@@ -195,7 +453,7 @@ def setup_auth0_rules(dry_run=True):
         current_rules[rule['name']] = {**_rule}
     current_rule_names = set(current_rules.keys())
 
-    settings_rules = AUTH0_RULES
+    settings_rules = auth0_user_settings.AUTH0_RULES
     settings_rule_names = set(settings_rules.keys())
 
     # If the rule isn't one we have defined, ignore it.
@@ -232,7 +490,7 @@ def setup_auth0_rules(dry_run=True):
 def tear_down_auth0_rules(dry_run=True):
     auth0 = get_auth0()
     # ----------------------------------------
-    settings_rules = AUTH0_RULES
+    settings_rules = auth0_user_settings.AUTH0_RULES
     settings_rule_names = set(settings_rules.keys())
     # ----------------------------------------
     current_rule_mapping = {}
@@ -242,3 +500,295 @@ def tear_down_auth0_rules(dry_run=True):
         rule_id = current_rule_mapping[rule_name]
         if not dry_run:
             auth0.rules.delete(rule_id)
+
+
+# Auth0 users-imports jobs take files of at most 500KB, and only allow a couple of pending jobs per tenant.
+# https://auth0.com/docs/manage-users/user-migration/bulk-user-imports
+AUTH0_USERS_IMPORT_MAX_FILE_SIZE = 500 * 1024
+AUTH0_USERS_IMPORT_MAX_CONCURRENT_JOBS = 2
+AUTH0_JOB_PENDING_STATUSES = ('pending', 'processing')
+
+
+def _b64_without_padding(value):
+    return base64.b64encode(value).decode('ascii').rstrip('=')
+
+
+def django_password_hash_to_auth0(encoded):
+    """
+    Convert a Django password hash into the fields Auth0's user import schema uses for existing passwords.
+
+    pbkdf2_sha256, pbkdf2_sha1 and argon2 hashes become a `custom_password_hash` in PHC string format,
+    plain bcrypt hashes become a `password_hash`. Anything else, including unusable passwords and
+    bcrypt_sha256, which pre-hashes the password, cannot be imported and those users will need a password reset.
+
+    :param str encoded: The password as stored on the Django user.
+    :return: A dict to merge into the user's import record, empty when the hash cannot be imported.
+    """
+    if not encoded or encoded.startswith('!'):
+        return {}
+    algorithm, _, rest = encoded.partition('$')
+    if algorithm in ('pbkdf2_sha256', 'pbkdf2_sha1'):
+        iterations, salt, derived_key = rest.split('$', 2)
+        digest = algorithm.split('_')[1]
+        phc = '$pbkdf2-{digest}$i={iterations},l={length}${salt}${derived_key}'.format(
+            digest=digest,
+            iterations=iterations,
+            length=len(base64.b64decode(derived_key)),
+            salt=_b64_without_padding(salt.encode('utf-8')),
+            derived_key=derived_key.rstrip('='),
+        )
+        return {'custom_password_hash': {'algorithm': 'pbkdf2', 'hash': {'value': phc, 'encoding': 'utf8'}}}
+    if algorithm == 'argon2':
+        # Django stores the PHC string itself, after its own algorithm prefix.
+        return {'custom_password_hash': {'algorithm': 'argon2', 'hash': {'value': '$' + rest, 'encoding': 'utf8'}}}
+    if algorithm == 'bcrypt':
+        return {'password_hash': rest}
+    return {}
+
+
+def auth0_import_record(user):
+    """
+    Build an Auth0 user import record for a Django user.
+
+    :param user: The Django user.
+    :return: A dict in Auth0's user import schema.
+    """
+    record = {
+        'email': user.email,
+        'email_verified': False,
+        'blocked': not user.is_active,
+        'app_metadata': {
+            'django_user_id': user.pk,
+            'is_staff': user.is_staff,
+            'is_superuser': user.is_superuser,
+        },
+    }
+    if getattr(user, 'first_name', None):
+        record['given_name'] = user.first_name
+    if getattr(user, 'last_name', None):
+        record['family_name'] = user.last_name
+    record.update(django_password_hash_to_auth0(user.password))
+    return record
+
+
+def chunk_import_records(records, max_bytes=AUTH0_USERS_IMPORT_MAX_FILE_SIZE):
+    """
+    Serialise import records into JSON array files that each fit in `max_bytes`.
+
+    :param records: An iterable of import record dicts, it is consumed lazily.
+    :param int max_bytes: The largest file to produce.
+    :return: A generator of JSON encoded bytes.
+    """
+    chunk = []
+    size = 2  # The enclosing brackets.
+    for record in records:
+        encoded = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        if len(encoded) + 2 > max_bytes:
+            raise ValueError('A single import record is larger than {} bytes: {}'.format(max_bytes, record.get('email')))
+        # Every record after the first also needs a separating comma.
+        if chunk and size + len(encoded) + 1 > max_bytes:
+            yield b'[' + b','.join(chunk) + b']'
+            chunk = []
+            size = 2
+        size += len(encoded) + (1 if chunk else 0)
+        chunk.append(encoded)
+    if chunk:
+        yield b'[' + b','.join(chunk) + b']'
+
+
+def _submit_import_job_with_retries(auth0, connection_id, chunk, upsert, max_retries, backoff):
+    from auth0.v3.exceptions import Auth0Error
+    for attempt in range(max_retries + 1):
+        try:
+            return auth0.jobs.import_users(connection_id, io.BytesIO(chunk), upsert=upsert)
+        except Auth0Error as err:
+            # A 429 here usually means too many import jobs are already pending for the tenant.
+            if err.status_code not in AUTH0_RETRYABLE_STATUS_CODES or attempt == max_retries:
+                raise
+        except requests.ConnectionError:
+            if attempt == max_retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+
+def import_users_to_auth0(records, connection_id, upsert=False, auth0=None,
+                          max_concurrent_jobs=AUTH0_USERS_IMPORT_MAX_CONCURRENT_JOBS, poll_interval=5,
+                          max_bytes=AUTH0_USERS_IMPORT_MAX_FILE_SIZE, max_retries=3, backoff=None):
+    """
+    Import users into an Auth0 database connection with users-imports jobs, instead of one create call per user.
+
+    The records are streamed into files of at most `max_bytes`, and up to `max_concurrent_jobs` jobs are kept
+    pending at a time, polled together every `poll_interval` seconds. The errors of failed records are
+    collected from the job errors endpoint.
+
+    Rate limited and server errors when submitting a job are retried with exponential backoff. When a submit still
+    fails, no more jobs are submitted, the jobs already submitted are polled to the end as usual, and the error is
+    returned as the result's 'error', so the caller knows which jobs ran. Records after the failed file were not
+    imported, re-running with `upsert` imports them without duplicating the rest.
+
+    The records' app_metadata.django_user_id is read back on the user's first login by the pipelines in
+    `django_auth0_user.pipeline`, to associate the Auth0 user with the Django user it was imported from.
+
+    :param records: An iterable of import record dicts, e.g. from `auth0_import_record`.
+    :param str connection_id: The id of the database connection to import into.
+    :param bool upsert: Update users that already exist instead of failing their records.
+    :param auth0: An Auth0 management client, one is created when not given.
+    :param int max_retries: Number of times a retryable failure to submit a job is retried.
+    :param float backoff: Seconds to wait before the first retry, doubled for each retry after it,
+        `poll_interval` when not given.
+    :return: A dict with the 'jobs' ids, the 'inserted', 'updated' and 'failed' counts, the per record 'errors',
+        and the 'error' that stopped the submitting, None when every file was submitted.
+    """
+    from auth0.v3.exceptions import Auth0Error
+    if auth0 is None:
+        auth0 = get_auth0()
+    if backoff is None:
+        backoff = poll_interval
+    result = {'jobs': [], 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': [], 'error': None}
+    chunks = chunk_import_records(records, max_bytes)
+    pending = []
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=max(max_concurrent_jobs, 1)) as executor:
+        while True:
+            while not exhausted and len(pending) < max_concurrent_jobs:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                try:
+                    job = _submit_import_job_with_retries(auth0, connection_id, chunk, upsert, max_retries, backoff)
+                except (Auth0Error, requests.RequestException) as err:
+                    logger.error('Stopped submitting Auth0 users import jobs: %s', err)
+                    result['error'] = err
+                    exhausted = True
+                    break
+                logger.info('Submitted Auth0 users import job %s (%s bytes).', job['id'], len(chunk))
+                pending.append(job['id'])
+                result['jobs'].append(job['id'])
+            if not pending:
+                break
+
+            time.sleep(poll_interval)
+            for job_id, job in zip(list(pending), executor.map(auth0.jobs.get, list(pending))):
+                if job.get('status') in AUTH0_JOB_PENDING_STATUSES:
+                    continue
+                pending.remove(job_id)
+                summary = job.get('summary') or {}
+                result['inserted'] += summary.get('inserted', 0)
+                result['updated'] += summary.get('updated', 0)
+                result['failed'] += summary.get('failed', 0)
+                if job.get('status') != 'completed' or summary.get('failed'):
+                    errors = auth0.jobs.get_failed_job(job_id)
+                    result['errors'].extend(errors if isinstance(errors, list) else [errors])
+                logger.info('Auth0 users import job %s finished: %s', job_id, job.get('status'))
+    return result
+
+
+class RateLimiter(object):
+    """
+    A thread safe token bucket, `acquire` blocks until a request may be made without exceeding `rate` per second.
+
+    Without a `rate`, AUTH0_MANAGEMENT_API_RATE_LIMIT is used.
+    """
+
+    def __init__(self, rate=None, burst=1):
+        self._rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+    @property
+    def rate(self):
+        return float(self._rate if self._rate is not None else auth0_user_settings.AUTH0_MANAGEMENT_API_RATE_LIMIT)
+
+
+# Shared by the bulk helpers in this process, so running several of them at once still respects the limit.
+AUTH0_MANAGEMENT_API_RATE_LIMITER = RateLimiter()
+
+AUTH0_RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def _update_auth0_user_with_retries(auth0, user_id, patch, rate_limiter, max_retries, backoff):
+    from auth0.v3.exceptions import Auth0Error
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+        try:
+            return auth0.users.update(user_id, patch)
+        except Auth0Error as err:
+            if err.status_code not in AUTH0_RETRYABLE_STATUS_CODES or attempt == max_retries:
+                raise
+        except requests.ConnectionError:
+            if attempt == max_retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+
+def bulk_update_auth0_users(updates, auth0=None, workers=4, max_retries=3, backoff=1, rate_limiter=None,
+                            progress=None, progress_every=100):
+    """
+    PATCH many Auth0 users through a pool of workers, without exceeding the Management API rate limit.
+
+    Auth0 merges the top level keys of `app_metadata` and `user_metadata` into the user's existing metadata,
+    so a patch only needs the keys that change, e.g. `{'app_metadata': {'is_staff': True}}`.
+    Rate limited and server errors are retried with exponential backoff, other errors fail that user only.
+    Cached copies of the users from `get_auth0_user` and `get_auth0_users` are not refreshed.
+
+    :param updates: An iterable of (user_id, patch) pairs, it is consumed lazily.
+    :param auth0: An Auth0 management client, one is created when not given.
+    :param int workers: Number of requests in flight at once.
+    :param int max_retries: Number of times a retryable failure is retried.
+    :param float backoff: Seconds to wait before the first retry, doubled for each retry after it.
+    :param RateLimiter rate_limiter: The rate limiter to use, AUTH0_MANAGEMENT_API_RATE_LIMITER when not given.
+    :param progress: Called with the result so far every `progress_every` users.
+    :return: A dict with the 'updated' and 'failed' counts, the (user_id, error) 'errors' and 'elapsed' seconds.
+    """
+    from auth0.v3.exceptions import Auth0Error
+    if auth0 is None:
+        auth0 = get_auth0()
+    if rate_limiter is None:
+        rate_limiter = AUTH0_MANAGEMENT_API_RATE_LIMITER
+    started = time.monotonic()
+    result = {'updated': 0, 'failed': 0, 'errors': [], 'elapsed': 0.0}
+
+    def collect(done):
+        for future in done:
+            user_id = in_flight.pop(future)
+            try:
+                future.result()
+                result['updated'] += 1
+            except (Auth0Error, requests.RequestException) as err:
+                result['failed'] += 1
+                result['errors'].append((user_id, str(err)))
+            result['elapsed'] = time.monotonic() - started
+            if progress is not None and (result['updated'] + result['failed']) % progress_every == 0:
+                progress(result)
+
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for user_id, patch in updates:
+            # Only a couple of updates per worker are queued, so a large input is never held in memory.
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(
+                _update_auth0_user_with_retries, auth0, user_id, patch, rate_limiter, max_retries, backoff
+            )
+            in_flight[future] = user_id
+        collect(wait(in_flight).done)
+
+    result['elapsed'] = time.monotonic() - started
+    return result
@@ -0,0 +1,26 @@
+import hmac
+
+from django.http import HttpResponse
+from django.http import HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from django_auth0_user import log_stream
+from django_auth0_user.settings import auth0_user_settings
+
+
+@csrf_exempt
+@require_POST
+def auth0_log_stream(request):
+    """
+    Receives batches of log events from an Auth0 custom webhook log stream.
+
+    The request's Authorization header must match AUTH0_LOG_STREAM_SECRET. The body is handed to the
+    in-process log stream buffer unparsed and applied by its worker, so this returns straight away.
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION', '').encode('utf-8')
+    secret = auth0_user_settings.LOG_STREAM_SECRET
+    if not secret or not hmac.compare_digest(authorization, secret.encode('utf-8')):
+        return HttpResponseForbidden()
+    log_stream.LOG_STREAM_BUFFER.put(request.body)
+    return HttpResponse(status=202)
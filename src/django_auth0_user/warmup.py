@@ -0,0 +1,120 @@
+"""
+Fetch the Auth0 artifacts a process needs before it serves its first request.
+
+A cold process otherwise pays for the Management API token, the OIDC discovery document and the JWKS on the
+first requests that need them. `warm_up` fetches them in parallel into the same caches those requests read:
+the `AUTH0_TOKEN_CACHE` (and its AUTH0_TOKEN_SHARED_CACHE) and the python-social-auth backend caches.
+
+It runs from the `auth0_warmup` command, from `DjangoAuth0UserConfig.ready()` when AUTH0_WARMUP_ON_READY is set,
+or from gunicorn, in gunicorn.conf.py::
+
+    from django_auth0_user.warmup import gunicorn_post_fork as post_fork
+
+`ready()` only warms up processes that serve requests, management commands other than runserver skip it.
+
+With gunicorn's `preload_app`, AUTH0_WARMUP_ON_READY warms the master once and the workers inherit its caches.
+A warm up still running when a worker forks is not carried over: the worker's token cache locks are reset after the
+fork, so it requests anything the master had not fetched yet itself.
+
+The imports are kept inside the functions, so a gunicorn config can import this module before Django is set up.
+"""
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+
+logger = logging.getLogger(__name__)
+
+# The management commands that serve requests, `ready()` does not warm up for any other command.
+SERVING_COMMANDS = ('runserver',)
+MANAGEMENT_PROGRAMS = ('manage.py', 'django-admin', 'django-admin.py', '__main__.py')
+
+
+def warm_management_api_token():
+    from django_auth0_user.settings import auth0_user_settings
+    from django_auth0_user.util.auth0_api import AUTH0_TOKEN_CACHE
+
+    if auth0_user_settings.AUTH0_MANAGEMENT_API_CLIENT_ID:
+        AUTH0_TOKEN_CACHE.auth0_management_api_token
+
+
+def warm_oidc_keys():
+    from social_django.utils import load_strategy
+    from django_auth0_user.backend import Auth0OpenId
+
+    # Both are cached per backend class for the life of the process, the JWKS fetch needs the discovery document.
+    backend = Auth0OpenId(strategy=load_strategy())
+    backend.oidc_config()
+    backend.get_jwks_keys()
+
+
+def warm_rbac_map():
+    from django_auth0_user.rbac import compile_rbac_map
+
+    compile_rbac_map()
+
+
+WARMUP_TASKS = (
+    ('management_api_token', warm_management_api_token),
+    ('oidc_discovery_and_jwks', warm_oidc_keys),
+    ('rbac_map', warm_rbac_map),
+)
+
+
+def warm_up(tasks=WARMUP_TASKS, timeout=None):
+    """
+    Run the warm up tasks in parallel, logging rather than raising their errors, so startup never fails on them.
+
+    :param tasks: The (name, callable) pairs to run.
+    :param float timeout: Seconds to wait for them, AUTH0_WARMUP_TIMEOUT when not given.
+        Tasks still running then carry on in the background and are missing from the result.
+    :return: A dict of task name to a (seconds taken, exception or None) tuple.
+    """
+    if timeout is None:
+        from django_auth0_user.settings import auth0_user_settings
+        timeout = auth0_user_settings.WARMUP_TIMEOUT
+
+    results = {}
+
+    def run(name, task):
+        started = time.monotonic()
+        error = None
+        try:
+            task()
+        except Exception as err:
+            logger.warning('Auth0 warm up of %s failed: %s', name, err)
+            error = err
+        results[name] = (time.monotonic() - started, error)
+
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='auth0-warmup')
+    futures = [executor.submit(run, _name, _task) for _name, _task in tasks]
+    wait(futures, timeout=timeout)
+    executor.shutdown(wait=False)
+    return dict(results)
+
+
+def is_serving_process(argv=None):
+    """
+    Whether this process is going to serve requests, rather than run a management command such as migrate.
+    """
+    argv = sys.argv if argv is None else argv
+    if argv and os.path.basename(argv[0]) in MANAGEMENT_PROGRAMS:
+        return len(argv) > 1 and argv[1] in SERVING_COMMANDS
+    return True
+
+
+def gunicorn_post_fork(server, worker):
+    """
+    A gunicorn `post_fork` hook that warms up each worker before it accepts connections.
+    """
+    import django
+
+    # The worker loads the application after this hook, setup() is a no-op when it was already run.
+    django.setup()
+    # os.register_at_fork does this on Python 3.7+, a warm up the master was running may hold one of the locks.
+    from django_auth0_user.util.auth0_api import AUTH0_TOKEN_CACHE
+    AUTH0_TOKEN_CACHE.reset_locks()
+    warm_up()
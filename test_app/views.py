@@ -5,6 +5,8 @@ from .serialisers import UserSerializer, GroupSerializer, UserSocialAuthSerializ
 from rest_framework import permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.exceptions import APIException
+from django_auth0_user.rest_framework.authentication import FastAuth0Authentication
+from django_auth0_user.rest_framework.permissions import HasRequiredScopes
 from social_django.models import UserSocialAuth
 from test_app.models import Auth0User
 from django.http import HttpResponse, JsonResponse
@@ -25,8 +27,11 @@ class UserViewSet(viewsets.ModelViewSet):
 class GroupViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
+
+    Only token authentication grants scopes, so other clients are asked for a token instead of being refused.
     """
-    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [FastAuth0Authentication]
+    permission_classes = [permissions.IsAuthenticated, HasRequiredScopes]
     required_scopes = ['groups']
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
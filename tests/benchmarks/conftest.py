@@ -0,0 +1,29 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+# Queries made by one call of each benchmarked function, reported at the end of the run.
+QUERY_COUNTS = {}
+
+
+@pytest.fixture
+def benchmark_queries(request, benchmark):
+    """
+    Benchmark a function like the `benchmark` fixture, also counting the queries made by one call.
+
+    The count is kept in the benchmark's extra_info, so it is part of the results saved with --benchmark-autosave.
+    """
+    def run(function, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            function(*args, **kwargs)
+        benchmark.extra_info['queries'] = QUERY_COUNTS[request.node.name] = len(queries)
+        return benchmark(function, *args, **kwargs)
+    return run
+
+
+def pytest_terminal_summary(terminalreporter):
+    if QUERY_COUNTS:
+        terminalreporter.section('queries per call')
+        for name, count in sorted(QUERY_COUNTS.items()):
+            terminalreporter.write_line('{:<70} {}'.format(name, count))
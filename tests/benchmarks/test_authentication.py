@@ -0,0 +1,150 @@
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.cache import SessionStore
+from django.test import RequestFactory
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+from rest_framework_jwt.utils import jwt_encode_handler
+from social_django.models import UserSocialAuth
+from social_django.utils import load_backend
+from social_django.utils import load_strategy
+
+from django_auth0_user.backend import Auth0OpenId
+from django_auth0_user.pipeline import AUTH0_LEAN_PIPELINE
+from django_auth0_user.rest_framework.authentication import FastAuth0Authentication
+from django_auth0_user.rest_framework.authentication import FullAuth0Authentication
+from tests.utils.pipeline import make_id_token_payload
+from tests.utils.pipeline import make_token_response
+from tests.utils.pipeline import run_auth0_pipeline
+
+pytest.importorskip('pytest_benchmark')
+
+
+USER_ID = 'auth0|benchmark'
+# Stand in for the userinfo round trip to Auth0 in the login callback, which is typically far slower than this.
+USERINFO_LATENCY = 0.05
+OIDC_CONFIG = {
+    'issuer': 'https://example.auth0.com/',
+    'authorization_endpoint': 'https://example.auth0.com/authorize',
+    'token_endpoint': 'https://example.auth0.com/oauth/token',
+    'userinfo_endpoint': 'https://example.auth0.com/userinfo',
+    'jwks_uri': 'https://example.auth0.com/.well-known/jwks.json',
+}
+
+
+@pytest.fixture
+def mocked_auth0(monkeypatch):
+    """
+    Answer the OIDC discovery and userinfo requests of the auth0 backend without going to Auth0.
+    """
+    userinfo = make_id_token_payload(sub=USER_ID, user_metadata={'theme': 'dark'})
+    monkeypatch.setattr(Auth0OpenId, 'oidc_config', lambda self: OIDC_CONFIG)
+    monkeypatch.setattr(Auth0OpenId, 'get_json', lambda self, url, *args, **kwargs: dict(userinfo))
+    return userinfo
+
+
+@pytest.fixture
+def auth0_user(mocked_auth0):
+    id_token_payload = make_id_token_payload(sub=USER_ID, user_metadata={'theme': 'dark'})
+    user = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, id_token_payload)['user']
+    # Store a real JWT, so id_token_payload is decoded rather than rejected.
+    social = UserSocialAuth.objects.get(user=user)
+    social.extra_data['id_token'] = jwt_encode_handler(id_token_payload)
+    social.save()
+    # Reloaded, so nothing the pipeline cached on the instance is measured.
+    return get_user_model().objects.get(pk=user.pk)
+
+
+def make_session_request(path='/', **extra):
+    request = RequestFactory().get(path, **extra)
+    request.session = SessionStore()
+    return request
+
+
+def make_jwt_request(expires_in=600, sub=USER_ID):
+    now = int(time.time())
+    token = jwt_encode_handler({'sub': sub, 'username': sub, 'iat': now, 'exp': now + expires_in})
+    return APIRequestFactory().get('/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_fast_authentication_valid_token(benchmark_queries, auth0_user):
+    authentication = FastAuth0Authentication()
+
+    user, token = benchmark_queries(authentication.authenticate, make_jwt_request())
+
+    assert user == auth0_user
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_fast_authentication_expired_token(benchmark_queries, auth0_user):
+    authentication = FastAuth0Authentication()
+    request = make_jwt_request(expires_in=-600)
+
+    def authenticate():
+        try:
+            return authentication.authenticate(request)
+        except AuthenticationFailed as err:
+            return err
+
+    assert isinstance(benchmark_queries(authenticate), AuthenticationFailed)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_fast_authentication_unknown_user(benchmark_queries, settings):
+    settings.AUTH0_JIT_PROVISIONING = False
+    authentication = FastAuth0Authentication()
+
+    assert benchmark_queries(authentication.authenticate, make_jwt_request(sub='auth0|unknown')) is None
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_full_authentication(benchmark_queries, auth0_user):
+    authentication = FullAuth0Authentication()
+    request = make_session_request(HTTP_AUTHORIZATION='Bearer access-token')
+
+    user, token = benchmark_queries(authentication.authenticate, request)
+
+    assert user == auth0_user
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', ['auth0_data', 'id_token_payload', 'user_metadata'])
+def test_auth0_user_property(benchmark_queries, auth0_user, name):
+    assert benchmark_queries(getattr, auth0_user, name) is not None
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_auth_url(benchmark_queries, mocked_auth0):
+    strategy = load_strategy(request=make_session_request('/login/auth0/'))
+    backend = load_backend(strategy, 'auth0', redirect_uri='/complete/auth0/')
+
+    assert benchmark_queries(backend.auth_url).startswith(OIDC_CONFIG['authorization_endpoint'])
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+@pytest.mark.parametrize('from_id_token', [False, True])
+def test_login_callback(benchmark_queries, mocked_auth0, monkeypatch, settings, from_id_token):
+    settings.AUTH0_USER_DETAILS_FROM_ID_TOKEN = from_id_token
+
+    def slow_userinfo(self, url, *args, **kwargs):
+        time.sleep(USERINFO_LATENCY)
+        return dict(mocked_auth0)
+
+    monkeypatch.setattr(Auth0OpenId, 'get_json', slow_userinfo)
+    backend = load_backend(load_strategy(), 'auth0', redirect_uri=None)
+    backend.id_token = mocked_auth0
+    response = make_token_response({})
+
+    user = benchmark_queries(backend.do_auth, response['access_token'], response=response)
+
+    assert user.username == USER_ID
@@ -0,0 +1,25 @@
+import pytest
+
+from django_auth0_user.permission_checks import PERMISSION_CHECKS
+from django_auth0_user.permission_checks import auth0_user_is_staff
+from django_auth0_user.token_user import Auth0TokenUser
+
+pytest.importorskip('pytest_benchmark')
+
+
+@pytest.fixture
+def auth0_user():
+    return Auth0TokenUser({'sub': 'auth0|benchmark', 'app_metadata': {'is_staff': True}})
+
+
+@pytest.mark.nondestructive
+def test_check_called_directly(benchmark, auth0_user):
+    assert benchmark(auth0_user_is_staff, auth0_user) is True
+
+
+@pytest.mark.nondestructive
+def test_check_called_through_the_registry(benchmark, auth0_user):
+    # Resolved before measuring, so only the dict lookup the registry adds to every call is compared with the above.
+    PERMISSION_CHECKS.get('is_staff')
+
+    assert benchmark(lambda: PERMISSION_CHECKS.get('is_staff')(auth0_user)) is True
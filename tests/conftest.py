@@ -1,14 +1,18 @@
 import json
 import os
+import shutil
 from pathlib import Path
 
 import pytest
 from django.conf import settings
 from pytest_server_fixtures.http import SimpleHTTPTestServer
+from social_core.utils import cache
 
+from django_auth0_user.backend import Auth0OpenId
 from django_auth0_user.util.auth0_api import set_auth0_rule_config_values, setup_auth0_rules, tear_down_auth0_rules, \
     remove_auth0_rule_config_values
 from tests.utils.auth0 import create_auth0_users_and_confirm
+from tests.utils.fake_auth0 import FakeAuth0Server
 
 
 @pytest.fixture(scope='session')
@@ -86,3 +90,35 @@ def auth0_user():
 def auth0_user_with_metadata():
     users = create_auth0_users_and_confirm(1, user_metadata={'favourite_colour': 'purple'})
     return users[0]
+
+
+@pytest.fixture(scope='session')
+def fake_auth0_server():
+    """
+    A fake Auth0 tenant served over HTTPS for the whole test run, see `tests.utils.fake_auth0`.
+
+    Only the tests that ask for `fake_auth0` use it, the other fixtures here still talk to the tenant in the settings.
+    """
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl is needed to generate a certificate for the fake Auth0 server.')
+    with FakeAuth0Server() as server:
+        yield server
+
+
+@pytest.fixture
+def fake_auth0(fake_auth0_server, settings, monkeypatch):
+    """
+    Point the app at an empty fake Auth0 tenant, without latency or rate limits.
+    """
+    fake_auth0_server.reset()
+    fake_auth0_server.latency = 0
+    fake_auth0_server.set_rate_limits()
+    settings.AUTH0_DOMAIN = fake_auth0_server.domain
+    settings.AUTH0_OIDC_ENDPOINT = 'https://{}'.format(fake_auth0_server.domain)
+    monkeypatch.setenv('REQUESTS_CA_BUNDLE', fake_auth0_server.ca_bundle)
+    # social_core caches discovery and the JWKS per backend class for a day, fresh caches keep other tenants' out.
+    monkeypatch.setattr(Auth0OpenId, 'oidc_config', cache(ttl=86400)(
+        lambda self: self.get_json(self.OIDC_ENDPOINT + '/.well-known/openid-configuration')
+    ))
+    monkeypatch.setattr(Auth0OpenId, 'get_jwks_keys', cache(ttl=86400)(lambda self: self.get_remote_jwks_keys()))
+    return fake_auth0_server
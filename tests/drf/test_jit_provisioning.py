@@ -0,0 +1,146 @@
+import time
+
+import pytest
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_jwt.utils import jwt_encode_handler
+
+from django_auth0_user.rest_framework.authentication import FastAuth0Authentication
+from django_auth0_user.settings import auth0_user_settings
+
+
+class FastView(APIView):
+    authentication_classes = [FastAuth0Authentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'username': request.user.username, 'app_metadata': request.user.app_metadata})
+
+
+def make_claims(**claims):
+    now = int(time.time())
+    return {'sub': 'auth0|jit', 'username': 'auth0|jit', 'iat': now, 'exp': now + 600, **claims}
+
+
+def fast_request(claims):
+    request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='JWT {}'.format(jwt_encode_handler(claims)))
+    return FastView.as_view()(request)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_unknown_user_falls_through_without_jit_provisioning(settings):
+    settings.AUTH0_JIT_PROVISIONING = False
+
+    response = fast_request(make_claims())
+
+    assert response.status_code == 401
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_jit_provisioning_creates_user_from_access_token_claims(settings):
+    from test_app.models import Auth0User
+
+    settings.AUTH0_JIT_PROVISIONING = True
+
+    response = fast_request(make_claims(**{auth0_user_settings.NAMESPACED_APP_METADATA_KEY: {'plan': 'pro'}}))
+
+    assert response.status_code == 200
+    assert response.data == {'username': 'auth0|jit', 'app_metadata': {'plan': 'pro'}}
+    user = Auth0User.objects.get(username='auth0|jit')
+    assert user.social_auth.get().uid == 'auth0|jit'
+    assert user.auth0_claims['sub'] == 'auth0|jit'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db(transaction=True)
+def test_jit_provisioning_defers_profile_enrichment_until_commit(monkeypatch, settings):
+    enriched = []
+    settings.AUTH0_JIT_PROVISIONING = True
+    settings.AUTH0_JIT_PROFILE_ENRICHMENT_HANDLER = 'tests.drf.test_jit_provisioning.ENRICHED'
+    monkeypatch.setattr('tests.drf.test_jit_provisioning.ENRICHED', lambda user_pk, uid: enriched.append(uid),
+                        raising=False)
+
+    fast_request(make_claims())
+    fast_request(make_claims())
+
+    assert enriched == ['auth0|jit']
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_jit_provisioning_leaves_an_existing_association_alone(settings):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django_auth0_user.pipeline import AUTH0_LEAN_PIPELINE
+    from tests.utils.pipeline import make_id_token_payload
+    from tests.utils.pipeline import run_auth0_pipeline
+
+    settings.AUTH0_JIT_PROVISIONING = True
+    # Logged in through the site first, then calling the API while the username lookup misses.
+    social = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|jit'))['social']
+    social.user.username = 'renamed'
+    social.user.save()
+    login_extra_data = social.extra_data
+
+    with CaptureQueriesContext(connection) as queries:
+        response = fast_request(make_claims())
+
+    assert response.status_code == 200
+    writes = [_query['sql'] for _query in queries.captured_queries if _query['sql'].startswith(('INSERT', 'UPDATE'))]
+    assert writes == []
+    social.refresh_from_db()
+    assert social.extra_data == login_extra_data
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_jit_provisioning_takes_auth_time_from_the_token(settings):
+    from django_auth0_user.provisioning import provision_auth0_user_from_claims
+
+    claims = make_claims(iat=int(time.time()) - 60)
+    user, _ = provision_auth0_user_from_claims(claims, 'token')
+
+    assert user.social_auth.get().extra_data['auth_time'] == claims['iat']
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_jit_provisioning_race_uses_the_concurrently_created_user(settings, monkeypatch):
+    from django.db import IntegrityError
+    from django_auth0_user.pipeline import AUTH0_LEAN_PIPELINE
+    from django_auth0_user.rest_framework import authentication
+    from tests.utils.pipeline import make_id_token_payload
+    from tests.utils.pipeline import run_auth0_pipeline
+
+    settings.AUTH0_JIT_PROVISIONING = True
+
+    def provision_concurrently(claims, access_token):
+        run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub=claims['sub']))
+        raise IntegrityError('duplicate key value violates unique constraint')
+
+    monkeypatch.setattr(authentication, 'provision_auth0_user_from_claims', provision_concurrently)
+
+    response = fast_request(make_claims())
+
+    assert response.status_code == 200
+    assert response.data['username'] == 'auth0|jit'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_jit_provisioning_conflict_is_an_authentication_failure(settings, monkeypatch):
+    from django.db import IntegrityError
+    from django_auth0_user.rest_framework import authentication
+
+    settings.AUTH0_JIT_PROVISIONING = True
+
+    def conflict(claims, access_token):
+        raise IntegrityError('duplicate key value violates unique constraint')
+
+    monkeypatch.setattr(authentication, 'provision_auth0_user_from_claims', conflict)
+
+    assert fast_request(make_claims()).status_code == 401
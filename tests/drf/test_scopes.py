@@ -0,0 +1,65 @@
+import time
+
+import pytest
+from rest_framework import viewsets
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework_jwt.utils import jwt_encode_handler
+
+from django_auth0_user.rest_framework.authentication import FullAuth0Authentication, StatelessAuth0Authentication
+from django_auth0_user.rest_framework.permissions import HasRequiredScopes
+
+
+class ScopedViewSet(viewsets.ViewSet):
+    authentication_classes = [StatelessAuth0Authentication]
+    permission_classes = [IsAuthenticated, HasRequiredScopes]
+    required_scopes = {'*': ['read:groups'], 'create': ['read:groups', 'write:groups']}
+
+    def list(self, request):
+        return Response([])
+
+    def create(self, request):
+        return Response({}, status=201)
+
+
+def scoped_request(method, scope='', permissions=()):
+    now = int(time.time())
+    token = jwt_encode_handler({
+        'sub': 'auth0|scoped', 'iat': now, 'exp': now + 600, 'scope': scope, 'permissions': list(permissions)
+    })
+    request = getattr(APIRequestFactory(), method)('/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    return ScopedViewSet.as_view({'get': 'list', 'post': 'create'})(request)
+
+
+@pytest.mark.nondestructive
+def test_default_action_scopes_are_enforced():
+    assert scoped_request('get', scope='openid read:groups').status_code == 200
+    assert scoped_request('get', scope='openid').status_code == 403
+
+
+@pytest.mark.nondestructive
+def test_per_action_scopes_accept_rbac_permissions():
+    assert scoped_request('post', scope='read:groups').status_code == 403
+    assert scoped_request('post', scope='read:groups', permissions=['write:groups']).status_code == 201
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_sample_group_endpoint_challenges_clients_without_a_token(django_user_model, monkeypatch):
+    from test_app.views import GroupViewSet
+
+    user = django_user_model.objects.create(username='auth0|scoped')
+    # A client the full class would authenticate without a verified token payload, and so without scopes.
+    monkeypatch.setattr(FullAuth0Authentication, 'authenticate', lambda self, request: (user, None))
+    view = GroupViewSet.as_view({'get': 'list'})
+
+    response = view(APIRequestFactory().get('/'))
+    assert response.status_code == 401
+    assert response['WWW-Authenticate'].startswith('JWT')
+
+    now = int(time.time())
+    token = jwt_encode_handler({
+        'sub': 'auth0|scoped', 'username': 'auth0|scoped', 'iat': now, 'exp': now + 600, 'scope': 'groups'
+    })
+    assert view(APIRequestFactory().get('/', HTTP_AUTHORIZATION='JWT {}'.format(token))).status_code == 200
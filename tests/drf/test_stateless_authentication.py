@@ -0,0 +1,65 @@
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_jwt.utils import jwt_encode_handler
+
+from django_auth0_user.rest_framework.authentication import StatelessAuth0Authentication
+from django_auth0_user.settings import auth0_user_settings
+from django_auth0_user.token_user import Auth0TokenUser
+
+
+class StatelessView(APIView):
+    authentication_classes = [StatelessAuth0Authentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'sub': request.user.sub, 'is_staff': request.user.is_staff})
+
+
+def make_claims(**claims):
+    now = int(time.time())
+    return {'sub': 'auth0|stateless', 'iat': now, 'exp': now + 600, 'scope': 'openid read:groups', **claims}
+
+
+def stateless_request(claims):
+    request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='JWT {}'.format(jwt_encode_handler(claims)))
+    return StatelessView.as_view()(request)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_stateless_authentication_makes_no_queries():
+    with CaptureQueriesContext(connection) as queries:
+        response = stateless_request(make_claims(**{auth0_user_settings.NAMESPACED_APP_METADATA_KEY: {'is_staff': True}}))
+
+    assert response.status_code == 200
+    assert response.data == {'sub': 'auth0|stateless', 'is_staff': True}
+    assert len(queries) == 0
+
+
+@pytest.mark.nondestructive
+def test_stateless_authentication_rejects_inactive_users():
+    response = stateless_request(make_claims(app_metadata={'is_active': False}))
+
+    assert response.status_code == 401
+
+
+@pytest.mark.nondestructive
+def test_token_user_reads_scopes_permissions_and_metadata():
+    user = Auth0TokenUser(make_claims(
+        permissions=['read:groups'],
+        **{auth0_user_settings.NAMESPACED_APP_METADATA_KEY: {'is_superuser': False}}
+    ))
+
+    assert user.scopes == frozenset(['openid', 'read:groups'])
+    assert user.has_perm('read:groups')
+    assert not user.has_perm('write:groups')
+    assert user.app_metadata == {'is_superuser': False}
+    assert user.user_metadata is None
+    assert not hasattr(user, '__dict__')
@@ -1,4 +1,5 @@
 import logging
+import os
 
 import pytest
 
@@ -13,7 +14,8 @@ from tests.utils.auth0 import (
 
 logger = logging.getLogger(__name__)
 
-DELAY = 15
+# Seconds to wait for Auth0 to index new users, 0 against the fake Auth0 server in tests.utils.fake_auth0.
+DELAY = float(os.environ.get('AUTH0_TEST_PROPAGATION_DELAY', 15))
 
 
 # TODO: Refactor/Remove these fixtures as I'm not using testing things the same way anymore.
@@ -177,7 +177,6 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'django_auth0_user.rest_framework.authentication.FastAuth0Authentication',
         'django_auth0_user.rest_framework.authentication.FullAuth0Authentication',
-        'django_auth0_user.drf_authentication.SocialAuthentication',
     ),
 }
 
@@ -0,0 +1,320 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from auth0.v3.exceptions import Auth0Error
+from django.core.cache import cache
+
+from django_auth0_user.util import auth0_api
+
+
+class RecordingUsers(object):
+    """Stands in for the auth0-python users endpoint, recording the calls made to it."""
+
+    def __init__(self, user_ids):
+        self.users = {_user_id: {'user_id': _user_id, 'email': '{}@example.com'.format(_user_id)} for _user_id in user_ids}
+        self.calls = []
+
+    def get(self, id, fields=None, include_fields=True):
+        self.calls.append(('get', id, fields))
+        return self.users[id]
+
+    def list(self, q=None, per_page=25, fields=None, **kwargs):
+        self.calls.append(('list', q, fields))
+        return [_user for _user_id, _user in self.users.items() if '"{}"'.format(_user_id) in q]
+
+    def update(self, id, body):
+        self.calls.append(('update', id, body))
+        if id not in self.users:
+            raise Auth0Error(404, 'inexistent_user', 'The user does not exist.')
+        if ('update', id, body) not in self.calls[:-1]:
+            # Every user is rate limited on the first attempt.
+            raise Auth0Error(429, 'too_many_requests', 'Global limit has been reached')
+        self.users[id].setdefault('app_metadata', {}).update(body.get('app_metadata', {}))
+        return self.users[id]
+
+
+class RecordingAuth0(object):
+    def __init__(self, user_ids):
+        self.users = RecordingUsers(user_ids)
+
+
+@pytest.fixture
+def auth0():
+    cache.clear()
+    yield RecordingAuth0(['auth0|{}'.format(_number) for _number in range(120)])
+    cache.clear()
+
+
+@pytest.mark.nondestructive
+def test_get_auth0_users_batches_searches(auth0, monkeypatch):
+    monkeypatch.setattr(auth0_api, 'AUTH0_USER_SEARCH_BATCH_SIZE', 50)
+    user_ids = ['auth0|{}'.format(_number) for _number in range(120)]
+
+    auth0_users = auth0_api.get_auth0_users(user_ids, auth0=auth0, fields=['email'])
+
+    assert set(auth0_users) == set(user_ids)
+    assert [_call[0] for _call in auth0.users.calls] == ['list', 'list', 'list']
+    assert auth0.users.calls[0][1].startswith('user_id:("auth0|0" OR "auth0|1" OR ')
+    assert auth0.users.calls[0][2] == ['email', 'user_id']
+
+
+@pytest.mark.nondestructive
+def test_get_auth0_users_uses_the_cache(auth0):
+    auth0_api.get_auth0_users(['auth0|1', 'auth0|2'], auth0=auth0)
+    auth0_api.get_auth0_users(['auth0|1', 'auth0|2', 'auth0|3'], auth0=auth0)
+    auth0_user = auth0_api.get_auth0_user('auth0|2', auth0=auth0)
+
+    assert auth0_user['email'] == 'auth0|2@example.com'
+    assert [_call[1] for _call in auth0.users.calls] == ['user_id:("auth0|1" OR "auth0|2")', 'user_id:("auth0|3")']
+
+
+@pytest.mark.nondestructive
+def test_get_auth0_user_without_cache(auth0, settings):
+    settings.AUTH0_MANAGEMENT_API_USER_CACHE_TTL = 0
+
+    auth0_api.get_auth0_user('auth0|1', auth0=auth0)
+    auth0_api.get_auth0_user('auth0|1', auth0=auth0)
+
+    assert auth0.users.calls == [('get', 'auth0|1', None), ('get', 'auth0|1', None)]
+
+
+@pytest.mark.nondestructive
+def test_field_presets_and_exclusions(auth0):
+    auth0_api.get_auth0_users(['auth0|1'], auth0=auth0, fields='ids')
+    auth0_api.get_auth0_users(['auth0|1'], auth0=auth0, fields=['identities', 'user_id'], include_fields=False)
+
+    assert auth0.users.calls[0][2] == ['user_id']
+    # Excluding user_id would make the results impossible to match back to their ids.
+    assert auth0.users.calls[1][2] == ['identities']
+
+
+@pytest.mark.nondestructive
+def test_django_pbkdf2_hashes_convert_to_phc_strings():
+    from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+    encoded = PBKDF2PasswordHasher().encode('secret', 'saltsalt', iterations=1000)
+
+    custom_hash = auth0_api.django_password_hash_to_auth0(encoded)['custom_password_hash']
+
+    assert custom_hash['algorithm'] == 'pbkdf2'
+    assert custom_hash['hash']['value'].startswith('$pbkdf2-sha256$i=1000,l=32$c2FsdHNhbHQ$')
+    assert not custom_hash['hash']['value'].endswith('=')
+
+
+@pytest.mark.nondestructive
+def test_other_django_hashes_convert_where_auth0_supports_them():
+    argon2 = 'argon2$argon2id$v=19$m=102400,t=2,p=8$c29tZXNhbHQ$aGFzaA'
+    bcrypt = 'bcrypt$$2b$12$abcdefghijklmnopqrstuuABCDEFGHIJKLMNOPQRSTUVWXYZ01234'
+
+    assert auth0_api.django_password_hash_to_auth0(argon2)['custom_password_hash']['hash']['value'] == (
+        '$argon2id$v=19$m=102400,t=2,p=8$c29tZXNhbHQ$aGFzaA'
+    )
+    assert auth0_api.django_password_hash_to_auth0(bcrypt) == {'password_hash': bcrypt[len('bcrypt$'):]}
+    assert auth0_api.django_password_hash_to_auth0('bcrypt_sha256$$2b$12$abc') == {}
+    assert auth0_api.django_password_hash_to_auth0('!unusable') == {}
+
+
+@pytest.mark.nondestructive
+def test_import_records_are_chunked_under_the_file_limit():
+    records = [{'email': 'user{}@example.com'.format(_number)} for _number in range(100)]
+
+    chunks = list(auth0_api.chunk_import_records(records, max_bytes=300))
+
+    assert all(len(_chunk) <= 300 for _chunk in chunks)
+    assert sum(len(json.loads(_chunk)) for _chunk in chunks) == 100
+
+
+class RecordingJobs(object):
+    def __init__(self):
+        self.imported = []
+        self.polls = {}
+
+    def import_users(self, connection_id, file_obj, upsert=False):
+        self.imported.append(json.loads(file_obj.read()))
+        return {'id': 'job_{}'.format(len(self.imported)), 'status': 'pending'}
+
+    def get(self, id):
+        self.polls[id] = self.polls.get(id, 0) + 1
+        if self.polls[id] == 1:
+            return {'id': id, 'status': 'processing'}
+        failed = 1 if id == 'job_1' else 0
+        summary = {'inserted': len(self.imported[int(id[4:]) - 1]) - failed, 'updated': 0, 'failed': failed}
+        return {'id': id, 'status': 'completed', 'summary': summary}
+
+    def get_failed_job(self, id):
+        return [{'user': {'email': 'user0@example.com'}, 'errors': [{'code': 'DUPLICATED_USER'}]}]
+
+
+@pytest.mark.nondestructive
+def test_import_users_to_auth0_runs_bounded_concurrent_jobs():
+    auth0 = RecordingAuth0([])
+    auth0.jobs = RecordingJobs()
+    records = [{'email': 'user{}@example.com'.format(_number)} for _number in range(100)]
+
+    result = auth0_api.import_users_to_auth0(
+        records, 'con_1', auth0=auth0, max_concurrent_jobs=2, poll_interval=0, max_bytes=1000
+    )
+
+    assert len(result['jobs']) == len(auth0.jobs.imported) > 2
+    assert (result['inserted'], result['failed']) == (99, 1)
+    assert result['errors'][0]['errors'][0]['code'] == 'DUPLICATED_USER'
+
+
+class BusyJobs(RecordingJobs):
+    """Answers 429 for too many pending jobs to the submits listed in `busy`, counted from 1."""
+
+    def __init__(self, busy):
+        super().__init__()
+        self.busy = busy
+        self.submits = 0
+
+    def import_users(self, connection_id, file_obj, upsert=False):
+        self.submits += 1
+        if self.submits in self.busy:
+            raise Auth0Error(429, 'too_many_requests', 'There are too many pending jobs')
+        return super().import_users(connection_id, file_obj, upsert)
+
+
+@pytest.mark.nondestructive
+def test_import_users_to_auth0_retries_rate_limited_submits():
+    auth0 = RecordingAuth0([])
+    auth0.jobs = BusyJobs(busy={2})
+    records = [{'email': 'user{}@example.com'.format(_number)} for _number in range(100)]
+
+    result = auth0_api.import_users_to_auth0(
+        records, 'con_1', auth0=auth0, max_concurrent_jobs=2, poll_interval=0, max_bytes=1000
+    )
+
+    assert result['error'] is None
+    assert sum(len(_records) for _records in auth0.jobs.imported) == 100
+
+
+@pytest.mark.nondestructive
+def test_import_users_to_auth0_returns_the_submitted_jobs_when_submitting_fails():
+    auth0 = RecordingAuth0([])
+    auth0.jobs = BusyJobs(busy={3, 4})
+    records = [{'email': 'user{}@example.com'.format(_number)} for _number in range(100)]
+
+    result = auth0_api.import_users_to_auth0(
+        records, 'con_1', auth0=auth0, max_concurrent_jobs=2, poll_interval=0, max_bytes=1000, max_retries=1
+    )
+
+    assert isinstance(result['error'], Auth0Error)
+    # The jobs submitted before the failure were still polled to the end.
+    assert result['jobs'] == ['job_1', 'job_2']
+    assert result['inserted'] + result['failed'] == sum(len(_records) for _records in auth0.jobs.imported)
+
+
+@pytest.mark.nondestructive
+def test_rate_limiter_spaces_out_requests():
+    rate_limiter = auth0_api.RateLimiter(rate=50)
+
+    started = time.monotonic()
+    for _ in range(6):
+        rate_limiter.acquire()
+
+    assert time.monotonic() - started >= 0.09
+
+
+@pytest.mark.nondestructive
+def test_bulk_update_auth0_users_retries_rate_limited_requests(auth0):
+    patch = {'app_metadata': {'is_staff': True}}
+    updates = [('auth0|{}'.format(_number), patch) for _number in range(10)] + [('auth0|missing', patch)]
+    progress = []
+
+    result = auth0_api.bulk_update_auth0_users(
+        iter(updates), auth0=auth0, workers=3, backoff=0, rate_limiter=auth0_api.RateLimiter(rate=1000, burst=10),
+        progress=lambda _result: progress.append(_result['updated'] + _result['failed']), progress_every=5,
+    )
+
+    assert (result['updated'], result['failed']) == (10, 1)
+    assert result['errors'][0][0] == 'auth0|missing'
+    assert len([_call for _call in auth0.users.calls if _call[0] == 'update']) == 21
+    assert auth0.users.users['auth0|3']['app_metadata'] == {'is_staff': True}
+    assert progress == [5, 10]
+
+
+class CountingTokenCache(auth0_api.TokenCache):
+    """A TokenCache that hands out numbered tokens instead of calling Auth0."""
+
+    def __init__(self, expires_in=3600, **kwargs):
+        super(CountingTokenCache, self).__init__(domain='example.auth0.com', refresh_margin=300, **kwargs)
+        self.expires_in = expires_in
+        self.requests = []
+
+    def _request_token(self, client_id, client_secret, audience, scope):
+        self.requests.append((client_id, audience, scope))
+        time.sleep(0.05)
+        now = time.time()
+        return 'token-{}'.format(len(self.requests)), now + self.expires_in - 300, now + self.expires_in
+
+
+@pytest.mark.nondestructive
+def test_token_cache_is_keyed_by_client_audience_and_scope():
+    token_cache = CountingTokenCache()
+
+    assert token_cache.get_token('https://a/', 'client', 'secret') == 'token-1'
+    assert token_cache.get_token('https://a/', 'client', 'secret') == 'token-1'
+    assert token_cache.get_token('https://a/', 'client', 'secret', scope='read:things') == 'token-2'
+    assert token_cache.get_token('https://b/', 'client', 'secret') == 'token-3'
+    assert len(token_cache.requests) == 3
+
+
+@pytest.mark.nondestructive
+def test_token_cache_refreshes_early_and_single_flight():
+    token_cache = CountingTokenCache()
+    token_cache.get_token('https://a/', 'client', 'secret')
+    # Inside the refresh margin, the token is still valid for a while.
+    key = ('client', 'https://a/', None)
+    token, _, expires_at = token_cache._tokens[key]
+    token_cache._tokens[key] = (token, time.time() - 1, expires_at)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = list(executor.map(lambda _: token_cache.get_token('https://a/', 'client', 'secret'), range(8)))
+
+    assert len(token_cache.requests) == 2
+    assert set(tokens) <= {'token-1', 'token-2'}
+    assert token_cache.get_token('https://a/', 'client', 'secret') == 'token-2'
+
+
+@pytest.mark.nondestructive
+def test_token_cache_waits_for_an_expired_token():
+    token_cache = CountingTokenCache()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = list(executor.map(lambda _: token_cache.get_token('https://a/', 'client', 'secret'), range(8)))
+
+    assert tokens == ['token-1'] * 8
+    assert len(token_cache.requests) == 1
+
+
+@pytest.mark.nondestructive
+def test_token_cache_can_be_shared_between_processes():
+    cache.clear()
+    first, second = CountingTokenCache(shared_cache='default'), CountingTokenCache(shared_cache='default')
+
+    assert first.get_token('https://a/', 'client', 'secret') == 'token-1'
+    assert second.get_token('https://a/', 'client', 'secret') == 'token-1'
+    assert second.requests == []
+
+    first.invalidate('https://a/', 'client')
+    assert second.get_token('https://a/', 'client', 'secret') == 'token-1'
+    assert first.get_token('https://a/', 'client', 'secret') == 'token-2'
+    cache.clear()
+
+
+@pytest.mark.nondestructive
+def test_bearer_auth_injects_and_invalidates_the_token():
+    token_cache = CountingTokenCache()
+    auth = auth0_api.Auth0BearerAuth('https://a/', 'client', 'secret', token_cache=token_cache)
+
+    request = requests.Request('GET', 'https://a/things', auth=auth).prepare()
+    assert request.headers['Authorization'] == 'Bearer token-1'
+
+    rejected = requests.Response()
+    rejected.status_code = 401
+    request.hooks['response'][0](rejected)
+    assert requests.Request('GET', 'https://a/things', auth=auth).prepare().headers['Authorization'] == 'Bearer token-2'
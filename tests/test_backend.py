@@ -0,0 +1,47 @@
+import pytest
+from social_django.utils import load_backend
+from social_django.utils import load_strategy
+
+from tests.utils.pipeline import make_id_token_payload
+from tests.utils.pipeline import make_token_response
+
+
+def complete_login(monkeypatch, id_token_payload):
+    """Run the part of the /complete/auth0/ callback after the token exchange, returning (user, userinfo calls)."""
+    userinfo_calls = []
+
+    def userinfo(url, *args, **kwargs):
+        # The OIDC discovery document, fetched to find the userinfo endpoint, is not a userinfo call.
+        if not (url or '').endswith('/.well-known/openid-configuration'):
+            userinfo_calls.append(url)
+        return dict(id_token_payload)
+
+    backend = load_backend(load_strategy(), 'auth0', redirect_uri=None)
+    monkeypatch.setattr(backend, 'get_json', userinfo)
+    backend.id_token = id_token_payload
+    response = make_token_response({})
+    user = backend.do_auth(response['access_token'], response=response)
+    return user, userinfo_calls
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_user_details_from_id_token_skips_userinfo(monkeypatch, settings):
+    settings.AUTH0_USER_DETAILS_FROM_ID_TOKEN = True
+
+    user, userinfo_calls = complete_login(monkeypatch, make_id_token_payload(sub='auth0|idtoken', given_name='Id'))
+
+    assert userinfo_calls == []
+    assert user.username == 'auth0|idtoken'
+    assert user.first_name == 'Id'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_user_details_from_userinfo_by_default(monkeypatch, settings):
+    settings.AUTH0_USER_DETAILS_FROM_ID_TOKEN = False
+
+    user, userinfo_calls = complete_login(monkeypatch, make_id_token_payload(sub='auth0|userinfo'))
+
+    assert len(userinfo_calls) == 1
+    assert user.username == 'auth0|userinfo'
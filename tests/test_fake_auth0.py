@@ -0,0 +1,118 @@
+import time
+from urllib.parse import urlparse
+
+import pytest
+import requests
+from django.test import RequestFactory
+from social_django.utils import load_backend
+from social_django.utils import load_strategy
+
+from django_auth0_user.models import Auth0LogCheckpoint
+from django_auth0_user.pipeline import AUTH0_LEAN_PIPELINE
+from django_auth0_user.sync import consume_auth0_logs
+from django_auth0_user.util.auth0_api import RateLimiter
+from django_auth0_user.util.auth0_api import bulk_update_auth0_users
+from django_auth0_user.util.auth0_api import get_auth0
+from django_auth0_user.util.auth0_api import get_auth0_users
+from django_auth0_user.util.auth0_api import get_users_from_auth0
+from django_auth0_user.util.auth0_api import import_users_to_auth0
+from django_auth0_user.util.auth0_api import setup_auth0_rules
+from django_auth0_user.util.auth0_api import tear_down_auth0_rules
+from tests.utils.fake_auth0 import DEFAULT_CONNECTION
+from tests.utils.pipeline import make_id_token_payload
+from tests.utils.pipeline import run_auth0_pipeline
+
+
+@pytest.mark.nondestructive
+def test_management_api_users_rules_and_jobs(fake_auth0):
+    auth0 = get_auth0()
+    created = auth0.users.create({'connection': DEFAULT_CONNECTION, 'email': 'new@example.com'})
+    seeded = fake_auth0.tenant.seed_users(60)
+
+    assert len(list(get_users_from_auth0(auth0))) == 61
+    found = get_auth0_users([created['user_id'], seeded[0]['user_id']], auth0=auth0, use_cache=False)
+    assert found[created['user_id']]['email'] == 'new@example.com'
+    assert found[seeded[0]['user_id']]['email'] == seeded[0]['email']
+
+    result = import_users_to_auth0(
+        [{'email': 'new@example.com', 'user_metadata': {'imported': True}}, {'email': 'imported@example.com'}],
+        DEFAULT_CONNECTION, auth0=auth0, poll_interval=0,
+    )
+    assert (result['inserted'], result['failed']) == (1, 1)
+
+    setup_auth0_rules(dry_run=False)
+    assert fake_auth0.tenant.rules
+    tear_down_auth0_rules(dry_run=False)
+    assert not fake_auth0.tenant.rules
+
+
+@pytest.mark.nondestructive
+def test_rate_limited_bulk_update_is_retried(fake_auth0):
+    users = fake_auth0.tenant.seed_users(10)
+    get_auth0()
+    fake_auth0.set_rate_limits(management=5)
+
+    result = bulk_update_auth0_users(
+        ((_user['user_id'], {'app_metadata': {'plan': 'pro'}}) for _user in users),
+        workers=4, backoff=0.1, max_retries=10, rate_limiter=RateLimiter(rate=100, burst=10),
+    )
+
+    assert (result['updated'], result['failed']) == (10, 0)
+    assert fake_auth0.rate_limited > 0
+    assert {_user['app_metadata']['plan'] for _user in fake_auth0.tenant.users.values()} == {'pro'}
+
+
+@pytest.mark.nondestructive
+def test_latency_is_added_to_every_request(fake_auth0):
+    fake_auth0.latency = 0.1
+    url = 'https://{}/.well-known/openid-configuration'.format(fake_auth0.domain)
+
+    started = time.perf_counter()
+    config = requests.get(url).json()
+
+    assert time.perf_counter() - started >= 0.1
+    assert config['issuer'] == 'https://{}/'.format(fake_auth0.domain)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_login_through_the_fake_tenant(fake_auth0, client):
+    from test_app.models import Auth0User
+
+    auth0_user = fake_auth0.tenant.create_user({'email': 'login@example.com', 'email_verified': True})
+
+    login = client.get('/login/auth0/')
+    assert login.url.startswith('https://{}/authorize?'.format(fake_auth0.domain))
+    callback = urlparse(requests.get(login.url, allow_redirects=False).headers['Location'])
+
+    # Completed through the backend rather than the view, with the state the login view stored in the session.
+    request = RequestFactory().get('{}?{}'.format(callback.path, callback.query))
+    request.session = client.session
+    backend = load_backend(load_strategy(request), 'auth0', redirect_uri=callback.path)
+    user = backend.complete()
+
+    assert user == Auth0User.objects.get(username=auth0_user['user_id'])
+    assert user.email == 'login@example.com'
+    assert ('GET', '/.well-known/jwks.json') in fake_auth0.requests
+    assert ('GET', '/userinfo') in fake_auth0.requests
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_consume_auth0_logs_from_the_fake_tenant(fake_auth0):
+    from test_app.models import Auth0User
+
+    auth0 = get_auth0()
+    blocked = auth0.users.create({'connection': DEFAULT_CONNECTION, 'email': 'blocked@example.com'})
+    deleted = auth0.users.create({'connection': DEFAULT_CONNECTION, 'email': 'deleted@example.com'})
+    for auth0_user in (blocked, deleted):
+        run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub=auth0_user['user_id']))
+    assert consume_auth0_logs(auth0=auth0) == (0, 0)
+
+    auth0.users.update(blocked['user_id'], {'blocked': True})
+    auth0.users.delete(deleted['user_id'])
+
+    assert consume_auth0_logs(auth0=auth0) == (3, 2)
+    assert Auth0LogCheckpoint.objects.get(name='default').log_id == fake_auth0.tenant.logs[-1]['log_id']
+    assert not Auth0User.objects.get(username=blocked['user_id']).is_active
+    assert not Auth0User.objects.get(username=deleted['user_id']).is_active
@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+# Modules the management commands and background workers import, none of them should need to verify a token.
+WORKER_MODULES = (
+    'django_auth0_user.log_stream',
+    'django_auth0_user.permission_checks',
+    'django_auth0_user.pipeline',
+    'django_auth0_user.sync',
+    'django_auth0_user.user_tokens',
+    'django_auth0_user.util.auth0_api',
+    'django_auth0_user.views',
+)
+# Only imported when a token is decoded or the Management API is called.
+DEFERRED_PACKAGES = ('auth0', 'jose', 'jwt')
+# Seconds, for importing the modules above on top of an already set up Django. Only enforced when set, since the
+# time depends on the machine, otherwise the timings are only reported.
+IMPORT_TIME_BUDGET = os.environ.get('AUTH0_TEST_IMPORT_TIME_BUDGET')
+SETUP_DONE = '-- django set up --'
+
+IMPORT_SCRIPT = '''
+import sys
+import django
+django.setup()
+sys.stderr.write({setup_done!r} + '\\n')
+sys.stderr.flush()
+{imports}
+print(' '.join(sorted({{_name.split('.')[0] for _name in sys.modules}} & {deferred!r})))
+'''
+
+
+def run_importtime(modules, importtime=True):
+    """
+    Import the modules in a fresh interpreter, with `-X importtime` unless `importtime` is False.
+
+    :return: A tuple of the deferred packages that got imported and {module: cumulative seconds} for the top level
+        imports made after Django was set up, empty without `importtime`.
+    """
+    script = IMPORT_SCRIPT.format(
+        setup_done=SETUP_DONE,
+        imports='\n'.join('import {}'.format(_module) for _module in modules),
+        deferred=set(DEFERRED_PACKAGES),
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    process = subprocess.run(
+        [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', script],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True, check=True,
+    )
+    timings = {}
+    for line in process.stderr.split(SETUP_DONE, 1)[1].splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented, their time is already part of the top level import's cumulative time.
+        if not name.startswith('   '):
+            timings[name.strip()] = int(cumulative) / 1e6
+    return process.stdout.split(), timings
+
+
+@pytest.mark.nondestructive
+def test_worker_modules_do_not_import_token_or_sdk_packages():
+    imported, timings = run_importtime(WORKER_MODULES, importtime=False)
+
+    assert imported == []
+
+
+@pytest.mark.nondestructive
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='-X importtime was added in Python 3.7.')
+def test_worker_modules_import_time(record_property):
+    imported, timings = run_importtime(WORKER_MODULES)
+
+    slowest = sorted(timings.items(), key=lambda _item: _item[1], reverse=True)[:5]
+    record_property('import_time', sum(timings.values()))
+    record_property('slowest_imports', slowest)
+    print('Imported the worker modules in {:.3f}s, slowest: {}'.format(sum(timings.values()), slowest))
+    assert timings
+    if IMPORT_TIME_BUDGET:
+        assert sum(timings.values()) < float(IMPORT_TIME_BUDGET), slowest
@@ -0,0 +1,117 @@
+import json
+
+import pytest
+from django.test import RequestFactory
+
+from django_auth0_user import log_stream
+from django_auth0_user import views
+from django_auth0_user.log_stream import LogStreamBuffer
+
+
+SECRET = 'log-stream-secret'
+
+
+class RunningWorker(object):
+    def is_alive(self):
+        return True
+
+
+@pytest.fixture
+def buffer(monkeypatch, settings):
+    buffer = LogStreamBuffer(flush_interval=0)
+    # Keep the worker thread out of the tests, they flush the buffer themselves.
+    buffer._worker = RunningWorker()
+    monkeypatch.setattr(log_stream, 'LOG_STREAM_BUFFER', buffer)
+    settings.AUTH0_LOG_STREAM_SECRET = SECRET
+    return buffer
+
+
+def log_stream_request(body, authorization=SECRET):
+    return RequestFactory().post(
+        '/auth0/log-stream/', data=body, content_type='application/json', HTTP_AUTHORIZATION=authorization
+    )
+
+
+def log_stream_body(*log_events):
+    return json.dumps([{'log_id': _event['_id'], 'data': _event} for _event in log_events])
+
+
+@pytest.mark.nondestructive
+def test_log_stream_rejects_requests_without_the_secret(buffer):
+    response = views.auth0_log_stream(log_stream_request(log_stream_body(), authorization='wrong'))
+
+    assert response.status_code == 403
+    assert buffer.queue.qsize() == 0
+
+
+@pytest.mark.nondestructive
+def test_log_stream_handler_only_enqueues(buffer, monkeypatch):
+    parsed, applied = [], []
+    monkeypatch.setattr(log_stream, 'log_events_from_body', lambda body: parsed.append(body) or [])
+    monkeypatch.setattr(log_stream, 'apply_auth0_user_changes', lambda *args: applied.append(args))
+    body = log_stream_body({'_id': '1', 'type': 'sdu', 'user_id': 'auth0|gone'})
+
+    responses = [views.auth0_log_stream(log_stream_request(body)) for _ in range(100)]
+
+    assert {_response.status_code for _response in responses} == {202}
+    # Neither parsed nor applied by the handler, the raw bodies wait on the queue for the worker.
+    assert parsed == [] and applied == []
+    assert buffer.queue.qsize() == 100
+    assert buffer.queue.get_nowait() == body.encode('utf-8')
+
+
+@pytest.mark.nondestructive
+def test_log_stream_buffer_applies_one_batch(buffer, monkeypatch):
+    applied = []
+    monkeypatch.setattr(log_stream, 'apply_auth0_user_changes', lambda *args: applied.append(args))
+
+    buffer.put(log_stream_body({'_id': '1', 'type': 'sdu', 'user_id': 'auth0|gone'}).encode('utf-8'))
+    buffer.put(b'not json')
+    buffer.put(log_stream_body({'_id': '2', 'type': 'ss', 'user_id': 'auth0|new'}).encode('utf-8'))
+
+    assert buffer.flush() == 2
+    assert applied == [({'auth0|new'}, {'auth0|gone'})]
+
+
+@pytest.mark.nondestructive
+def test_log_stream_buffer_restarts_a_dead_worker(monkeypatch):
+    started = []
+    buffer = LogStreamBuffer(flush_interval=0)
+    monkeypatch.setattr(buffer, '_run', lambda: started.append(True))
+
+    buffer.put(b'[]')
+    buffer._worker.join()
+    buffer.put(b'[]')
+    buffer._worker.join()
+
+    assert started == [True, True]
+
+
+@pytest.mark.nondestructive
+def test_log_stream_buffer_requeues_a_failed_batch(buffer, monkeypatch):
+    applied = []
+
+    def apply_auth0_user_changes(*args):
+        if not applied:
+            applied.append(None)
+            raise RuntimeError('database unavailable')
+        applied.append(args)
+
+    monkeypatch.setattr(log_stream, 'apply_auth0_user_changes', apply_auth0_user_changes)
+    buffer.put(log_stream_body({'_id': '1', 'type': 'sdu', 'user_id': 'auth0|gone'}).encode('utf-8'))
+
+    assert buffer.flush_or_requeue() == 0
+    assert buffer.queue.qsize() == 1
+    assert buffer.flush_or_requeue() == 1
+    assert applied == [None, (set(), {'auth0|gone'})]
+
+
+@pytest.mark.nondestructive
+def test_log_stream_buffer_drops_a_batch_after_the_last_attempt(buffer, monkeypatch):
+    monkeypatch.setattr(log_stream, 'apply_auth0_user_changes', lambda *args: 1 / 0)
+    buffer.put(log_stream_body({'_id': '1', 'type': 'sdu', 'user_id': 'auth0|gone'}).encode('utf-8'))
+
+    for _ in range(buffer.max_attempts):
+        buffer.flush_or_requeue()
+
+    assert buffer.queue.qsize() == 0
@@ -8,6 +8,18 @@ Tests for `django-db-auth0-user` models module.
 """
 # TODO: Remove Auth0User model & create an example custom user model. Everyone should have their own custom user model.
 import logging
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from django_auth0_user.models import Auth0Profile
+from django_auth0_user.pipeline import AUTH0_LEAN_PIPELINE
+from test_app.models import Auth0User
+from tests.utils.pipeline import make_id_token_payload
+from tests.utils.pipeline import run_auth0_pipeline
 
 
 logger = logging.getLogger(__name__)
@@ -138,3 +150,77 @@ logger = logging.getLogger(__name__)
 #     user = Auth0User(**{Auth0User.USERNAME_FIELD: user_data['user_id'], Auth0User.EMAIL_FIELD: user_data['email']})
 #     user.save()
 #     assert user.is_active
+
+
+@pytest.fixture
+def one_to_one_storage(settings):
+    settings.AUTH0_USER_DATA_STORAGE = 'one_to_one'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_auth0_data_loads_with_user_in_one_query(one_to_one_storage):
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|one-to-one'))
+
+    with CaptureQueriesContext(connection) as queries:
+        user = Auth0User.objects.select_related('auth0_profile').get(username='auth0|one-to-one')
+        assert user.auth0_data['id_token_payload']['sub'] == 'auth0|one-to-one'
+
+    assert len(queries) == 1
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_migrate_auth0_profiles_copies_social_auth_rows():
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|already-migrated'))
+    call_command('migrate_auth0_profiles', stdout=StringIO())
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|migrated'))
+
+    out = StringIO()
+    call_command('migrate_auth0_profiles', stdout=out)
+
+    profile = Auth0Profile.objects.get(uid='auth0|migrated')
+    assert profile.user.username == 'auth0|migrated'
+    assert profile.extra_data['id_token_payload']['sub'] == 'auth0|migrated'
+    assert 'Copied 1 social auth rows' in out.getvalue()
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+@pytest.mark.parametrize('processes', [0, 2])
+def test_enable_superuser_reapplies_permission_checks(processes):
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|admin', app_metadata={'is_staff': True}))
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|regular'))
+    Auth0User.objects.update(is_staff=False)
+
+    out = StringIO()
+    call_command('enable_superuser', '--batch-size=1', '--processes={}'.format(processes), stdout=out)
+
+    assert Auth0User.objects.get(username='auth0|admin').is_staff is True
+    assert Auth0User.objects.get(username='auth0|regular').is_staff is False
+    assert 'Updated 1 of 2 users' in out.getvalue()
+
+
+def staff_check_that_fails_for_broken_users(auth0_user):
+    if auth0_user.username == 'auth0|broken':
+        raise KeyError('is_staff')
+    return True
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_enable_superuser_skips_local_users_and_reports_failing_checks(settings):
+    Auth0User.objects.create_superuser('local-admin', 'admin@example.com', 'password')
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|broken'))
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|staff'))
+    Auth0User.objects.update(is_staff=False)
+    settings.AUTH0_USER_IS_STAFF_CHECK_FUNCTION = 'tests.test_models.staff_check_that_fails_for_broken_users'
+
+    out, err = StringIO(), StringIO()
+    call_command('enable_superuser', '--batch-size=1', stdout=out, stderr=err)
+
+    local_admin = Auth0User.objects.get(username='local-admin')
+    assert local_admin.is_superuser is True and local_admin.is_staff is False
+    assert Auth0User.objects.get(username='auth0|staff').is_staff is True
+    assert 'Updated 1 of 2 users' in out.getvalue() and 'failed for 1 users' in out.getvalue()
+    assert 'KeyError' in err.getvalue()
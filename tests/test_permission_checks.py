@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+from django.test import override_settings
+
+from django_auth0_user.permission_checks import PERMISSION_CHECKS
+from django_auth0_user.permission_checks import PermissionCheckRegistry
+from django_auth0_user.permission_checks import all_of
+from django_auth0_user.permission_checks import any_of
+from django_auth0_user.permission_checks import auth0_user_is_staff
+from django_auth0_user.token_user import Auth0TokenUser
+
+
+def has_company_email(auth0_user):
+    return auth0_user.sub.endswith('@example.com')
+
+
+def is_blocked(auth0_user):
+    return bool(auth0_user.app_metadata.get('blocked'))
+
+
+def make_token_user(sub='user@example.com', **app_metadata):
+    return Auth0TokenUser({'sub': sub, 'app_metadata': app_metadata})
+
+
+@pytest.mark.nondestructive
+def test_checks_are_resolved_on_first_use_and_cached():
+    registry = PermissionCheckRegistry()
+    registry.register('is_staff', 'AUTH0_USER_IS_STAFF_CHECK_FUNCTION', 'tests.test_permission_checks.not_a_check')
+
+    with override_settings(AUTH0_USER_IS_STAFF_CHECK_FUNCTION='tests.test_permission_checks.has_company_email'):
+        assert registry.get('is_staff') is has_company_email
+    # The registry is not connected to setting_changed, so the resolved check outlives the override.
+    assert registry.get('is_staff') is has_company_email
+
+    registry.invalidate()
+    with pytest.raises(ImportError):
+        registry.get('is_staff')
+
+
+@pytest.mark.nondestructive
+def test_checks_are_invalidated_when_their_setting_changes():
+    assert PERMISSION_CHECKS.get('is_staff') is auth0_user_is_staff
+
+    with override_settings(AUTH0_USER_IS_STAFF_CHECK_FUNCTION='tests.test_permission_checks.has_company_email'):
+        assert make_token_user().is_staff is True
+        assert make_token_user(sub='user@elsewhere.com', is_staff=True).is_staff is False
+
+    assert PERMISSION_CHECKS.get('is_staff') is auth0_user_is_staff
+
+
+@pytest.mark.nondestructive
+def test_checks_can_be_composed():
+    is_staff = any_of('tests.test_permission_checks.has_company_email', auth0_user_is_staff)
+
+    assert is_staff(make_token_user(sub='user@elsewhere.com', is_staff=True)) is True
+    assert is_staff(make_token_user(sub='user@elsewhere.com')) is False
+    assert all_of(has_company_email, lambda _user: not is_blocked(_user))(make_token_user(blocked=True)) is False
+
+    with override_settings(AUTH0_USER_IS_ACTIVE_CHECK_FUNCTION=[
+        'django_auth0_user.permission_checks.auth0_user_is_active', 'tests.test_permission_checks.has_company_email',
+    ]):
+        assert make_token_user().is_active is True
+        assert make_token_user(sub='user@elsewhere.com').is_active is False
+
+
+def slow_import_check(auth0_user):
+    return False
+
+
+@pytest.mark.nondestructive
+def test_concurrent_first_calls_never_see_partly_resolved_checks(monkeypatch):
+    from django_auth0_user import permission_checks
+
+    resolving = threading.Event()
+    resume = threading.Event()
+    resolve_check = permission_checks._resolve_check
+
+    def slow_resolve_check(check):
+        if check == 'tests.test_permission_checks.slow_import_check' and not resolving.is_set():
+            # Hold the first caller after the first check was resolved, while it imports the second one.
+            resolving.set()
+            resume.wait(5)
+        return resolve_check(check)
+
+    monkeypatch.setattr(permission_checks, '_resolve_check', slow_resolve_check)
+    is_staff = all_of(auth0_user_is_staff, 'tests.test_permission_checks.slow_import_check')
+    auth0_user = make_token_user(is_staff=True)
+    results = []
+    first_call = threading.Thread(target=lambda: results.append(is_staff(auth0_user)))
+    first_call.start()
+    assert resolving.wait(5)
+
+    # The second check is still being imported by the first call, it must not be skipped.
+    assert is_staff(auth0_user) is False
+    resume.set()
+    first_call.join(5)
+    assert results == [False]
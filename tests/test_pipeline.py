@@ -0,0 +1,112 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from django_auth0_user.models import Auth0Profile
+from django_auth0_user.pipeline import AUTH0_PIPELINE
+from django_auth0_user.pipeline import claims_digest
+from tests.utils.pipeline import make_id_token_payload
+from tests.utils.pipeline import run_auth0_pipeline
+
+
+@pytest.mark.nondestructive
+def test_claims_digest_ignores_volatile_values():
+    first = {'auth_time': 1, 'access_token': 'a', 'id_token_payload': {'sub': 'auth0|1', 'iat': 1, 'nonce': 'x'}}
+    second = {'auth_time': 2, 'access_token': 'b', 'id_token_payload': {'sub': 'auth0|1', 'iat': 2, 'nonce': 'y'}}
+    assert claims_digest(first) == claims_digest(second)
+
+
+@pytest.mark.nondestructive
+def test_claims_digest_tracks_profile_changes():
+    first = {'id_token_payload': {'sub': 'auth0|1', 'email': 'old@example.com'}}
+    second = {'id_token_payload': {'sub': 'auth0|1', 'email': 'new@example.com'}}
+    assert claims_digest(first) != claims_digest(second)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_repeat_login_with_unchanged_claims_only_writes_the_tokens():
+    run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload())
+
+    with CaptureQueriesContext(connection) as queries:
+        out = run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload())
+
+    assert out['claims_changed'] is False
+    writes = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith('SELECT')]
+    assert len(writes) == 1 and writes[0].startswith('UPDATE "social_auth_usersocialauth" SET "extra_data"')
+    stored_access_token = out['social'].extra_data['access_token']
+    out['social'].refresh_from_db()
+    assert out['social'].extra_data['access_token'] == stored_access_token == out['response']['access_token']
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_repeat_login_with_unchanged_claims_copies_the_tokens_to_the_profile(settings):
+    settings.AUTH0_USER_DATA_STORAGE = 'one_to_one'
+    run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload())
+    out = run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload())
+
+    assert out['claims_changed'] is False
+    profile = Auth0Profile.objects.get(pk=out['user'].pk)
+    assert profile.extra_data['access_token'] == out['response']['access_token']
+    assert profile.extra_data['claims_digest'] == out['social'].extra_data['claims_digest']
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_repeat_login_with_changed_claims_writes_extra_data():
+    run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload())
+    out = run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload(nickname='renamed'))
+
+    assert out['claims_changed'] is True
+    out['social'].refresh_from_db()
+    assert out['social'].extra_data['id_token_payload']['nickname'] == 'renamed'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_throttled_last_login_skips_recent_logins(settings):
+    from django.utils import timezone
+    from django_auth0_user import signals
+    from test_app.models import Auth0User
+
+    settings.AUTH0_LAST_LOGIN_GRANULARITY = 300
+    recent_login = timezone.now()
+    user = Auth0User.objects.create(username='auth0|throttled', last_login=recent_login)
+
+    with CaptureQueriesContext(connection) as queries:
+        signals.throttled_update_last_login(sender=Auth0User, user=user)
+
+    assert len(queries) == 0
+    assert user.last_login == recent_login
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_permission_flags_are_stored_at_login():
+    out = run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload(app_metadata={'is_superuser': True}))
+
+    out['user'].refresh_from_db()
+    assert out['user'].is_superuser is True
+    assert out['user'].is_staff is True
+    assert out['user'].is_active is True
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_permission_flags_follow_app_metadata_changes():
+    run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload(app_metadata={'is_staff': True}))
+    out = run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload(app_metadata={'is_staff': False}))
+
+    out['user'].refresh_from_db()
+    assert out['user'].is_staff is False
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_permission_flags_leave_the_social_auth_relation_usable():
+    out = run_auth0_pipeline(AUTH0_PIPELINE, make_id_token_payload(app_metadata={'is_staff': True}))
+
+    assert out['user'].is_staff is True
+    assert out['user'].social_auth.filter(provider='auth0').count() == 1
+    assert out['user'].social_auth.exists()
@@ -0,0 +1,161 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from social_core.exceptions import AuthAlreadyAssociated
+from social_core.pipeline import DEFAULT_AUTH_PIPELINE
+
+from django_auth0_user.pipeline import AUTH0_LEAN_PIPELINE
+from django_auth0_user.pipeline import AUTH0_PIPELINE
+from django_auth0_user.provisioning import upsert_auth0_user
+from test_app.models import Auth0User
+from tests.utils.pipeline import make_id_token_payload
+from tests.utils.pipeline import run_auth0_pipeline
+
+
+def count_login_queries(pipeline, id_token_payload):
+    with CaptureQueriesContext(connection) as queries:
+        run_auth0_pipeline(pipeline, id_token_payload)
+    # Transaction control statements are not counted, only the reads and writes.
+    return len([query for query in queries.captured_queries if query['sql'] != 'BEGIN'])
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_lean_pipeline_provisions_user_and_association():
+    out = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean', given_name='Lean'))
+
+    assert out['is_new'] is True
+    assert out['user'].username == 'auth0|lean'
+    assert out['user'].first_name == 'Lean'
+    assert out['social'].uid == 'auth0|lean'
+    assert out['user'].auth0_data['id_token_payload']['sub'] == 'auth0|lean'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_lean_pipeline_first_login_uses_fewer_statements_than_stock():
+    stock = count_login_queries(DEFAULT_AUTH_PIPELINE, make_id_token_payload(sub='auth0|stock'))
+    lean = count_login_queries(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean'))
+
+    assert lean == 3
+    assert lean < stock
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_lean_pipeline_repeat_login_uses_no_more_statements_than_stock():
+    run_auth0_pipeline(DEFAULT_AUTH_PIPELINE, make_id_token_payload(sub='auth0|stock'))
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean'))
+
+    stock = count_login_queries(DEFAULT_AUTH_PIPELINE, make_id_token_payload(sub='auth0|stock'))
+    lean = count_login_queries(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean'))
+
+    # The joined SELECT, and the UPDATE storing the new tokens of this login.
+    assert lean == 2
+    assert lean <= stock
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_lean_pipeline_repeat_login_with_changed_claims_updates_extra_data():
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean'))
+    out = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean', nickname='renamed'))
+
+    assert out['is_new'] is False
+    assert out['claims_changed'] is True
+    out['social'].refresh_from_db()
+    assert out['social'].extra_data['id_token_payload']['nickname'] == 'renamed'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_lean_pipeline_repeat_login_updates_unprotected_user_fields():
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean', given_name='Old', family_name='Name'))
+    out = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(
+        sub='auth0|lean', given_name='New', family_name='Name', email='new@example.com'
+    ))
+
+    out['user'].refresh_from_db()
+    assert out['user'].first_name == 'New'
+    # Protected by default, like social_core's user_details step.
+    assert out['user'].email == 'user@example.com'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_lean_pipeline_repeat_login_honours_protected_user_fields(settings):
+    settings.SOCIAL_AUTH_PROTECTED_USER_FIELDS = ['first_name']
+    settings.SOCIAL_AUTH_NO_DEFAULT_PROTECTED_USER_FIELDS = True
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean', given_name='Old'))
+    out = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(
+        sub='auth0|lean', given_name='New', email='new@example.com'
+    ))
+
+    out['user'].refresh_from_db()
+    assert out['user'].first_name == 'Old'
+    assert out['user'].email == 'new@example.com'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_lean_pipeline_repeat_login_stores_the_new_tokens():
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean'))
+    out = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|lean'))
+
+    assert out['claims_changed'] is False
+    out['social'].refresh_from_db()
+    assert out['social'].extra_data['access_token'] == out['response']['access_token']
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_upsert_suffixes_a_username_taken_by_another_user(settings):
+    settings.AUTH0_USER_ID_IS_DJANGO_USERNAME = False
+    Auth0User.objects.create(username='taken')
+
+    user, social, created, changed = upsert_auth0_user(
+        'auth0|new', {'username': 'taken'}, {'id_token_payload': {'sub': 'auth0|new'}},
+    )
+
+    assert created is True
+    assert user.username.startswith('taken') and user.username != 'taken'
+    assert social.uid == 'auth0|new' and social.user == user
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_lean_pipeline_does_not_take_over_a_user_named_after_the_uid():
+    Auth0User.objects.create(username='auth0|local')
+
+    with pytest.raises(AuthAlreadyAssociated):
+        run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|local'))
+
+    assert not Auth0User.objects.get(username='auth0|local').social_auth.exists()
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+@pytest.mark.parametrize('pipeline', [AUTH0_PIPELINE, AUTH0_LEAN_PIPELINE])
+def test_first_login_is_associated_with_the_imported_django_user(pipeline):
+    imported = Auth0User.objects.create(username='django-user', email='user@example.com')
+
+    out = run_auth0_pipeline(pipeline, make_id_token_payload(
+        sub='auth0|imported', app_metadata={'django_user_id': imported.pk}
+    ))
+
+    assert out['user'] == imported
+    assert out['social'].user_id == imported.pk
+    assert Auth0User.objects.count() == 1
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+@pytest.mark.parametrize('pipeline', [AUTH0_PIPELINE, AUTH0_LEAN_PIPELINE])
+def test_imported_django_user_already_associated_is_not_taken_over(pipeline):
+    first = run_auth0_pipeline(pipeline, make_id_token_payload(sub='auth0|first'))['user']
+
+    out = run_auth0_pipeline(pipeline, make_id_token_payload(
+        sub='auth0|second', app_metadata={'django_user_id': first.pk}
+    ))
+
+    assert out['user'] != first
@@ -0,0 +1,103 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from django_auth0_user import rbac
+from django_auth0_user.token_user import Auth0TokenUser
+
+
+RBAC_MAP = {
+    'read:groups': {'groups': ['Group Readers'], 'permissions': ['auth.view_group']},
+    'write:groups': {'groups': ['Group Writers'], 'permissions': ['auth.add_group', 'auth.change_group']},
+}
+
+
+@pytest.fixture
+def rbac_map(settings):
+    # Changing the setting recompiles the map.
+    settings.AUTH0_RBAC_MAP = RBAC_MAP
+    cache.clear()
+    return RBAC_MAP
+
+
+@pytest.mark.nondestructive
+def test_rbac_map_compiles_to_lookup_tables(rbac_map):
+    tables = rbac.compile_rbac_map()
+
+    assert tables.managed_groups == frozenset(['Group Readers', 'Group Writers'])
+    assert rbac.django_permissions_for(frozenset(['read:groups', 'write:groups', 'unmapped'])) == frozenset(
+        ['auth.view_group', 'auth.add_group', 'auth.change_group']
+    )
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_has_perm_is_answered_from_token_permissions_without_queries(rbac_map):
+    from test_app.models import Auth0User
+
+    user = Auth0User.objects.create(username='auth0|rbac')
+    user.auth0_permissions = frozenset(['read:groups'])
+
+    with CaptureQueriesContext(connection) as queries:
+        assert user.has_perm('auth.view_group') is True
+        assert user.has_perm('auth.add_group') is False
+        assert user.has_module_perms('auth') is True
+
+    assert len(queries) == 0
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_group_membership_is_only_synced_when_permissions_change(rbac_map):
+    from test_app.models import Auth0User
+
+    user = Auth0User.objects.create(username='auth0|rbac')
+
+    assert rbac.sync_user_groups(user, ['read:groups', 'write:groups']) is True
+    with CaptureQueriesContext(connection) as queries:
+        assert rbac.sync_user_groups(user, ['write:groups', 'read:groups']) is False
+    assert len(queries) == 0
+
+    assert rbac.sync_user_groups(user, ['write:groups']) is True
+    assert list(user.groups.values_list('name', flat=True)) == ['Group Writers']
+
+
+@pytest.mark.nondestructive
+def test_token_user_has_mapped_django_permissions(rbac_map):
+    user = Auth0TokenUser({'sub': 'auth0|rbac', 'permissions': ['write:groups']})
+
+    assert user.has_perm('write:groups') is True
+    assert user.has_perm('auth.change_group') is True
+    assert user.has_perm('auth.view_group') is False
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_group_membership_follows_rbac_map_changes(settings):
+    from test_app.models import Auth0User
+
+    settings.AUTH0_RBAC_MAP = {'read:groups': {'groups': ['A']}}
+    cache.clear()
+    user = Auth0User.objects.create(username='auth0|rbac')
+    assert rbac.sync_user_groups(user, ['read:groups']) is True
+
+    settings.AUTH0_RBAC_MAP = {'read:groups': {'groups': ['B']}}
+
+    assert rbac.sync_user_groups(user, ['read:groups']) is True
+    assert list(user.groups.values_list('name', flat=True)) == ['B']
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_group_membership_digest_expires(rbac_map, settings, monkeypatch):
+    from test_app.models import Auth0User
+
+    settings.AUTH0_RBAC_GROUPS_SYNC_INTERVAL = 60
+    timeouts = []
+    monkeypatch.setattr(rbac.cache, 'set', lambda key, value, timeout: timeouts.append(timeout))
+    user = Auth0User.objects.create(username='auth0|rbac')
+
+    rbac.sync_user_groups(user, ['read:groups'])
+
+    assert timeouts == [60]
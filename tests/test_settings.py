@@ -0,0 +1,41 @@
+import pytest
+from django.test import override_settings
+
+from django_auth0_user import settings as auth0_settings_module
+from django_auth0_user.settings import Auth0UserSettings
+from django_auth0_user.settings import auth0_user_settings
+
+
+@pytest.mark.nondestructive
+def test_settings_are_resolved_in_order_on_first_use():
+    lazy_settings = Auth0UserSettings()
+
+    with override_settings(AUTH0_JIT_PROVISIONING=None, SOCIAL_AUTH_AUTH0_JIT_PROVISIONING=True):
+        assert lazy_settings.JIT_PROVISIONING is True
+    # Cached, a settings object created outside of the override does not see it being undone.
+    assert lazy_settings.JIT_PROVISIONING is True
+    assert Auth0UserSettings().JIT_PROVISIONING is False
+
+    with pytest.raises(AttributeError):
+        lazy_settings.NOT_A_SETTING
+
+
+@pytest.mark.nondestructive
+def test_settings_are_reloaded_when_overridden():
+    default_prefix = auth0_user_settings.NAMESPACED_KEY_PREFIX
+
+    with override_settings(AUTH0_NAMESPACED_KEY_PREFIX='https://example.com'):
+        assert auth0_user_settings.NAMESPACED_APP_METADATA_KEY == 'https://example.com/app_metadata'
+        assert auth0_settings_module.NAMESPACED_KEY_PREFIX == 'https://example.com'
+
+    assert auth0_user_settings.NAMESPACED_KEY_PREFIX == default_prefix
+
+
+@pytest.mark.nondestructive
+def test_default_rule_configs_alias_follows_the_namespace_settings():
+    with override_settings(AUTH0_NAMESPACED_KEY_PREFIX='https://example.com'):
+        assert auth0_settings_module.DEFAULT_AUTH0_RULE_CONFIGS == {
+            'DJANGO_AUTH0_USER_OIDC_NAMESPACE_PREFIX': 'https://example.com',
+            'DJANGO_AUTH0_USER_NAMESPACED_USER_METADATA_KEY': 'https://example.com/user_metadata',
+            'DJANGO_AUTH0_USER_NAMESPACED_APP_METADATA_KEY': 'https://example.com/app_metadata',
+        }
@@ -0,0 +1,218 @@
+from io import StringIO
+
+import pytest
+import requests
+from auth0.v3.exceptions import Auth0Error
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from django_auth0_user.models import Auth0LogCheckpoint
+from django_auth0_user.models import Auth0UserMirror
+from django_auth0_user.pipeline import AUTH0_LEAN_PIPELINE
+from django_auth0_user.sync import consume_auth0_logs
+from django_auth0_user.sync import sync_auth0_user_mirrors
+from django_auth0_user.sync import user_changes_from_log_events
+from tests.utils.pipeline import make_id_token_payload
+from tests.utils.pipeline import run_auth0_pipeline
+
+
+def make_auth0_user(user_id, email, **fields):
+    auth0_user = {
+        'user_id': user_id,
+        'email': email,
+        'email_verified': True,
+        'name': email,
+        'identities': [{'connection': 'Username-Password-Authentication', 'provider': 'auth0'}],
+        'created_at': '2019-01-01T00:00:00.000Z',
+        'updated_at': '2019-01-02T00:00:00.000Z',
+        'app_metadata': {},
+    }
+    auth0_user.update(fields)
+    return auth0_user
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_mirror_is_searchable_by_indexed_columns():
+    sync_auth0_user_mirrors([
+        make_auth0_user('auth0|1', 'First@Example.com', app_metadata={'plan': 'pro'}),
+        make_auth0_user('auth0|2', 'second@example.com', blocked=True),
+    ])
+
+    assert Auth0UserMirror.objects.by_email('first@example.com').get().user_id == 'auth0|1'
+    assert Auth0UserMirror.objects.by_connection('Username-Password-Authentication').count() == 2
+    assert [_mirror.user_id for _mirror in Auth0UserMirror.objects.blocked()] == ['auth0|2']
+    assert [_mirror.user_id for _mirror in Auth0UserMirror.objects.with_metadata('plan', 'pro')] == ['auth0|1']
+    assert not Auth0UserMirror.objects.with_metadata('plan', 'pro').blocked().exists()
+    assert Auth0UserMirror.objects.get(user_id='auth0|1').updated_at.year == 2019
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_mirror_sync_updates_in_batches_and_prunes():
+    sync_auth0_user_mirrors([make_auth0_user('auth0|1', 'a@example.com'), make_auth0_user('auth0|2', 'b@example.com')])
+
+    with CaptureQueriesContext(connection) as queries:
+        stored, pruned = sync_auth0_user_mirrors([make_auth0_user('auth0|1', 'renamed@example.com')], prune=True)
+
+    assert (stored, pruned) == (1, 1)
+    assert list(Auth0UserMirror.objects.values_list('email', flat=True)) == ['renamed@example.com']
+    assert len([_query for _query in queries.captured_queries if _query['sql'].startswith('UPDATE')]) == 1
+
+
+class FakeLogs(object):
+    def __init__(self, log_events):
+        self.log_events = log_events
+        self.searches = []
+
+    def search(self, per_page=50, sort=None, include_totals=True, from_param=None, take=None, **kwargs):
+        self.searches.append(from_param)
+        if from_param is None:
+            return self.log_events[-1:]
+        ids = [_event['_id'] for _event in self.log_events]
+        return self.log_events[ids.index(from_param) + 1:][:take]
+
+
+class FakeUsers(object):
+    def __init__(self, auth0_users, unindexed_users=(), error=None):
+        self.auth0_users = auth0_users
+        self.unindexed_users = list(unindexed_users)
+        self.error = error
+
+    def list(self, q=None, **kwargs):
+        return [_user for _user in self.auth0_users if '"{}"'.format(_user['user_id']) in q]
+
+    def get(self, user_id, **kwargs):
+        if self.error is not None:
+            raise self.error
+        for auth0_user in self.auth0_users + self.unindexed_users:
+            if auth0_user['user_id'] == user_id:
+                return auth0_user
+        raise Auth0Error(404, 'inexistent_user', 'The user does not exist.')
+
+
+class FakeAuth0(object):
+    def __init__(self, log_events, auth0_users, unindexed_users=(), error=None):
+        self.logs = FakeLogs(log_events)
+        self.users = FakeUsers(auth0_users, unindexed_users, error)
+
+
+@pytest.mark.nondestructive
+def test_user_changes_are_picked_out_of_log_events():
+    changed_ids, deleted_ids = user_changes_from_log_events([
+        {'type': 'ss', 'user_id': 'auth0|new'},
+        {'type': 's', 'user_id': 'auth0|login'},
+        {'type': 'sapi', 'details': {'request': {'method': 'patch', 'path': '/api/v2/users/auth0%7Cblocked'}}},
+        {'type': 'sapi', 'details': {'request': {'method': 'get', 'path': '/api/v2/users/auth0%7Cread'}}},
+        {'type': 'sdu', 'user_id': 'auth0|gone'},
+        {'type': 'limit_wc', 'user_id': 'auth0|brute-forced'},
+    ])
+
+    assert changed_ids == {'auth0|new', 'auth0|blocked'}
+    assert deleted_ids == {'auth0|gone'}
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_consume_auth0_logs_applies_changes_from_the_checkpoint():
+    from test_app.models import Auth0User
+
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|blocked'))
+    run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub='auth0|gone'))
+    auth0 = FakeAuth0(
+        log_events=[
+            {'_id': '1', 'type': 's', 'user_id': 'auth0|blocked'},
+            {'_id': '2', 'type': 'sapi',
+             'details': {'request': {'method': 'patch', 'path': '/api/v2/users/auth0%7Cblocked'}}},
+            {'_id': '3', 'type': 'sdu', 'user_id': 'auth0|gone'},
+        ],
+        auth0_users=[make_auth0_user('auth0|blocked', 'blocked@example.com', blocked=True)],
+    )
+    Auth0LogCheckpoint.objects.create(name='default', log_id='1')
+
+    assert consume_auth0_logs(auth0=auth0, take=1) == (2, 2)
+    assert consume_auth0_logs(auth0=auth0, take=1) == (0, 0)
+
+    assert auth0.logs.searches == ['1', '2', '3', '3']
+    assert Auth0LogCheckpoint.objects.get(name='default').log_id == '3'
+    assert Auth0User.objects.get(username='auth0|blocked').is_active is False
+    assert Auth0User.objects.get(username='auth0|gone').is_active is False
+    assert Auth0UserMirror.objects.get().blocked is True
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_consume_auth0_logs_starts_from_the_latest_event():
+    auth0 = FakeAuth0(log_events=[{'_id': '1', 'type': 'ss', 'user_id': 'auth0|old'}], auth0_users=[])
+
+    assert consume_auth0_logs(auth0=auth0) == (0, 0)
+    assert Auth0LogCheckpoint.objects.get(name='default').log_id == '1'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_consume_auth0_logs_fetches_users_missing_from_the_search_index():
+    auth0 = FakeAuth0(
+        log_events=[
+            {'_id': '1', 'type': 's', 'user_id': 'auth0|old'},
+            {'_id': '2', 'type': 'ss', 'user_id': 'auth0|new'},
+            {'_id': '3', 'type': 'ss', 'user_id': 'auth0|deleted-since'},
+        ],
+        auth0_users=[],
+        unindexed_users=[make_auth0_user('auth0|new', 'new@example.com')],
+    )
+    Auth0LogCheckpoint.objects.create(name='default', log_id='1')
+
+    assert consume_auth0_logs(auth0=auth0) == (2, 0)
+
+    assert list(Auth0UserMirror.objects.values_list('user_id', flat=True)) == ['auth0|new']
+    assert Auth0LogCheckpoint.objects.get(name='default').log_id == '3'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_consume_auth0_logs_keeps_the_checkpoint_when_a_user_cannot_be_fetched():
+    auth0 = FakeAuth0(
+        log_events=[{'_id': '1', 'type': 's', 'user_id': 'auth0|old'}, {'_id': '2', 'type': 'ss', 'user_id': 'auth0|new'}],
+        auth0_users=[],
+        error=Auth0Error(429, 'too_many_requests', 'Too Many Requests'),
+    )
+    Auth0LogCheckpoint.objects.create(name='default', log_id='1')
+
+    with pytest.raises(Auth0Error):
+        consume_auth0_logs(auth0=auth0)
+
+    assert Auth0LogCheckpoint.objects.get(name='default').log_id == '1'
+    assert not Auth0UserMirror.objects.exists()
+
+
+class StopDaemon(Exception):
+    pass
+
+
+@pytest.mark.nondestructive
+def test_consume_auth0_logs_daemon_backs_off_on_errors(monkeypatch):
+    from django_auth0_user.management.commands import consume_auth0_logs as command
+
+    rate_limited = requests.HTTPError(response=requests.Response())
+    rate_limited.response.status_code = 429
+    rate_limited.response.headers['Retry-After'] = '7'
+    outcomes = [Auth0Error(503, 'server_error', 'Unavailable'), requests.ConnectionError('reset'), rate_limited,
+                (1, 1), Auth0Error(429, 'too_many_requests', 'Too Many Requests'), StopDaemon()]
+
+    def consume(**kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    delays = []
+    monkeypatch.setattr(command, 'consume_auth0_logs', consume)
+    monkeypatch.setattr(command.time, 'sleep', delays.append)
+
+    with pytest.raises(StopDaemon):
+        call_command('consume_auth0_logs', '--daemon', '--interval=10', stdout=StringIO(), stderr=StringIO())
+
+    # Doubling from the interval, Retry-After when the response is there, and starting over after a good poll.
+    assert delays == [10, 20, 7, 10, 10]
@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+import pytest
+import requests
+from django.utils import timezone
+
+from django_auth0_user.models import Auth0UserToken
+from django_auth0_user.pipeline import AUTH0_LEAN_PIPELINE
+from django_auth0_user.user_tokens import get_fresh_access_token
+from django_auth0_user.user_tokens import refresh_expiring_user_tokens
+from django_auth0_user.user_tokens import store_user_token
+from tests.utils.pipeline import make_id_token_payload
+from tests.utils.pipeline import run_auth0_pipeline
+
+
+class FakeTokenResponse(object):
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('{} Error'.format(self.status_code))
+
+    def json(self):
+        return self.payload
+
+
+class FakeTokenSession(object):
+    """Stands in for the pooled requests session, exchanging refresh tokens for numbered access tokens."""
+
+    def __init__(self):
+        self.exchanged = []
+
+    def post(self, url, data=None, timeout=None):
+        self.exchanged.append(data['refresh_token'])
+        if data['refresh_token'] == 'revoked':
+            return FakeTokenResponse(403, {'error': 'invalid_grant'})
+        return FakeTokenResponse(200, {
+            'access_token': 'access-{}'.format(len(self.exchanged)),
+            'refresh_token': 'rotated-{}'.format(len(self.exchanged)),
+            'expires_in': 3600,
+        })
+
+
+def make_user_token(sub, refresh_token, expires_in):
+    user = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload(sub=sub))['user']
+    token = store_user_token(user, {'access_token': 'initial', 'refresh_token': refresh_token, 'expires_in': 3600})
+    Auth0UserToken.objects.filter(pk=token.pk).update(expires_at=timezone.now() + timedelta(seconds=expires_in))
+    return user
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_store_user_token_needs_a_refresh_token():
+    user = run_auth0_pipeline(AUTH0_LEAN_PIPELINE, make_id_token_payload())['user']
+
+    assert store_user_token(user, {'access_token': 'initial', 'refresh_token': None}) is None
+    assert get_fresh_access_token(user) is None
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_refresh_expiring_user_tokens_refreshes_within_the_margin():
+    expiring = make_user_token('auth0|expiring', 'good', expires_in=60)
+    revoked = make_user_token('auth0|revoked', 'revoked', expires_in=60)
+    make_user_token('auth0|fresh', 'fresh', expires_in=3000)
+    session = FakeTokenSession()
+
+    assert refresh_expiring_user_tokens(margin=600, batch_size=1, session=session) == (1, 1)
+
+    assert sorted(session.exchanged) == ['good', 'revoked']
+    token = Auth0UserToken.objects.get(user=expiring)
+    assert token.refresh_token.startswith('rotated-') and token.failures == 0
+    assert token.expires_at > timezone.now() + timedelta(seconds=3000)
+    assert Auth0UserToken.objects.get(user=revoked).failures == 1
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_get_fresh_access_token_only_blocks_on_expired_tokens(monkeypatch, django_assert_num_queries):
+    from django_auth0_user import user_tokens
+
+    session = FakeTokenSession()
+    monkeypatch.setattr(user_tokens, 'get_token_session', lambda: session)
+    user = make_user_token('auth0|user', 'good', expires_in=60)
+    user.refresh_from_db()
+
+    with django_assert_num_queries(1):
+        assert get_fresh_access_token(user) == 'initial'
+    assert session.exchanged == []
+
+    Auth0UserToken.objects.filter(user=user).update(expires_at=timezone.now() - timedelta(seconds=1))
+    user.refresh_from_db()
+    assert get_fresh_access_token(user) == 'access-1'
+    assert Auth0UserToken.objects.get(user=user).access_token == 'access-1'
+
+
+@pytest.mark.nondestructive
+@pytest.mark.django_db
+def test_get_fresh_access_token_does_not_repeat_a_concurrent_refresh(monkeypatch):
+    from django_auth0_user import user_tokens
+
+    session = FakeTokenSession()
+    monkeypatch.setattr(user_tokens, 'get_token_session', lambda: session)
+    user = make_user_token('auth0|user', 'good', expires_in=-1)
+    user.refresh_from_db()
+    assert user.auth0_token.expires_at < timezone.now()
+
+    # Another request refreshed the token after this one read it, the rotated refresh token must not be exchanged again.
+    Auth0UserToken.objects.filter(user=user).update(
+        access_token='refreshed', refresh_token='rotated', expires_at=timezone.now() + timedelta(seconds=3600),
+    )
+
+    assert get_fresh_access_token(user) == 'refreshed'
+    assert session.exchanged == []
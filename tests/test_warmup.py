@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from django_auth0_user.util.auth0_api import TokenCache
+from django_auth0_user.warmup import is_serving_process
+from django_auth0_user.warmup import warm_up
+
+
+def failing_task():
+    raise RuntimeError('Auth0 is down')
+
+
+@pytest.mark.nondestructive
+def test_warm_up_runs_tasks_in_parallel_and_reports_errors():
+    # Each task only gets past the barrier once the other one reached it, so they cannot have run one after the other.
+    barrier = threading.Barrier(2, timeout=5)
+    results = warm_up((('first', barrier.wait), ('second', barrier.wait), ('broken', failing_task)), timeout=10)
+
+    assert results['first'][1] is None and results['second'][1] is None
+    assert str(results['broken'][1]) == 'Auth0 is down'
+
+
+@pytest.mark.nondestructive
+def test_warm_up_does_not_wait_past_the_timeout():
+    release = threading.Event()
+    try:
+        results = warm_up((('blocked', lambda: release.wait(5)), ('fast', lambda: None)), timeout=1)
+    finally:
+        release.set()
+
+    # warm_up returned while the blocked task was still waiting for the release.
+    assert set(results) == {'fast'}
+
+
+@pytest.mark.nondestructive
+@pytest.mark.parametrize('argv, serving', [
+    (['manage.py', 'migrate'], False),
+    (['/usr/bin/django-admin', 'shell'], False),
+    (['manage.py'], False),
+    (['manage.py', 'runserver', '0:8000'], True),
+    (['/usr/bin/gunicorn', 'project.wsgi'], True),
+])
+def test_only_serving_processes_warm_up_on_ready(argv, serving):
+    assert is_serving_process(argv) is serving
+
+
+@pytest.mark.nondestructive
+def test_reset_locks_releases_locks_held_by_the_parent():
+    token_cache = TokenCache()
+    key = ('client', 'https://example.auth0.com/api/v2/', None)
+    # As a forked child sees a lock a warm up thread of its parent was holding.
+    token_cache._lock(key).acquire()
+
+    token_cache.reset_locks()
+
+    assert token_cache._lock(key).acquire(blocking=False)
@@ -11,6 +11,7 @@ urlpatterns = [
     url(r'^api/v1/', include(api_v1.urls)),
     url(r'^admin/', admin.site.urls),
     url(r'^auth/', include('django.contrib.auth.urls')),
+    url(r'^auth0/', include('django_auth0_user.urls')),
     url('', include('social_django.urls', namespace='social')),
     url(r'^', include('test_app.urls')),
 ]
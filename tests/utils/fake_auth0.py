@@ -0,0 +1,916 @@
+"""
+A local stand in for an Auth0 tenant, for running the test suite and load tests offline.
+
+It serves the parts of the Authentication and Management APIs this package and its tests use over HTTPS,
+with a self signed certificate and an RS256 signing key generated when it starts:
+
+* `/authorize`, `/oauth/token`, `/userinfo` and `/.well-known/openid-configuration` and `jwks.json`.
+* `/api/v2/` users, rules, rules-configs, users-imports jobs and logs.
+
+Point the app at it with `AUTH0_DOMAIN = server.domain`, and make `requests` trust it with
+`REQUESTS_CA_BUNDLE = server.ca_bundle`. Any client id and secret are accepted unless `clients` is given.
+Every request can be slowed down by `latency` seconds, and the authentication and management endpoints
+answer 429 like Auth0 does once their `*_rate_limit` requests per second are used up.
+
+Run it on its own for load tests or a whole test run with: python -m tests.utils.fake_auth0 --help
+It prints every variable the test settings read, but only the tests that use the `fake_auth0` fixture are
+written against it. The existing fixtures and tests still expect a real tenant, the selenium tests fill in
+Auth0's hosted login page which `/authorize` skips, so they are not expected to pass against it.
+"""
+import argparse
+import base64
+import email.parser
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+
+import rsa
+from jose import jwk
+from jose import jwt
+from jose.exceptions import JWTError
+from jose.utils import calculate_at_hash
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CONNECTION = 'Username-Password-Authentication'
+MANAGEMENT_API_SCOPES = 'read:users update:users delete:users create:users read:rules create:rules update:rules ' \
+                        'delete:rules read:rules_configs update:rules_configs delete:rules_configs read:logs ' \
+                        'read:clients'
+TOKEN_LIFETIME = 86400
+# Matches the terms of the subset of the Lucene query syntax supported by the users search.
+QUERY_TERM = re.compile(r'(?P<field>[\w.]+):(?P<value>"[^"]*"|\([^)]*\)|\S+)')
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _random_id(prefix='', length=24):
+    return prefix + uuid.uuid4().hex[:length]
+
+
+def _select_fields(entity, fields, include_fields):
+    if not fields:
+        return entity
+    fields = set(fields.split(','))
+    return {_key: _value for _key, _value in entity.items() if (_key in fields) == include_fields}
+
+
+def _lookup(entity, path):
+    for _part in path.split('.'):
+        if not isinstance(entity, dict):
+            return None
+        entity = entity.get(_part)
+    return entity
+
+
+def _term_matches(entity, field, value):
+    if value.startswith('('):
+        values = [_value.strip() for _value in value[1:-1].split(' OR ')]
+    else:
+        values = [value]
+    actual = _lookup(entity, field)
+    actual = '' if actual is None else str(actual).lower()
+    for _value in values:
+        _value = _value.strip('"').lower()
+        if _value.endswith('*') and actual.startswith(_value[:-1]) or actual == _value:
+            return True
+    return False
+
+
+def query_matches(entity, query):
+    """
+    Match a user against the subset of Lucene Auth0 users searches use most: `field:value`, `field:"value"`,
+    `field:("a" OR "b")`, dotted metadata fields and trailing * wildcards. Terms are ANDed, unless they are
+    joined with OR.
+    """
+    terms = [(_match.group('field'), _match.group('value')) for _match in QUERY_TERM.finditer(query)]
+    combine = any if ' OR ' in QUERY_TERM.sub('', query) else all
+    return combine(_term_matches(entity, _field, _value) for _field, _value in terms)
+
+
+class TokenBucket(object):
+    """
+    A non blocking token bucket, `rate` requests per second with bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        :return: A tuple of (allowed, remaining requests, seconds until the next request is allowed).
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True, int(self.tokens), 0
+            return False, 0, (1 - self.tokens) / self.rate
+
+
+class FakeAuth0Tenant(object):
+    """
+    The users, rules, rules configs, jobs, logs and issued codes and tokens of the fake tenant.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.users = {}
+            self.rules = {}
+            self.rules_configs = {}
+            self.jobs = {}
+            self.logs = []
+            self.codes = {}
+            self.refresh_tokens = {}
+
+    def add_log(self, log_type, description='', user_id=None, client_id=None, **details):
+        with self.lock:
+            log_id = '{:056d}'.format(len(self.logs) + 1)
+            log_event = {
+                '_id': log_id, 'log_id': log_id, 'date': _now_iso(), 'type': log_type, 'description': description,
+                'client_id': client_id, 'ip': '127.0.0.1', 'details': details,
+            }
+            if user_id:
+                log_event['user_id'] = user_id
+            self.logs.append(log_event)
+            return log_event
+
+    def find_user(self, email=None, connection=None):
+        for _user in self.users.values():
+            identity = _user['identities'][0]
+            if _user.get('email') == email and (connection is None or identity['connection'] == connection):
+                return _user
+        return None
+
+    def create_user(self, body):
+        """
+        Create a user from a Management API users create body.
+
+        :raises ValueError: When a user with the email already exists in the connection.
+        """
+        connection = body.get('connection', DEFAULT_CONNECTION)
+        email = body.get('email')
+        with self.lock:
+            if email and self.find_user(email, connection):
+                raise ValueError('The user already exists.')
+            provider_id = body.get('user_id') or _random_id()
+            now = _now_iso()
+            user = {
+                'user_id': 'auth0|{}'.format(provider_id),
+                'email': email,
+                'email_verified': bool(body.get('email_verified', False)),
+                'name': body.get('name') or email,
+                'nickname': body.get('nickname') or (email or provider_id).split('@')[0],
+                'picture': body.get('picture') or 'https://s.gravatar.com/avatar/{}.png'.format(
+                    hashlib.md5((email or '').encode('utf-8')).hexdigest()
+                ),
+                'identities': [
+                    {'connection': connection, 'provider': 'auth0', 'user_id': provider_id, 'isSocial': False}
+                ],
+                'app_metadata': body.get('app_metadata') or {},
+                'user_metadata': body.get('user_metadata') or {},
+                'blocked': bool(body.get('blocked', False)),
+                'created_at': now,
+                'updated_at': now,
+                'logins_count': 0,
+            }
+            for _key in ('given_name', 'family_name', 'username', 'phone_number'):
+                if body.get(_key):
+                    user[_key] = body[_key]
+            self.users[user['user_id']] = user
+            return user
+
+    def update_user(self, user_id, body):
+        """
+        Apply a Management API users update body, the metadata is merged a top level key at a time.
+        """
+        with self.lock:
+            user = self.users[user_id]
+            for _key, _value in body.items():
+                if _key in ('app_metadata', 'user_metadata'):
+                    metadata = dict(user.get(_key) or {})
+                    metadata.update(_value or {})
+                    user[_key] = {_k: _v for _k, _v in metadata.items() if _v is not None}
+                elif _key not in ('connection', 'password', 'user_id', 'identities'):
+                    user[_key] = _value
+            user['updated_at'] = _now_iso()
+            return user
+
+    def seed_users(self, count, domain='example.com'):
+        return [
+            self.create_user({'email': 'user{}@{}'.format(_number, domain), 'email_verified': True})
+            for _number in range(len(self.users), len(self.users) + count)
+        ]
+
+
+class FakeAuth0Error(Exception):
+    def __init__(self, status, body, headers=None):
+        super(FakeAuth0Error, self).__init__(status, body)
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+def management_error(status, error, message, error_code=None):
+    body = {'statusCode': status, 'error': error, 'message': message}
+    if error_code:
+        body['errorCode'] = error_code
+    return FakeAuth0Error(status, body)
+
+
+def authentication_error(status, error, description):
+    return FakeAuth0Error(status, {'error': error, 'error_description': description})
+
+
+USER_NOT_FOUND = ('Not Found', 'The user does not exist.', 'inexistent_user')
+
+
+class FakeAuth0RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeAuth0'
+
+    # (method, path pattern, handler name, rate limited by)
+    routes = [
+        ('GET', r'/\.well-known/openid-configuration', 'openid_configuration', None),
+        ('GET', r'/\.well-known/jwks\.json', 'jwks', None),
+        ('GET', r'/authorize', 'authorize', 'authentication'),
+        ('POST', r'/oauth/token', 'token', 'authentication'),
+        ('GET', r'/userinfo', 'userinfo', 'authentication'),
+        ('GET', r'/api/v2/users', 'list_users', 'management'),
+        ('POST', r'/api/v2/users', 'create_user', 'management'),
+        ('GET', r'/api/v2/users/(?P<user_id>[^/]+)', 'get_user', 'management'),
+        ('PATCH', r'/api/v2/users/(?P<user_id>[^/]+)', 'update_user', 'management'),
+        ('DELETE', r'/api/v2/users/(?P<user_id>[^/]+)', 'delete_user', 'management'),
+        ('GET', r'/api/v2/rules', 'list_rules', 'management'),
+        ('POST', r'/api/v2/rules', 'create_rule', 'management'),
+        ('GET', r'/api/v2/rules/(?P<rule_id>[^/]+)', 'get_rule', 'management'),
+        ('PATCH', r'/api/v2/rules/(?P<rule_id>[^/]+)', 'update_rule', 'management'),
+        ('DELETE', r'/api/v2/rules/(?P<rule_id>[^/]+)', 'delete_rule', 'management'),
+        ('GET', r'/api/v2/rules-configs', 'list_rules_configs', 'management'),
+        ('PUT', r'/api/v2/rules-configs/(?P<key>[^/]+)', 'set_rules_config', 'management'),
+        ('DELETE', r'/api/v2/rules-configs/(?P<key>[^/]+)', 'delete_rules_config', 'management'),
+        ('POST', r'/api/v2/jobs/users-imports', 'import_users', 'management'),
+        ('GET', r'/api/v2/jobs/(?P<job_id>[^/]+)', 'get_job', 'management'),
+        ('GET', r'/api/v2/jobs/(?P<job_id>[^/]+)/errors', 'get_job_errors', 'management'),
+        ('GET', r'/api/v2/logs', 'list_logs', 'management'),
+    ]
+    compiled_routes = [(_method, re.compile(_path + '$'), _name, _limit) for _method, _path, _name, _limit in routes]
+
+    @property
+    def tenant(self):
+        return self.server.auth0.tenant
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s', self.address_string(), format % args)
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def do_PATCH(self):
+        self.dispatch()
+
+    def do_PUT(self):
+        self.dispatch()
+
+    def do_DELETE(self):
+        self.dispatch()
+
+    def dispatch(self):
+        url = urlparse(self.path)
+        self.query = {_key: _values[-1] for _key, _values in parse_qs(url.query).items()}
+        self.body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.auth0.requests.append((self.command, url.path))
+        if self.server.auth0.latency:
+            time.sleep(self.server.auth0.latency)
+        try:
+            for method, pattern, name, limited_by in self.compiled_routes:
+                match = pattern.match(url.path)
+                if match and method == self.command:
+                    self.check_rate_limit(limited_by)
+                    if limited_by == 'management':
+                        self.check_management_token()
+                    kwargs = {_key: unquote(_value) for _key, _value in match.groupdict().items()}
+                    return getattr(self, name)(**kwargs)
+            raise management_error(404, 'Not Found', 'Not Found')
+        except FakeAuth0Error as err:
+            self.send_json(err.body, err.status, err.headers)
+
+    def check_rate_limit(self, limited_by):
+        bucket = self.server.auth0.rate_limits.get(limited_by)
+        if bucket is None:
+            return
+        allowed, remaining, retry_after = bucket.try_acquire()
+        headers = {
+            'X-RateLimit-Limit': str(int(bucket.burst)),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(int(time.time() + retry_after) + 1),
+        }
+        if not allowed:
+            self.server.auth0.rate_limited += 1
+            if limited_by == 'management':
+                error = management_error(429, 'Too Many Requests', 'Global limit has been reached',
+                                         'too_many_requests')
+            else:
+                error = authentication_error(429, 'too_many_requests', 'Global limit has been reached')
+            error.headers = headers
+            raise error
+
+    def check_management_token(self):
+        claims = self.bearer_token_claims()
+        if claims is None or claims.get('aud') != self.server.auth0.management_audience:
+            raise management_error(401, 'Unauthorized', 'Invalid token')
+
+    def bearer_token_claims(self):
+        scheme, _, token = (self.headers.get('Authorization') or '').partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            return None
+        return self.server.auth0.verify_token(token)
+
+    def send_json(self, data, status=200, headers=None):
+        body = b'' if data is None else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        if data is not None:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for _key, _value in (headers or {}).items():
+            self.send_header(_key, _value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def json_body(self):
+        try:
+            return json.loads(self.body.decode('utf-8') or '{}')
+        except ValueError:
+            raise management_error(400, 'Bad Request', 'Invalid request payload JSON format', 'invalid_body')
+
+    def form_body(self):
+        content_type = self.headers.get('Content-Type') or ''
+        if content_type.startswith('application/json'):
+            return self.json_body()
+        return {_key: _values[-1] for _key, _values in parse_qs(self.body.decode('utf-8')).items()}
+
+    def multipart_body(self):
+        message = email.parser.BytesParser().parsebytes(
+            'Content-Type: {}\r\n\r\n'.format(self.headers.get('Content-Type')).encode('utf-8') + self.body
+        )
+        return {_part.get_param('name', header='content-disposition'): _part.get_payload(decode=True)
+                for _part in message.get_payload()}
+
+    def log_management_request(self, user_id=None):
+        self.tenant.add_log('sapi', 'API Operation', user_id=user_id, request={
+            'method': self.command.lower(), 'path': urlparse(self.path).path, 'query': self.query,
+        })
+
+    # Authentication API.
+
+    def openid_configuration(self):
+        issuer = self.server.auth0.issuer
+        self.send_json({
+            'issuer': issuer,
+            'authorization_endpoint': issuer + 'authorize',
+            'token_endpoint': issuer + 'oauth/token',
+            'userinfo_endpoint': issuer + 'userinfo',
+            'jwks_uri': issuer + '.well-known/jwks.json',
+            'scopes_supported': ['openid', 'profile', 'offline_access', 'name', 'given_name', 'family_name',
+                                 'nickname', 'email', 'email_verified', 'picture', 'created_at', 'identities'],
+            'response_types_supported': ['code'],
+            'subject_types_supported': ['public'],
+            'id_token_signing_alg_values_supported': ['HS256', 'RS256'],
+            'token_endpoint_auth_methods_supported': ['client_secret_basic', 'client_secret_post'],
+            'claims_supported': ['aud', 'auth_time', 'created_at', 'email', 'email_verified', 'exp', 'family_name',
+                                 'given_name', 'iat', 'identities', 'iss', 'name', 'nickname', 'picture', 'sub'],
+        })
+
+    def jwks(self):
+        self.send_json({'keys': [self.server.auth0.public_jwk]})
+
+    def authorize(self):
+        """
+        Log in straight away, as the user named by `login_hint` or the first user, and redirect back with a code.
+        """
+        client_id = self.query.get('client_id')
+        redirect_uri = self.query.get('redirect_uri')
+        if not client_id or not redirect_uri:
+            raise authentication_error(400, 'invalid_request', 'Missing required parameter: client_id, redirect_uri')
+        callback = {'state': self.query['state']} if 'state' in self.query else {}
+        with self.tenant.lock:
+            login_hint = self.query.get('login_hint')
+            if login_hint:
+                user = self.tenant.users.get(login_hint) or self.tenant.find_user(login_hint)
+            else:
+                user = next(iter(self.tenant.users.values()), None)
+            if user is None and login_hint and '@' in login_hint:
+                user = self.tenant.create_user({'email': login_hint, 'email_verified': True})
+                self.tenant.add_log('ss', 'Successful signup', user_id=user['user_id'], client_id=client_id)
+        if user is None or user['blocked']:
+            callback.update(error='access_denied', error_description='No user to log in as.')
+        else:
+            code = _random_id(length=32)
+            self.tenant.codes[code] = {
+                'user_id': user['user_id'], 'client_id': client_id, 'redirect_uri': redirect_uri,
+                'nonce': self.query.get('nonce'), 'scope': self.query.get('scope', 'openid'),
+                'audience': self.query.get('audience'),
+            }
+            callback['code'] = code
+        separator = '&' if '?' in redirect_uri else '?'
+        self.redirect('{}{}{}'.format(redirect_uri, separator, urlencode(callback)))
+
+    def client_credentials(self, data):
+        client_id, client_secret = data.get('client_id'), data.get('client_secret')
+        scheme, _, credentials = (self.headers.get('Authorization') or '').partition(' ')
+        if scheme.lower() == 'basic':
+            client_id, _, client_secret = base64.b64decode(credentials).decode('utf-8').partition(':')
+        if not client_id or not self.server.auth0.client_is_valid(client_id, client_secret):
+            raise authentication_error(401, 'access_denied', 'Unauthorized')
+        return client_id
+
+    def token(self):
+        data = self.form_body()
+        client_id = self.client_credentials(data)
+        grant_type = data.get('grant_type')
+        auth0 = self.server.auth0
+        if grant_type == 'client_credentials':
+            audience = data.get('audience')
+            if not audience:
+                raise authentication_error(400, 'access_denied', 'No audience parameter was provided')
+            scope = data.get('scope') or (MANAGEMENT_API_SCOPES if audience == auth0.management_audience else '')
+            access_token = auth0.issue_token({
+                'sub': '{}@clients'.format(client_id), 'aud': audience, 'azp': client_id, 'scope': scope,
+                'gty': 'client-credentials',
+            })
+            self.tenant.add_log('seccft', 'Client Credentials for Access Token', client_id=client_id)
+            return self.send_json({'access_token': access_token, 'scope': scope, 'expires_in': TOKEN_LIFETIME,
+                                   'token_type': 'Bearer'})
+
+        if grant_type == 'authorization_code':
+            grant = self.tenant.codes.pop(data.get('code'), None)
+            if grant is None or grant['client_id'] != client_id:
+                raise authentication_error(403, 'invalid_grant', 'Invalid authorization code')
+        elif grant_type == 'refresh_token':
+            grant = self.tenant.refresh_tokens.get(data.get('refresh_token'))
+            if grant is None or grant['client_id'] != client_id:
+                raise authentication_error(403, 'invalid_grant', 'Unknown or invalid refresh token.')
+        elif grant_type == 'password':
+            user = self.tenant.users.get(data.get('username')) or self.tenant.find_user(data.get('username'))
+            if user is None:
+                raise authentication_error(403, 'invalid_grant', 'Wrong email or password.')
+            grant = {'user_id': user['user_id'], 'client_id': client_id, 'nonce': None,
+                     'scope': data.get('scope', 'openid'), 'audience': data.get('audience')}
+        else:
+            raise authentication_error(403, 'unsupported_grant_type', 'Unsupported grant type: {}'.format(grant_type))
+
+        user = self.tenant.users.get(grant['user_id'])
+        if user is None or user['blocked']:
+            raise authentication_error(403, 'invalid_grant', 'The user is blocked or no longer exists.')
+        self.send_json(self.user_tokens(user, grant))
+
+    def user_tokens(self, user, grant):
+        auth0 = self.server.auth0
+        scopes = grant['scope'].split()
+        audience = grant['audience'] or auth0.issuer + 'userinfo'
+        access_token = auth0.issue_token({
+            'sub': user['user_id'], 'aud': [audience, auth0.issuer + 'userinfo'], 'azp': grant['client_id'],
+            'scope': grant['scope'], 'permissions': user['app_metadata'].get('permissions', []),
+        })
+        response = {
+            'access_token': access_token,
+            'expires_in': TOKEN_LIFETIME,
+            'token_type': 'Bearer',
+            'scope': grant['scope'],
+        }
+        if 'openid' in scopes:
+            claims = dict(auth0.user_claims(user), aud=grant['client_id'], auth_time=int(time.time()),
+                          at_hash=calculate_at_hash(access_token, hashlib.sha256))
+            if grant.get('nonce'):
+                claims['nonce'] = grant['nonce']
+            response['id_token'] = auth0.issue_token(claims)
+        if 'offline_access' in scopes:
+            refresh_token = _random_id(length=32)
+            self.tenant.refresh_tokens[refresh_token] = dict(grant, nonce=None)
+            response['refresh_token'] = refresh_token
+        self.tenant.add_log('s', 'Success Login', user_id=user['user_id'], client_id=grant['client_id'])
+        return response
+
+    def userinfo(self):
+        claims = self.bearer_token_claims()
+        user = self.tenant.users.get((claims or {}).get('sub'))
+        if user is None:
+            raise authentication_error(401, 'invalid_token', 'Invalid or expired access token.')
+        self.send_json(self.server.auth0.user_claims(user))
+
+    # Management API users.
+
+    def list_users(self):
+        with self.tenant.lock:
+            users = list(self.tenant.users.values())
+        if self.query.get('q'):
+            users = [_user for _user in users if query_matches(_user, self.query['q'])]
+        if self.query.get('connection'):
+            users = [_user for _user in users if _user['identities'][0]['connection'] == self.query['connection']]
+        if self.query.get('sort'):
+            field, _, order = self.query['sort'].partition(':')
+            users.sort(key=lambda _user: str(_lookup(_user, field) or ''), reverse=order == '-1')
+        self.send_page('users', users)
+
+    def send_page(self, name, entities):
+        page = int(self.query.get('page', 0))
+        per_page = min(int(self.query.get('per_page', 50)), 100)
+        start = page * per_page
+        selected = [
+            _select_fields(_entity, self.query.get('fields'), self.query.get('include_fields', 'true') == 'true')
+            for _entity in entities[start:start + per_page]
+        ]
+        if self.query.get('include_totals') == 'true':
+            return self.send_json({'start': start, 'limit': per_page, 'length': len(selected),
+                                   'total': len(entities), name: selected})
+        self.send_json(selected)
+
+    def create_user(self):
+        body = self.json_body()
+        if 'connection' not in body:
+            raise management_error(400, 'Bad Request', 'Payload validation error: \'Missing required property: '
+                                   'connection\'.', 'invalid_body')
+        try:
+            user = self.tenant.create_user(body)
+        except ValueError as err:
+            raise management_error(409, 'Conflict', str(err), 'auth0_idp_error')
+        self.log_management_request(user['user_id'])
+        self.send_json(user, 201)
+
+    def get_user(self, user_id):
+        user = self.tenant.users.get(user_id)
+        if user is None:
+            raise management_error(404, *USER_NOT_FOUND)
+        self.send_json(_select_fields(user, self.query.get('fields'),
+                                      self.query.get('include_fields', 'true') == 'true'))
+
+    def update_user(self, user_id):
+        body = self.json_body()
+        with self.tenant.lock:
+            if user_id not in self.tenant.users:
+                raise management_error(404, *USER_NOT_FOUND)
+            user = self.tenant.update_user(user_id, body)
+        self.log_management_request(user_id)
+        self.send_json(user)
+
+    def delete_user(self, user_id):
+        if self.tenant.users.pop(user_id, None) is not None:
+            self.log_management_request(user_id)
+            self.tenant.add_log('sdu', 'Successful user deletion', user_id=user_id)
+        self.send_json(None, 204)
+
+    # Management API rules and rules configs.
+
+    def list_rules(self):
+        rules = sorted(self.tenant.rules.values(), key=lambda _rule: _rule['order'])
+        if 'enabled' in self.query:
+            rules = [_rule for _rule in rules if _rule['enabled'] == (self.query['enabled'] == 'true')]
+        if 'stage' in self.query:
+            rules = [_rule for _rule in rules if _rule['stage'] == self.query['stage']]
+        self.send_json([_select_fields(_rule, self.query.get('fields'),
+                                       self.query.get('include_fields', 'true') == 'true') for _rule in rules])
+
+    def create_rule(self):
+        body = self.json_body()
+        with self.tenant.lock:
+            if any(_rule['name'] == body.get('name') for _rule in self.tenant.rules.values()):
+                raise management_error(409, 'Conflict', 'A rule with the same name already exists', 'conflict')
+            rule = {
+                'id': _random_id('rul_', 16), 'name': body.get('name'), 'script': body.get('script', ''),
+                'order': body.get('order', len(self.tenant.rules) + 1), 'enabled': body.get('enabled', True),
+                'stage': body.get('stage', 'login_success'),
+            }
+            self.tenant.rules[rule['id']] = rule
+        self.log_management_request()
+        self.send_json(rule, 201)
+
+    def get_rule(self, rule_id):
+        if rule_id not in self.tenant.rules:
+            raise management_error(404, 'Not Found', 'The rule does not exist.', 'inexistent_rule')
+        self.send_json(self.tenant.rules[rule_id])
+
+    def update_rule(self, rule_id):
+        body = self.json_body()
+        if rule_id not in self.tenant.rules:
+            raise management_error(404, 'Not Found', 'The rule does not exist.', 'inexistent_rule')
+        self.tenant.rules[rule_id].update({_key: _value for _key, _value in body.items() if _key != 'id'})
+        self.log_management_request()
+        self.send_json(self.tenant.rules[rule_id])
+
+    def delete_rule(self, rule_id):
+        self.tenant.rules.pop(rule_id, None)
+        self.log_management_request()
+        self.send_json(None, 204)
+
+    def list_rules_configs(self):
+        self.send_json([{'key': _key} for _key in sorted(self.tenant.rules_configs)])
+
+    def set_rules_config(self, key):
+        value = self.json_body().get('value')
+        self.tenant.rules_configs[key] = value
+        self.log_management_request()
+        self.send_json({'key': key, 'value': value})
+
+    def delete_rules_config(self, key):
+        self.tenant.rules_configs.pop(key, None)
+        self.log_management_request()
+        self.send_json(None, 204)
+
+    # Management API jobs.
+
+    def import_users(self):
+        """
+        Run a users-imports job straight away, it reports 'pending' until it is first fetched.
+        """
+        fields = self.multipart_body()
+        upsert = fields.get('upsert', b'false').decode('utf-8') == 'true'
+        connection = fields.get('connection_id', b'').decode('utf-8') or DEFAULT_CONNECTION
+        summary = {'total': 0, 'inserted': 0, 'updated': 0, 'failed': 0}
+        errors = []
+        for record in json.loads((fields.get('users') or b'[]').decode('utf-8')):
+            summary['total'] += 1
+            with self.tenant.lock:
+                existing = self.tenant.find_user(record.get('email'), connection)
+                if existing is None:
+                    self.tenant.create_user(dict(record, connection=connection))
+                    summary['inserted'] += 1
+                elif upsert:
+                    self.tenant.update_user(existing['user_id'], record)
+                    summary['updated'] += 1
+                else:
+                    summary['failed'] += 1
+                    errors.append({'user': record, 'errors': [
+                        {'code': 'DUPLICATED_USER', 'message': 'The user already exist and upsert parameter is false'}
+                    ]})
+        job = {
+            'id': _random_id('job_', 16), 'type': 'users_import', 'status': 'pending', 'connection_id': connection,
+            'created_at': _now_iso(), 'upsert': upsert,
+        }
+        self.tenant.jobs[job['id']] = dict(job, summary=summary, errors=errors)
+        self.log_management_request()
+        self.send_json(job, 201)
+
+    def get_job(self, job_id):
+        job = self.tenant.jobs.get(job_id)
+        if job is None:
+            raise management_error(404, 'Not Found', 'The job does not exist.', 'inexistent_job')
+        response = {_key: _value for _key, _value in job.items() if _key != 'errors'}
+        job['status'] = 'completed'
+        self.send_json(response)
+
+    def get_job_errors(self, job_id):
+        job = self.tenant.jobs.get(job_id)
+        if job is None:
+            raise management_error(404, 'Not Found', 'The job does not exist.', 'inexistent_job')
+        self.send_json(job['errors'])
+
+    # Management API logs.
+
+    def list_logs(self):
+        with self.tenant.lock:
+            logs = list(self.tenant.logs)
+        if self.query.get('q'):
+            logs = [_log for _log in logs if query_matches(_log, self.query['q'])]
+        if 'from' in self.query:
+            ids = [_log['log_id'] for _log in logs]
+            start = ids.index(self.query['from']) + 1 if self.query['from'] in ids else 0
+            return self.send_json(logs[start:start + min(int(self.query.get('take', 50)), 100)])
+        if self.query.get('sort', 'date:-1').endswith(':-1'):
+            logs.reverse()
+        self.send_page('logs', logs)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeAuth0Server(object):
+    """
+    A fake Auth0 tenant served over HTTPS on `domain`, see the module docstring.
+
+    :param str host: The host name to serve on, it must match the certificate when `certfile` is given.
+    :param int port: The port to listen on, any free port when 0.
+    :param float latency: Seconds every request is delayed by.
+    :param float management_rate_limit: Management API requests per second, unlimited when not given.
+    :param float authentication_rate_limit: Authentication API requests per second, unlimited when not given.
+    :param dict clients: The accepted {client_id: client_secret}, any client is accepted when not given.
+    :param str certfile: A PEM certificate to serve with, a self signed one is generated with openssl when not given.
+    :param str keyfile: The certificate's PEM private key.
+    """
+
+    def __init__(self, host='localhost', port=0, latency=0, management_rate_limit=None,
+                 authentication_rate_limit=None, clients=None, claims_namespace=None, certfile=None, keyfile=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.clients = clients
+        self.claims_namespace = claims_namespace
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.rate_limits = {}
+        self.set_rate_limits(management_rate_limit, authentication_rate_limit)
+        self.tenant = FakeAuth0Tenant()
+        self.requests = []
+        self.rate_limited = 0
+        self._httpd = None
+        self._thread = None
+        self._workdir = None
+        self.key_id = _random_id(length=16)
+        public_key, self._private_key = rsa.newkeys(2048)
+        self._private_pem = self._private_key.save_pkcs1().decode('ascii')
+        self.public_jwk = dict(
+            jwk.construct(public_key.save_pkcs1().decode('ascii'), 'RS256').to_dict(), kid=self.key_id, use='sig'
+        )
+
+    def set_rate_limits(self, management=None, authentication=None):
+        self.rate_limits = {}
+        if management:
+            self.rate_limits['management'] = TokenBucket(management)
+        if authentication:
+            self.rate_limits['authentication'] = TokenBucket(authentication)
+
+    @property
+    def domain(self):
+        return '{}:{}'.format(self.host, self.port)
+
+    @property
+    def issuer(self):
+        return 'https://{}/'.format(self.domain)
+
+    @property
+    def management_audience(self):
+        return self.issuer + 'api/v2/'
+
+    @property
+    def ca_bundle(self):
+        return self.certfile
+
+    def client_is_valid(self, client_id, client_secret):
+        return self.clients is None or self.clients.get(client_id) == client_secret
+
+    def issue_token(self, claims, expires_in=TOKEN_LIFETIME):
+        now = int(time.time())
+        claims = dict({'iss': self.issuer, 'iat': now, 'exp': now + expires_in}, **claims)
+        return jwt.encode(claims, self._private_pem, algorithm='RS256', headers={'kid': self.key_id})
+
+    def verify_token(self, token):
+        try:
+            return jwt.decode(token, self.public_jwk, algorithms=['RS256'], issuer=self.issuer,
+                              options={'verify_aud': False})
+        except JWTError:
+            return None
+
+    def user_claims(self, user):
+        claims = {
+            'sub': user['user_id'],
+            'name': user.get('name'),
+            'nickname': user.get('nickname'),
+            'picture': user.get('picture'),
+            'email': user.get('email'),
+            'email_verified': user.get('email_verified', False),
+            'updated_at': user.get('updated_at'),
+        }
+        for _key in ('given_name', 'family_name'):
+            if user.get(_key):
+                claims[_key] = user[_key]
+        if self.claims_namespace:
+            claims[self.claims_namespace + '/app_metadata'] = user.get('app_metadata') or {}
+            claims[self.claims_namespace + '/user_metadata'] = user.get('user_metadata') or {}
+        return claims
+
+    def reset(self):
+        """
+        Forget all users, rules, jobs, logs and recorded requests, the keys and certificate are kept.
+        """
+        self.tenant.reset()
+        self.requests = []
+        self.rate_limited = 0
+
+    def _generate_certificate(self):
+        if shutil.which('openssl') is None:
+            raise RuntimeError('openssl is needed to generate a certificate for the fake Auth0 server.')
+        self._workdir = tempfile.mkdtemp(prefix='fake-auth0-')
+        self.certfile = os.path.join(self._workdir, 'cert.pem')
+        self.keyfile = os.path.join(self._workdir, 'key.pem')
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '7', '-subj', '/CN={}'.format(self.host),
+            '-addext', 'subjectAltName=DNS:{},DNS:localhost,IP:127.0.0.1'.format(self.host),
+            '-keyout', self.keyfile, '-out', self.certfile,
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    def start(self):
+        if self.certfile is None:
+            self._generate_certificate()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), FakeAuth0RequestHandler)
+        self._httpd.auth0 = self
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.certfile, self.keyfile)
+        self._httpd.socket = context.wrap_socket(self._httpd.socket, server_side=True)
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-auth0', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._workdir is not None:
+            shutil.rmtree(self._workdir, ignore_errors=True)
+            self._workdir = self.certfile = self.keyfile = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a fake Auth0 tenant over HTTPS.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--latency', type=float, default=0, help='Seconds every request is delayed by.')
+    parser.add_argument('--management-rate-limit', type=float, help='Management API requests per second.')
+    parser.add_argument('--authentication-rate-limit', type=float, help='Authentication API requests per second.')
+    parser.add_argument('--claims-namespace', help='Add the metadata to the tokens under this namespace.')
+    parser.add_argument('--users', type=int, default=0, help='Number of users to create up front.')
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    options = parser.parse_args(argv)
+
+    management_client = (_random_id(length=32), _random_id(length=32))
+    web_site_client = (_random_id(length=32), _random_id(length=32))
+    javascript_client_id = _random_id(length=32)
+    server = FakeAuth0Server(
+        host=options.host, port=options.port, latency=options.latency,
+        management_rate_limit=options.management_rate_limit,
+        authentication_rate_limit=options.authentication_rate_limit, claims_namespace=options.claims_namespace,
+        clients=dict([management_client, web_site_client]), certfile=options.certfile, keyfile=options.keyfile,
+    )
+    server.tenant.seed_users(options.users)
+    with server:
+        environment = [
+            ('AUTH0_USER_DOMAIN', server.domain),
+            ('AUTH0_MANAGEMENT_API_CLIENT_ID', management_client[0]),
+            ('AUTH0_MANAGEMENT_API_CLIENT_SECRET', management_client[1]),
+            ('AUTH0_WEB_SITE_CLIENT_ID', web_site_client[0]),
+            ('AUTH0_WEB_SITE_CLIENT_SECRET', web_site_client[1]),
+            ('AUTH0_JAVASCRIPT_TEST_CLIENT_CLIENT_ID', javascript_client_id),
+            ('AUTH0_JAVASCRIPT_TEST_CLIENT_API_AUDIENCE', server.issuer + 'api/tests/'),
+            ('REQUESTS_CA_BUNDLE', server.ca_bundle),
+            ('AUTH0_TEST_PROPAGATION_DELAY', '0'),
+        ]
+        print('Serving a fake Auth0 tenant on https://{}/, run the tests against it with:'.format(server.domain))
+        print('export ' + ' '.join('{}={}'.format(name, value) for name, value in environment))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
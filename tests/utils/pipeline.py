@@ -0,0 +1,42 @@
+import time
+
+from social_django.utils import load_backend
+from social_django.utils import load_strategy
+
+
+def make_id_token_payload(sub='auth0|5a1b2c3d4e5f', **claims):
+    """Build an already validated id_token payload, the way Auth0OpenId.id_token holds it."""
+    now = int(time.time())
+    payload = {
+        'sub': sub,
+        'iss': 'https://example.auth0.com/',
+        'aud': 'client-id',
+        'iat': now,
+        'exp': now + 36000,
+        'nonce': str(now),
+        'email': 'user@example.com',
+        'name': 'user@example.com',
+        'nickname': 'user',
+    }
+    payload.update(claims)
+    return payload
+
+
+def make_token_response(id_token_payload):
+    """Build the provider response that the pipeline is run with after the token exchange and userinfo calls."""
+    return {
+        'access_token': 'access-token-{}'.format(time.time()),
+        'id_token': 'header.payload.signature',
+        'refresh_token': None,
+        'token_type': 'Bearer',
+        'expires_in': 86400,
+        **id_token_payload,
+    }
+
+
+def run_auth0_pipeline(pipeline, id_token_payload, request=None):
+    """Run a social auth pipeline for the auth0 backend, returning the pipeline output."""
+    strategy = load_strategy(request=request)
+    backend = load_backend(strategy, 'auth0', redirect_uri=None)
+    backend.id_token = id_token_payload
+    return backend.run_pipeline(pipeline, response=make_token_response(id_token_payload))